@@ -0,0 +1,102 @@
+"""
+WebSocket роуты для консолей ВМ
+"""
+
+try:
+    from fastapi import APIRouter, WebSocket
+    FASTAPI_AVAILABLE = True
+except ImportError:
+    FASTAPI_AVAILABLE = False
+
+import asyncio
+
+from app.services.console_service import vnc_proxy, ConsoleError
+from app.services.serial_service import serial_hub
+
+
+if FASTAPI_AVAILABLE:
+    router = APIRouter()
+
+    @router.websocket("/ws/vms/{vm_name}/vnc")
+    async def vnc_websocket(websocket: WebSocket, vm_name: str):
+        """WebSocket↔TCP прокси к VNC консоли ВМ для noVNC"""
+        subprotocols = websocket.scope.get("subprotocols") or []
+        await websocket.accept(subprotocol="binary" if "binary" in subprotocols else None)
+
+        async def receive():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return None
+            return message.get("bytes") or (message.get("text") or "").encode()
+
+        client = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else None
+        try:
+            await vnc_proxy.relay(vm_name, receive, websocket.send_bytes, client=client)
+        except ConsoleError as e:
+            await websocket.close(code=1011, reason=str(e))
+            return
+        except OSError as e:
+            await websocket.close(code=1011, reason=f"Ошибка подключения к VNC: {e}")
+            return
+
+        try:
+            await websocket.close()
+        except RuntimeError:
+            # Клиент уже закрыл соединение
+            pass
+
+    @router.websocket("/ws/vms/{vm_name}/serial")
+    async def serial_websocket(websocket: WebSocket, vm_name: str):
+        """Serial консоль ВМ через libvirt stream со scrollback"""
+        await websocket.accept()
+
+        loop = asyncio.get_running_loop()
+        client = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else None
+        try:
+            subscription = await loop.run_in_executor(None, serial_hub.subscribe, vm_name, loop, client)
+        except ConsoleError as e:
+            await websocket.close(code=1011, reason=str(e))
+            return
+
+        async def pump_output():
+            if subscription.backlog:
+                subscription.session.bytes_to_client += len(subscription.backlog)
+                await websocket.send_bytes(subscription.backlog)
+            while True:
+                data = await subscription.queue.get()
+                if data is None:
+                    return  # Поток консоли закрыт (ВМ выключена)
+                subscription.session.bytes_to_client += len(data)
+                await websocket.send_bytes(data)
+
+        async def pump_input():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                data = message.get("bytes") or (message.get("text") or "").encode()
+                if data:
+                    serial_hub.write(subscription, data)
+
+        output = asyncio.ensure_future(pump_output())
+        input_ = asyncio.ensure_future(pump_input())
+        try:
+            await asyncio.wait({output, input_}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (output, input_):
+                task.cancel()
+            await asyncio.gather(output, input_, return_exceptions=True)
+            serial_hub.unsubscribe(subscription)
+
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass
+
+else:
+    # Заглушка если FastAPI недоступен
+    class MockRouter:
+        def __init__(self):
+            pass
+
+    router = MockRouter()
@@ -2,28 +2,69 @@
 Упрощенные API роуты для демо-режима
 """
 
+from typing import List, Optional
+
 try:
-    from fastapi import APIRouter, HTTPException
+    from fastapi import APIRouter, HTTPException, Request, Response
     from fastapi.responses import HTMLResponse
     FASTAPI_AVAILABLE = True
 except ImportError:
     FASTAPI_AVAILABLE = False
 
+from app.core.config import settings
 from app.services.kvm_service import kvm_service
+from app.services.libvirt_pool import LibvirtUnavailable
 
 
 if FASTAPI_AVAILABLE:
+    from app.schemas.vm_schemas import (
+        BackupCreate, BackupRestore, BalloonBounds, BulkPowerAction, BulkTuning, CloneCreate, DiskMaintenance, HostDrain,
+        HostRestore, SimulatorDomains, SimulatorUpdate, SnapshotCreate, SnapshotInfo, ThrottlePolicyUpdate,
+        VMMetadataUpdate, VMResize, VMTuning
+    )
+
     router = APIRouter()
 
     @router.get("/vms")
-    async def list_vms():
-        """Получить список всех виртуальных машин"""
+    async def list_vms(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                       status: Optional[str] = None, prefix: Optional[str] = None,
+                       tags: Optional[str] = None, sort: str = "name", fields: Optional[str] = None):
+        """Получить список виртуальных машин (фильтры, сортировка, курсорная пагинация)
+
+        Следующая страница — X-Next-Cursor, число ВМ под фильтром — X-Total-Count.
+        ETag — поколение инвентаря: при неизменном инвентаре ответ 304.
+        """
+        from app.services.inventory_service import vm_inventory, make_etag, etag_matches
+        from app.core.serialization import encode_response
+        etag = make_etag(vm_inventory.snapshot().generation)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
         try:
-            vms = kvm_service.get_all_vms()
-            return vms
+            payload = vm_inventory.encoded_page(
+                limit=limit, cursor=cursor, status=status, prefix=prefix,
+                tags=tags.split(",") if tags else None, sort=sort,
+                fields=fields.split(",") if fields else None
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+        # Готовые (и уже сжатые) байты из кэша страниц
+        body, headers = encode_response(payload, request.headers.get("accept-encoding"))
+        return Response(content=body, headers=headers)
+
+    # Объявлен до /vms/{vm_name}, иначе "changes" будет принято за имя ВМ
+    @router.get("/vms/changes")
+    async def list_vm_changes(since: int = 0, fields: Optional[str] = None):
+        """ВМ, измененные после поколения since, и удаленные ВМ
+
+        full=true — разница неизвестна (since устарел), changed содержит весь список.
+        """
+        from app.services.inventory_service import vm_inventory
+        return vm_inventory.changes(since, fields=fields.split(",") if fields else None)
+
     @router.get("/vms/{vm_name}")
     async def get_vm(vm_name: str):
         """Получить информацию о конкретной ВМ"""
@@ -32,6 +73,8 @@ if FASTAPI_AVAILABLE:
             if vm is None:
                 raise HTTPException(status_code=404, detail="ВМ не найдена")
             return vm
+        except (HTTPException, LibvirtUnavailable):
+            raise
         except Exception as e:
             raise HTTPException(status_code=404, detail=str(e))
 
@@ -44,12 +87,50 @@ if FASTAPI_AVAILABLE:
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
+    @router.patch("/vms/{vm_name}")
+    def resize_vm(vm_name: str, request: VMResize):
+        """Изменить vCPU и память: на лету (hotplug, balloon, DIMM) или в конфигурации до перезапуска
+
+        Обычная (не async) функция: горячее добавление DIMM может занимать секунды и не должно блокировать цикл событий.
+        """
+        from app.services.resize_service import resize_service
+        try:
+            return resize_service.resize(vm_name, vcpus=request.vcpus, memory_mb=request.memory, live=request.live)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @router.post("/vms/actions")
+    def bulk_vm_action(request: BulkPowerAction):
+        """Действие питания над многими ВМ: параллельно, с результатом по каждой ВМ
+
+        Обычная (не async) функция: FastAPI выполняет ее в пуле потоков,
+        и ожидание подтверждения не блокирует цикл событий.
+        """
+        from app.services.power_service import power_service
+        try:
+            return power_service.run(
+                request.action, names=request.names, tags=request.tags, status=request.status,
+                all_vms=request.all, concurrency=request.concurrency, wait=request.wait,
+                timeout=request.timeout, background=request.background
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     @router.post("/vms/{vm_name}/start")
-    async def start_vm(vm_name: str):
-        """Запустить виртуальную машину"""
+    def start_vm(vm_name: str, priority: str = "normal", wait: bool = True):
+        """Запустить виртуальную машину через очередь допуска запусков
+
+        С wait=false сразу возвращает билет с позицией в очереди и ожидаемым
+        временем; иначе ждет допуска и результата запуска (в пуле потоков),
+        но не дольше BOOT_WAIT_TIMEOUT — после этого возвращает билет.
+        """
+        from app.services.boot_scheduler import boot_scheduler
         try:
-            result = kvm_service.start_vm(vm_name)
-            return result
+            if not wait:
+                return boot_scheduler.submit(vm_name, priority)
+            return boot_scheduler.start(vm_name, priority, timeout=settings.BOOT_WAIT_TIMEOUT)
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
@@ -85,45 +166,30 @@ if FASTAPI_AVAILABLE:
 
     @router.get("/vms/{vm_name}/console/viewer", response_class=HTMLResponse)
     async def vm_console_viewer(vm_name: str):
-        """Веб-страница с VNC консолью"""
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Console - {vm_name}</title>
-            <meta charset="utf-8">
-            <style>
-                body {{ 
-                    margin: 0; 
-                    padding: 20px; 
-                    background: #2c3e50; 
-                    color: white;
-                    font-family: monospace;
-                }}
-                .console {{ 
-                    background: black; 
-                    padding: 20px; 
-                    border-radius: 5px;
-                    border: 2px solid #34495e;
-                }}
-            </style>
-        </head>
-        <body>
-            <h2>🖥️ Консоль ВМ: {vm_name}</h2>
-            <div class="console">
-                <p>🎭 Демо-консоль для виртуальной машины "{vm_name}"</p>
-                <p>📺 В реальном режиме здесь будет VNC подключение</p>
-                <p>⌨️  Консоль готова к использованию...</p>
-                <p style="color: #2ecc71;">user@{vm_name}:~$ _</p>
-            </div>
-        </body>
-        </html>
-        """
-        return HTMLResponse(content=html_content)
+        """Веб-страница с VNC консолью (noVNC)"""
+        from app.services.console_service import render_vnc_viewer
+        return HTMLResponse(content=render_vnc_viewer(vm_name))
+
+    @router.get("/console/sessions")
+    async def list_console_sessions(vm_name: Optional[str] = None):
+        """Активные консольные сессии и учет трафика"""
+        from app.services.console_service import vnc_proxy
+        from app.services.serial_service import serial_hub
+        return {
+            "sessions": vnc_proxy.get_sessions(vm_name) + serial_hub.get_sessions(vm_name),
+            "stats": vnc_proxy.get_stats(),
+            "serial": serial_hub.get_stats()
+        }
 
     @router.get("/host/stats")
     async def get_host_stats():
         """Получить статистику хост-системы"""
+        if settings.PROCESS_ROLE == "worker":
+            # Статистику собирает коллектор, воркеры отдают его последний срез
+            from app.services.collector import collector_client
+            stats = collector_client().metrics()
+            if stats is not None:
+                return stats
         try:
             import psutil
             from datetime import datetime
@@ -161,6 +227,385 @@ if FASTAPI_AVAILABLE:
                 "error": f"Ошибка получения статистики: {str(e)}"
             }
 
+    # Очередь допуска запусков
+    @router.get("/boot/queue")
+    async def get_boot_queue():
+        """Очередь запусков: позиции, ожидаемое время, загружающиеся ВМ и нагрузка хоста"""
+        from app.services.boot_scheduler import boot_scheduler
+        return boot_scheduler.get_status()
+
+    @router.get("/boot/queue/{ticket_id}")
+    async def get_boot_ticket(ticket_id: str):
+        """Состояние запуска в очереди"""
+        from app.services.boot_scheduler import boot_scheduler
+        ticket = boot_scheduler.get_ticket(ticket_id)
+        if ticket is None:
+            raise HTTPException(status_code=404, detail="Билет не найден")
+        return ticket
+
+    @router.delete("/boot/queue/{ticket_id}")
+    async def cancel_boot_ticket(ticket_id: str):
+        """Отменить запуск, еще не допущенный из очереди"""
+        from app.services.boot_scheduler import boot_scheduler
+        try:
+            return boot_scheduler.cancel(ticket_id)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    # Обслуживание хоста
+    @router.post("/host/drain")
+    async def drain_host(request: Optional[HostDrain] = None):
+        """Остановить все ВМ волнами (destroy после срока) и запомнить, какие работали"""
+        from app.services.drain_service import drain_service
+        request = request or HostDrain()
+        try:
+            return drain_service.drain(request.wave_size, request.shutdown_timeout, request.force_timeout)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @router.post("/host/restore")
+    async def restore_host(request: Optional[HostRestore] = None):
+        """Запустить ВМ, работавшие до остановки хоста, по убыванию приоритета"""
+        from app.services.drain_service import drain_service
+        request = request or HostRestore()
+        try:
+            return drain_service.restore(request.drain_id, request.concurrency, request.timeout)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    @router.get("/host/drains")
+    async def list_host_drains(limit: int = 20):
+        """История остановок хоста с отчетами о времени по каждой ВМ"""
+        from app.services.drain_service import drain_service
+        return drain_service.list(limit)
+
+    @router.get("/host/drains/{drain_id}")
+    async def get_host_drain(drain_id: str):
+        """Остановка хоста: список ВМ, статус и отчет"""
+        from app.services.drain_service import drain_service
+        drain = drain_service.get(drain_id)
+        if drain is None:
+            raise HTTPException(status_code=404, detail="Запись об остановке не найдена")
+        return drain
+
+    # Снапшоты
+    @router.get("/vms/{vm_name}/snapshots", response_model=List[SnapshotInfo])
+    def list_snapshots(vm_name: str):
+        """Список снапшотов ВМ"""
+        from app.services.snapshot_service import snapshot_service
+        try:
+            return snapshot_service.list_snapshots(vm_name)
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    @router.post("/vms/{vm_name}/snapshots")
+    def create_snapshot(vm_name: str, snapshot: SnapshotCreate):
+        """Создать внешний снапшот ВМ
+
+        Обычная (не async) функция: снапшот с памятью пишется секунды и минуты, цикл событий при этом не блокируется.
+        """
+        from app.services.snapshot_service import snapshot_service
+        return snapshot_service.create_snapshot(
+            vm_name, snapshot.name, snapshot.description,
+            include_memory=snapshot.include_memory, quiesce=snapshot.quiesce
+        )
+
+    @router.post("/vms/{vm_name}/snapshots/{snapshot_name}/revert")
+    def revert_snapshot(vm_name: str, snapshot_name: str):
+        """Откатить ВМ к снапшоту
+
+        Обычная (не async) функция: revertToSnapshot, qemu-img и restoreFlags выполняются в пуле потоков.
+        """
+        from app.services.snapshot_service import snapshot_service
+        return snapshot_service.revert_snapshot(vm_name, snapshot_name)
+
+    @router.delete("/vms/{vm_name}/snapshots/{snapshot_name}")
+    def delete_snapshot(vm_name: str, snapshot_name: str):
+        """Удалить снапшот (block-commit в фоне)"""
+        from app.services.snapshot_service import snapshot_service
+        return snapshot_service.delete_snapshot(vm_name, snapshot_name)
+
+    # Связанные клоны
+    @router.post("/vms/{vm_name}/clone")
+    def clone_vm(vm_name: str, clone: CloneCreate):
+        """Создать связанный клон ВМ
+
+        Обычная (не async) функция: qemu-img и defineXML выполняются в пуле потоков, а не в цикле событий.
+        """
+        from app.services.clone_service import clone_service
+        result = clone_service.clone_vm(vm_name, clone.name, start=clone.start)
+        if result.get("success") and clone.flatten:
+            result["flatten"] = clone_service.flatten_vm(clone.name)
+        return result
+
+    @router.post("/vms/{vm_name}/flatten")
+    async def flatten_vm(vm_name: str):
+        """Превратить связанный клон в полную копию (в фоне)"""
+        from app.services.clone_service import clone_service
+        return clone_service.flatten_vm(vm_name)
+
+    # Бэкапы
+    @router.get("/vms/{vm_name}/backups")
+    async def list_backups(vm_name: str):
+        """Список бэкапов ВМ"""
+        from app.services.backup_service import backup_service
+        return backup_service.list_backups(vm_name)
+
+    @router.post("/vms/{vm_name}/backups")
+    async def create_backup(vm_name: str, backup: Optional[BackupCreate] = None):
+        """Запустить полный или инкрементальный бэкап ВМ (в фоне)"""
+        from app.services.backup_service import backup_service
+        return backup_service.start_backup(vm_name, mode=backup.mode if backup else "auto")
+
+    @router.post("/vms/{vm_name}/backups/{backup_id}/restore")
+    async def restore_backup(vm_name: str, backup_id: str, restore: Optional[BackupRestore] = None):
+        """Восстановить диски ВМ из бэкапа (в фоне)"""
+        from app.services.backup_service import backup_service
+        restore = restore or BackupRestore()
+        return backup_service.restore_backup(vm_name, backup_id, restore.target_dir, fmt=restore.format)
+
+    # Обслуживание дисков
+    @router.post("/vms/{vm_name}/maintenance")
+    async def maintain_vm_disks(vm_name: str, maintenance: DiskMaintenance):
+        """Compact, sparsify или смена preallocation дисков выключенной ВМ (в фоне)"""
+        from app.services.maintenance_service import maintenance_service
+        return maintenance_service.start(
+            vm_name, maintenance.operation,
+            compress=maintenance.compress, preallocation=maintenance.preallocation
+        )
+
+    @router.post("/maintenance")
+    async def schedule_maintenance(maintenance: DiskMaintenance):
+        """Поставить обслуживание дисков для всех выключенных ВМ"""
+        from app.services.maintenance_service import maintenance_service
+        return maintenance_service.schedule(
+            maintenance.operation, vm_names=maintenance.vms,
+            compress=maintenance.compress, preallocation=maintenance.preallocation
+        )
+
+    # Метаданные и история
+    @router.put("/vms/{vm_name}/metadata")
+    async def update_vm_metadata(vm_name: str, metadata: VMMetadataUpdate):
+        """Изменить сохраненные метаданные ВМ (ОС, владелец, теги, приоритет запуска)"""
+        from app.services.state_store import state_store
+        if kvm_service.get_vm_info(vm_name) is None:
+            raise HTTPException(status_code=404, detail="ВМ не найдена")
+        state_store.upsert_vm(vm_name, os=metadata.os, owner=metadata.owner, tags=metadata.tags,
+                              priority=metadata.priority)
+        return {"success": True, "message": f"Метаданные ВМ {vm_name} обновлены", "metadata": state_store.get_vm_meta(vm_name)}
+
+    # Ограничения ресурсов
+    @router.get("/vms/{vm_name}/tuning")
+    def get_vm_tuning(vm_name: str):
+        """CPU shares/quota, blkio weight, ограничения дисков и сетевых интерфейсов ВМ"""
+        from app.services.tuning_service import tuning_service
+        try:
+            return tuning_service.get(vm_name)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    @router.put("/vms/tuning")
+    def bulk_tune_vms(request: BulkTuning):
+        """Применить одинаковые ограничения к ВМ под селектором
+
+        Обычная (не async) функция: вызовы libvirt и ожидание пула потоков идут вне цикла событий.
+        """
+        from app.services.tuning_service import tuning_service
+        tuning = request.model_dump(exclude_none=True, include={"cpu", "blkio_weight", "disks", "interfaces"})
+        try:
+            return tuning_service.apply_bulk(
+                tuning, names=request.names, tags=request.tags, status=request.status,
+                all_vms=request.all, concurrency=request.concurrency
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @router.put("/vms/{vm_name}/tuning")
+    def tune_vm(vm_name: str, request: VMTuning):
+        """Применить ограничения к запущенной ВМ и сохранить в конфигурацию домена"""
+        from app.services.tuning_service import tuning_service
+        try:
+            return tuning_service.apply(vm_name, request.model_dump(exclude_none=True))
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @router.get("/vms/{vm_name}/events")
+    async def get_vm_events(vm_name: str, limit: int = 100):
+        """История событий жизненного цикла ВМ"""
+        from app.services.state_store import state_store
+        return state_store.list_events(vm_name, limit=limit)
+
+    @router.get("/events")
+    async def get_events(limit: int = 100):
+        """Последние события жизненного цикла всех ВМ"""
+        from app.services.state_store import state_store
+        return state_store.list_events(limit=limit)
+
+    # Фоновые задачи
+    @router.get("/jobs")
+    async def list_jobs(kind: Optional[str] = None, target: Optional[str] = None):
+        """Список фоновых задач"""
+        from app.services.job_service import job_manager
+        return job_manager.list(kind=kind, target=target)
+
+    @router.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        """Состояние фоновой задачи"""
+        from app.services.job_service import job_manager
+        job = job_manager.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Задача не найдена")
+        return job
+
+    # Балансировщик памяти (balloon)
+    @router.get("/balloon")
+    async def get_balloon_status():
+        """Состояние балансировщика памяти"""
+        from app.services.balloon_service import balloon_service
+        return balloon_service.get_status()
+
+    @router.get("/balloon/decisions")
+    async def get_balloon_decisions(limit: int = 100, vm_name: Optional[str] = None):
+        """Журнал решений балансировщика памяти"""
+        from app.services.balloon_service import balloon_service
+        return balloon_service.get_decisions(limit=limit, vm_name=vm_name)
+
+    @router.post("/balloon/start")
+    async def start_balloon(interval: Optional[float] = None):
+        """Запустить балансировщик памяти"""
+        from app.services.balloon_service import balloon_service
+        return balloon_service.start(interval)
+
+    @router.post("/balloon/stop")
+    async def stop_balloon():
+        """Остановить балансировщик памяти"""
+        from app.services.balloon_service import balloon_service
+        return balloon_service.stop()
+
+    @router.post("/balloon/run")
+    async def run_balloon_once():
+        """Выполнить один цикл балансировки"""
+        from app.services.balloon_service import balloon_service
+        try:
+            decisions = balloon_service.run_once()
+            return {"success": True, "decisions": decisions}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @router.put("/balloon/vms/{vm_name}")
+    async def set_balloon_bounds(vm_name: str, bounds: BalloonBounds):
+        """Задать границы памяти ВМ для балансировщика"""
+        from app.services.balloon_service import balloon_service
+        return balloon_service.set_bounds(vm_name, bounds.min_mib, bounds.max_mib)
+
+    # Контроллер шумных соседей
+    @router.get("/throttle")
+    async def get_throttle_status():
+        """Состояние контроллера: политики, ограниченные ВМ и доли ВМ в нагрузке хоста"""
+        from app.services.throttle_service import throttle_service
+        return throttle_service.get_status()
+
+    @router.get("/throttle/decisions")
+    async def get_throttle_decisions(limit: int = 100, vm_name: Optional[str] = None, resource: Optional[str] = None):
+        """Журнал решений контроллера шумных соседей"""
+        from app.services.throttle_service import throttle_service
+        return throttle_service.get_decisions(limit=limit, vm_name=vm_name, resource=resource)
+
+    @router.post("/throttle/start")
+    async def start_throttle(interval: Optional[float] = None, dry_run: Optional[bool] = None):
+        """Запустить контроллер (dry_run=true — только записывать решения)"""
+        from app.services.throttle_service import throttle_service
+        return throttle_service.start(interval, dry_run)
+
+    @router.post("/throttle/stop")
+    async def stop_throttle():
+        """Остановить контроллер; наложенные ограничения остаются"""
+        from app.services.throttle_service import throttle_service
+        return throttle_service.stop()
+
+    @router.post("/throttle/run")
+    async def run_throttle_once():
+        """Выполнить один цикл контроллера"""
+        from app.services.throttle_service import throttle_service
+        try:
+            decisions = throttle_service.run_once()
+            return {"success": True, "decisions": decisions}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @router.put("/throttle/policies/{resource}")
+    async def set_throttle_policy(resource: str, policy: ThrottlePolicyUpdate):
+        """Изменить пороги политики cpu или io"""
+        from app.services.throttle_service import throttle_service
+        return throttle_service.set_policy(resource, **policy.model_dump(exclude_none=True))
+
+    # Симулятор гипервизора (демо-режим)
+    def _simulator():
+        if not kvm_service.demo_mode:
+            raise HTTPException(status_code=400, detail="Симулятор доступен только в демо-режиме")
+        from app.services.hypervisor_simulator import hypervisor_simulator
+        return hypervisor_simulator
+
+    @router.get("/simulator")
+    async def get_simulator_status():
+        """Домены по статусам, задержки, вероятности сбоев и счетчики операций симулятора"""
+        return _simulator().get_status()
+
+    @router.put("/simulator")
+    async def configure_simulator(update: SimulatorUpdate):
+        """Изменить задержки операций и внедрение сбоев без перезапуска"""
+        try:
+            return _simulator().configure(**update.model_dump(exclude_none=True))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @router.post("/simulator/domains")
+    async def add_simulator_domains(domains: SimulatorDomains):
+        """Добавить синтетические домены для нагрузочного теста"""
+        try:
+            return _simulator().add_domains(domains.count, domains.running_ratio, domains.prefix)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # Замеры времени
+    def _collector_timing(method: str, *args):
+        """Статистика коллектора в многопроцессном режиме: вызовы libvirt выполняются там"""
+        if settings.PROCESS_ROLE != "worker":
+            return None
+        from app.services.collector import collector_client
+        return collector_client().timing(method, *args)
+
+    @router.get("/timing")
+    async def get_timing():
+        """Время запросов по маршрутам (p50/p95/p99), вызовы libvirt по операциям и фазы запросов"""
+        from app.core.timing import timing_stats
+        stats = timing_stats.get_stats()
+        remote = _collector_timing("get_stats")
+        if remote is not None:
+            stats["libvirt_calls"] = remote["libvirt_calls"]
+            stats["collector_phases"] = remote["phases"]
+        return stats
+
+    @router.get("/timing/slow")
+    async def get_slow_calls(limit: int = 100, vm_name: Optional[str] = None):
+        """Журнал медленных вызовов libvirt (дольше SLOW_CALL_THRESHOLD_MS), новые первыми"""
+        from app.core.timing import timing_stats
+        remote = _collector_timing("get_slow_calls", limit, vm_name)
+        calls = remote if remote is not None else timing_stats.get_slow_calls(limit, vm_name)
+        return {"threshold_ms": settings.SLOW_CALL_THRESHOLD_MS, "calls": calls}
+
+    @router.delete("/timing")
+    async def reset_timing():
+        """Сбросить накопленную статистику времени"""
+        from app.core.timing import timing_stats
+        timing_stats.reset()
+        _collector_timing("reset")
+        return {"success": True, "message": "Статистика времени сброшена"}
+
     @router.get("/")
     async def api_root():
         """API информация"""
@@ -171,7 +616,9 @@ if FASTAPI_AVAILABLE:
             "endpoints": {
                 "vms": "/api/vms",
                 "host_stats": "/api/host/stats",
+                "balloon": "/api/balloon",
                 "iso": "/api/iso",
+                "timing": "/api/timing",
                 "docs": "/docs"
             }
         }
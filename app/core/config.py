@@ -12,36 +12,188 @@ class Settings:
         self.DEBUG = True
         
         # Database
-        self.DATABASE_URL = "sqlite:///./kvm_platform.db"
+        self.DATABASE_URL = "sqlite:///./data/kvm_platform.db"  # Путь относительно корня проекта
         
         # Пути к директориям (относительно корня проекта)
         self.BASE_DIR = Path(__file__).parent.parent.parent
         self.DATA_DIR = self.BASE_DIR / "data"
         
         # KVM/Libvirt settings
-        self.LIBVIRT_URI = "qemu:///system"
+        self.LIBVIRT_URI = os.getenv("LIBVIRT_URI", "qemu:///system")  # test:///default — тестовый драйвер libvirt
+        self.LIBVIRT_POOL_SIZE = 4  # Соединений для параллельных операций (плюс основное для событий)
+        self.LIBVIRT_KEEPALIVE_INTERVAL = 5  # Интервал keepalive проб, сек
+        self.LIBVIRT_KEEPALIVE_COUNT = 3  # Проб без ответа до разрыва соединения
+        self.LIBVIRT_RECONNECT_MIN = 1  # Первая задержка переподключения, сек (дальше удваивается)
+        self.LIBVIRT_RECONNECT_MAX = 60
+        self.LIBVIRT_ACQUIRE_TIMEOUT = 10  # Ожидание свободного соединения пула, сек
+        self.LIBVIRT_HEALTH_INTERVAL = 5  # Проверка основного соединения в фоне, сек
         self.VM_STORAGE_PATH = str(self.DATA_DIR / "vms")
         self.ISO_STORAGE_PATH = str(self.DATA_DIR / "images" / "iso")
+        self.SNAPSHOT_STORAGE_PATH = str(self.DATA_DIR / "snapshots")
+        self.BACKUP_STORAGE_PATH = str(self.DATA_DIR / "backups")
+
+        # Горячее изменение vCPU и памяти (PATCH /vms/{vm_name})
+        self.VM_MAX_VCPUS = min(os.cpu_count() or 1, 64)  # Максимум vCPU новой ВМ по умолчанию и предел его увеличения
+        self.VM_MAX_MEMORY_FACTOR = 4  # maxMemory новой ВМ по умолчанию — во сколько раз больше начальной памяти
+        self.VM_MEMORY_SLOTS = 16  # Слотов для горячего добавления DIMM
+        self.VM_DIMM_ALIGN_MB = 128  # Размер добавляемого DIMM округляется вверх до кратного
         
         # VNC settings
         self.VNC_HOST = "localhost"
         self.VNC_PORT_RANGE_START = 5900
         self.VNC_PORT_RANGE_END = 5999
-        
+
+        # Браузерные консоли
+        self.NOVNC_PATH = "/usr/share/novnc"  # Каталог noVNC из пакета novnc
+        self.NOVNC_URL = "/novnc"
+        self.CONSOLE_WS_BASE = None  # ws://host:port для WebSocket, по умолчанию текущий хост
+        self.CONSOLE_MAX_SESSIONS = 500
+        self.CONSOLE_BUFFER_SIZE = 64 * 1024
+        self.SERIAL_MAX_STREAMS = 64  # Одновременно открытых virStream serial консолей
+        self.SERIAL_SCROLLBACK_SIZE = 64 * 1024  # Байт последнего вывода на ВМ
+        self.SERIAL_IDLE_TIMEOUT = 300  # Сколько держать поток без клиентов, сек
+        self.SERIAL_CLIENT_QUEUE = 1024  # Очередь сообщений на клиента
+
+        # Memory balloon auto-balancer
+        self.BALLOON_STATS_PERIOD = 10  # Период сбора статистики balloon в гостях, сек
+        self.BALLOON_INTERVAL = 15  # Интервал работы контроллера, сек
+        self.BALLOON_SIMULATOR = False  # Работать на симуляторе вместо libvirt
+        self.BALLOON_DRY_RUN = False  # Только логировать решения, не применять
+        self.BALLOON_PRESSURE_HIGH = 0.85  # Доля занятой памяти хоста: начинаем отбирать
+        self.BALLOON_PRESSURE_LOW = 0.60  # Доля занятой памяти хоста: возвращаем память
+        self.BALLOON_GUEST_HEADROOM = 0.20  # Запас сверх используемой гостем памяти
+        self.BALLOON_GUEST_STARVING = 0.05  # Доля свободной памяти гостя, ниже которой он голодает
+        self.BALLOON_MIN_MEMORY_MIB = 512  # Нижняя граница по умолчанию
+        self.BALLOON_MAX_STEP_MIB = 512  # Максимальное изменение за один шаг
+        self.BALLOON_MIN_CHANGE_MIB = 64  # Изменения меньше этого игнорируются
+        self.BALLOON_DECISION_LOG_SIZE = 1000
+
+        # Контроллер шумных соседей (ограничение ВМ, создающих конкуренцию за CPU и диск)
+        self.THROTTLE_INTERVAL = 10  # Интервал работы контроллера, сек
+        self.THROTTLE_SIMULATOR = False  # Работать на симуляторе вместо libvirt
+        self.THROTTLE_DRY_RUN = False  # Только логировать решения, не применять
+        self.THROTTLE_DECISION_LOG_SIZE = 1000
+        # Давление: cpu — доля занятого CPU хоста, io — доля iowait. trigger/release — интервалов подряд
+        self.THROTTLE_POLICIES = {
+            "cpu": {"engage_pressure": 0.85, "release_pressure": 0.60, "min_share": 0.30,
+                    "trigger": 3, "release": 6, "shares": 256},
+            "io": {"engage_pressure": 0.20, "release_pressure": 0.05, "min_share": 0.30,
+                   "trigger": 3, "release": 6, "iops_factor": 0.5, "min_iops": 200},
+        }
+
+        # Симулятор гипервизора: демо-режим без libvirt и нагрузочное тестирование всего стека
+        self.SIMULATOR = os.getenv("KVM_SIMULATOR", "0") == "1"  # Симулятор даже при доступном libvirt
+        self.SIMULATOR_DOMAINS = int(os.getenv("SIMULATOR_DOMAINS", "0"))  # Синтетических доменов сверх demo_vms.json
+        self.SIMULATOR_RUNNING_RATIO = 0.5  # Доля синтетических доменов, запущенных при старте
+        self.SIMULATOR_SEED = 42  # Seed генератора: одинаковые домены и сбои между прогонами
+        # Задержки операций, сек: guest_shutdown — от запроса shutdown до выключения гостя
+        self.SIMULATOR_LATENCY = {
+            "list": 0.0, "lookup": 0.0, "start": 0.05, "shutdown": 0.01, "guest_shutdown": 2.0,
+            "destroy": 0.01, "reboot": 0.01, "define": 0.02, "undefine": 0.02, "clone": 0.05, "default": 0.0,
+        }
+        self.SIMULATOR_JITTER = 0.2  # Случайное отклонение задержки, доля
+        # Вероятность сбоя операции 0..1; "*" — всех операций, guest_shutdown — гость игнорирует shutdown
+        self.SIMULATOR_FAILURE_RATE = {}
+
+        # Фоновые задачи
+        self.JOB_WORKERS = 4
+        self.JOB_HISTORY_SIZE = 200
+        self.BLOCK_JOB_POLL_INTERVAL = 0.5  # Период опроса block job (commit, pull), сек
+
+        # Снапшоты
+        self.SNAPSHOT_CACHE_TTL = 30  # Время жизни кэша списка снапшотов, сек
+        self.SNAPSHOT_COMMIT_BANDWIDTH = 0  # Ограничение block-commit, МиБ/с (0 — без ограничения)
+
+        # Клоны
+        self.CLONE_FLATTEN_BANDWIDTH = 0  # Ограничение block-pull при flatten, МиБ/с
+
+        # Бэкапы
+        self.BACKUP_CHUNK_SIZE = 4 * 1024 * 1024
+        self.BACKUP_COMPRESSION = "zstd"  # zstd (если установлен zstandard), zlib или none
+        self.BACKUP_COMPRESSION_LEVEL = 3
+        self.BACKUP_COMPRESSION_WORKERS = os.cpu_count() or 4
+
+        # Хранилище состояния (SQLite по DATABASE_URL)
+        self.STATE_WRITE_BATCH = 500  # Максимум операций в одной транзакции писателя
+        self.STATE_EVENTS_RETENTION_DAYS = 30
+
+        # Инвентарь ВМ (GET /vms)
+        self.INVENTORY_TTL = 5  # Максимальный возраст среза инвентаря, сек
+        self.INVENTORY_SCAN_RATIO = 16  # Фильтр плотнее 1/N — обход индекса вместо сортировки кандидатов
+        self.INVENTORY_MAX_LIMIT = 1000
+        self.INVENTORY_CHANGELOG_SIZE = 100000  # Записей журнала изменений для /vms/changes
+
+        # IP-адреса ВМ: аренды DHCP сетей libvirt, для ВМ без аренды — гостевой агент
+        self.ADDRESS_CACHE_TTL = 30  # Время жизни аренд и ответов агента в кэше, сек
+        self.ADDRESS_AGENT_WORKERS = 4  # Одновременных фоновых запросов к гостевым агентам
+
+        # Замеры времени: заголовок Server-Timing, GET /api/timing
+        self.TIMING_ENABLED = True
+        self.SLOW_CALL_THRESHOLD_MS = 500  # Вызовы libvirt дольше порога попадают в журнал медленных вызовов
+        self.SLOW_CALL_LOG_SIZE = 500
+        self.TIMING_ROUTE_SAMPLES = 1000  # Последних запросов маршрута для перцентилей
+
+        # simple_server.py --production
+        self.SERVER_WORKERS = 32  # Потоков обработки запросов
+        self.SERVER_QUEUE_SIZE = 128  # Соединений в ожидании свободного потока, сверх — 503
+        self.SERVER_REQUEST_TIMEOUT = 30  # Таймаут чтения/записи сокета во время запроса, сек
+        self.SERVER_KEEPALIVE_TIMEOUT = 5  # Простой keep-alive соединения между запросами, сек
+        self.SERVER_DRAIN_TIMEOUT = 10  # Ожидание активных запросов при остановке, сек
+        self.SERVER_ACCESS_LOG = False
+
+        # Ответы API
+        self.COMPRESSION_MIN_SIZE = 1024  # Сжимать ответы от этого размера, байт
+        self.GZIP_LEVEL = 5
+        self.BROTLI_QUALITY = 4  # Быстрые уровни brotli сжимают лучше gzip при той же скорости
+        self.RESPONSE_CACHE_SIZE = 64  # Сериализованных страниц списка ВМ в кэше
+
+        # Массовые операции питания (POST /vms/actions)
+        self.POWER_CONCURRENCY = 16  # Одновременных вызовов libvirt по умолчанию
+        self.POWER_MAX_CONCURRENCY = 64
+        self.POWER_WAIT_TIMEOUT = 300  # Срок ожидания целевого состояния по умолчанию, сек
+
+        # Допуск запусков ВМ при массовом старте (boot storm)
+        self.BOOT_MAX_CONCURRENT = 4  # Одновременно загружающихся ВМ
+        self.BOOT_MAX_IOWAIT = 20.0  # Новая загрузка не допускается при iowait хоста выше, %
+        self.BOOT_MAX_CPU = 85.0  # ... и при загрузке CPU выше, %
+        self.BOOT_SETTLE_TIME = 30  # Сколько секунд после старта ВМ считается загружающейся
+        self.BOOT_SAMPLE_INTERVAL = 1.0  # Период замера нагрузки хоста, сек
+        self.BOOT_HISTORY_SIZE = 200  # Завершенных билетов в памяти
+        self.BOOT_WAIT_TIMEOUT = 30.0  # Сколько синхронный запуск ждет допуска и start_vm, сек
+
+        # Обслуживание хоста: остановка всех ВМ и их возврат (POST /host/drain, /host/restore)
+        self.DRAIN_WAVE_SIZE = 8  # ВМ в одной волне остановки
+        self.DRAIN_SHUTDOWN_TIMEOUT = 120  # Срок штатного выключения ВМ до destroy, сек
+        self.DRAIN_FORCE_TIMEOUT = 30  # Срок ожидания после destroy, сек
+        self.RESTORE_CONCURRENCY = 4  # Одновременных запусков внутри группы приоритета
+        self.RESTORE_START_TIMEOUT = 120  # Срок ожидания запуска ВМ перед следующей группой, сек
+
+        # Обслуживание дисков
+        self.MAINTENANCE_PER_DEVICE = 1  # Одновременных задач на одно блочное устройство
+        self.MAINTENANCE_RATE_LIMIT = 0  # Ограничение чтения qemu-img convert, МиБ/с (0 — без ограничения)
+        self.MAINTENANCE_LOW_PRIORITY = True  # Запускать qemu-img под ionice -c3 и nice
+
+        # Несколько процессов API (main.py --workers N)
+        self.WORKERS = int(os.getenv("WORKERS", "1"))
+        self.PROCESS_ROLE = os.getenv("KVM_PLATFORM_ROLE", "standalone")  # standalone, collector или worker
+        self.COLLECTOR_SOCKET = os.getenv("COLLECTOR_SOCKET", str(self.DATA_DIR / "collector.sock"))
+        self.COLLECTOR_AUTHKEY = os.getenv("COLLECTOR_AUTHKEY", "")  # Генерируется при запуске, передается воркерам
+        self.COLLECTOR_SYNC_INTERVAL = 0.5  # Как часто воркер сверяет поколение инвентаря, сек
+        self.COLLECTOR_METRICS_INTERVAL = 2  # Период обновления статистики хоста в коллекторе, сек
+
         # Security
         self.SECRET_KEY = "your-secret-key-change-in-production"
         self.ALGORITHM = "HS256"
         self.ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-        # Создаем директории если их нет
-        self._create_directories()
-    
-    def _create_directories(self):
-        """Создание необходимых директорий"""
+    def ensure_directories(self):
+        """Создание необходимых директорий (при запуске приложения, а не при импорте настроек)"""
         directories = [
             self.DATA_DIR,
             self.DATA_DIR / "vms",
             self.DATA_DIR / "images" / "iso",
+            self.DATA_DIR / "snapshots",
+            self.DATA_DIR / "backups",
             self.DATA_DIR / "storage",
             self.BASE_DIR / "logs"
         ]
@@ -51,6 +203,3 @@ class Settings:
 
 
 settings = Settings()
-
-
-settings = Settings()
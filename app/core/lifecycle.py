@@ -0,0 +1,83 @@
+"""
+Ленивое создание глобальных сервисов и хуки запуска/остановки приложения
+"""
+
+import threading
+from typing import Callable, List
+
+from app.core.config import settings
+
+
+_startup_hooks: List[Callable[[], None]] = []
+_shutdown_hooks: List[Callable[[], None]] = []
+
+
+class LazyService:
+    """Глобальный экземпляр сервиса, создаваемый при первом обращении к атрибуту
+
+    Импорт модуля сервиса не открывает соединений и не трогает файловую
+    систему: это происходит в хуке запуска приложения или при первом вызове.
+    """
+
+    def __init__(self, factory: Callable[[], object]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = self._factory()
+                    object.__setattr__(self, "_instance", instance)
+        return instance
+
+    def __getattr__(self, name: str):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._get(), name, value)
+
+    def __repr__(self):
+        state = "создан" if self._instance is not None else "не создан"
+        return f"<LazyService {getattr(self._factory, '__name__', self._factory)}: {state}>"
+
+
+def unwrap(service):
+    """Настоящий экземпляр за LazyService (создает его при необходимости)"""
+    return service._get() if isinstance(service, LazyService) else service
+
+
+def is_initialized(service) -> bool:
+    """Создан ли уже экземпляр за LazyService"""
+    return isinstance(service, LazyService) and service._instance is not None
+
+
+def on_startup(func: Callable[[], None]) -> Callable[[], None]:
+    """Зарегистрировать хук запуска (подходит как декоратор)"""
+    _startup_hooks.append(func)
+    return func
+
+
+def on_shutdown(func: Callable[[], None]) -> Callable[[], None]:
+    """Зарегистрировать хук остановки; выполняются в обратном порядке"""
+    _shutdown_hooks.append(func)
+    return func
+
+
+def startup():
+    """Подготовить каталоги данных и выполнить хуки запуска импортированных сервисов"""
+    settings.ensure_directories()
+    for hook in list(_startup_hooks):
+        hook()
+
+
+def shutdown():
+    """Выполнить хуки остановки; ошибка одного хука не мешает остальным"""
+    for hook in reversed(_shutdown_hooks):
+        try:
+            hook()
+        except Exception as e:
+            print(f"⚠️  Ошибка при остановке ({getattr(hook, '__qualname__', hook)}): {e}")
@@ -0,0 +1,196 @@
+"""
+Кодирование JSON ответов API и сжатие gzip/brotli
+"""
+
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from app.core.config import settings
+from app.core.timing import timed
+
+# orjson в разы быстрее стандартного json, но необязателен
+try:
+    import orjson  # type: ignore
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import brotli  # type: ignore
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def dumps(data) -> bytes:
+    """Сериализовать в компактный UTF-8 JSON"""
+    if isinstance(data, PreEncoded):
+        return data.body
+    with timed("serialize"):
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Выбрать сжатие по заголовку Accept-Encoding: br, затем gzip"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and not BROTLI_AVAILABLE:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Сжать тело ответа выбранным алгоритмом"""
+    with timed("compress"):
+        if encoding == "br":
+            return brotli.compress(body, quality=settings.BROTLI_QUALITY)
+        if encoding == "gzip":
+            return gzip.compress(body, compresslevel=settings.GZIP_LEVEL, mtime=0)
+    return body
+
+
+class PreEncoded:
+    """Уже сериализованный ответ; сжатые варианты вычисляются один раз и кэшируются"""
+
+    def __init__(self, data=None, body: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None):
+        self.body = body if body is not None else dumps(data)
+        self.headers = headers or {}
+        self._variants: Dict[str, bytes] = {}
+
+    def variant(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        compressed = self._variants.get(encoding)
+        if compressed is None:
+            compressed = self._variants[encoding] = compress(self.body, encoding)
+        return compressed
+
+
+def encode_response(data, accept_encoding: Optional[str] = None) -> Tuple[bytes, Dict[str, str]]:
+    """Тело ответа и заголовки: JSON, сжатый если клиент согласен и ответ крупнее порога"""
+    payload = data if isinstance(data, PreEncoded) else PreEncoded(data)
+    headers = {"Content-Type": f"{JSON_MEDIA_TYPE}; charset=utf-8", **payload.headers}
+    encoding = None
+    if len(payload.body) >= settings.COMPRESSION_MIN_SIZE:
+        encoding = negotiate_encoding(accept_encoding)
+        headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return payload.variant(encoding), headers
+
+
+class ResponseCache:
+    """LRU кэш сериализованных ответов (ключ включает поколение данных)"""
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or settings.RESPONSE_CACHE_SIZE
+        self._items: "OrderedDict[Hashable, PreEncoded]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, build) -> PreEncoded:
+        """Готовый ответ по ключу; build() возвращает PreEncoded и вызывается только при промахе"""
+        with self._lock:
+            payload = self._items.get(key)
+            if payload is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return payload
+        payload = build()
+        with self._lock:
+            self.misses += 1
+            self._items[key] = payload
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return payload
+
+
+class CompressionMiddleware:
+    """ASGI middleware: сжатие gzip/brotli ответов крупнее порога
+
+    Потоковые ответы и ответы, уже имеющие Content-Encoding, пропускаются без изменений.
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size or settings.COMPRESSION_MIN_SIZE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope.get("headers") or [])
+        encoding = negotiate_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            headers = start.get("headers") or []
+            body = message.get("body", b"")
+            already_encoded = any(name.lower() == b"content-encoding" for name, _ in headers)
+            if message.get("more_body") or already_encoded or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# Класс ответа FastAPI с тем же кодировщиком
+try:
+    from starlette.responses import JSONResponse
+
+    class FastJSONResponse(JSONResponse):
+        """JSON ответ через orjson (или компактный json)"""
+
+        def render(self, content) -> bytes:
+            return dumps(content)
+except ImportError:
+    FastJSONResponse = None  # type: ignore
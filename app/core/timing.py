@@ -0,0 +1,234 @@
+"""
+Замеры времени запросов API и вызовов libvirt: заголовок Server-Timing,
+статистика по маршрутам и операциям, журнал медленных вызовов
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+
+class RequestTimings:
+    """Время фаз одного запроса (libvirt, xml, serialize, compress)
+
+    Фазы, выполненные в потоках без контекста запроса (пулы массовых
+    операций), в заголовок не попадают, но учитываются в общей статистике.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, List] = {}  # фаза -> [секунд, вызовов]
+
+    def add(self, phase: str, seconds: float):
+        entry = self.phases.setdefault(phase, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def header(self) -> str:
+        """Значение Server-Timing; app — время запроса вне измеренных фаз"""
+        total = time.perf_counter() - self.started
+        parts = []
+        for phase, (seconds, count) in self.phases.items():
+            parts.append(f'{phase};dur={seconds * 1000:.2f};desc="{count}"')
+        measured = sum(seconds for seconds, _ in self.phases.values())
+        parts.append(f"app;dur={max(total - measured, 0) * 1000:.2f}")
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_timings", default=None)
+
+
+def begin_request() -> contextvars.Token:
+    """Начать замер запроса в текущем контексте (sync-маршруты FastAPI получают копию контекста)"""
+    return _current.set(RequestTimings())
+
+
+def current_request() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def end_request(token: contextvars.Token):
+    _current.reset(token)
+
+
+def _percentile(samples: List[float], p: float) -> Optional[float]:
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2)
+
+
+class TimingStats:
+    """Накопленная статистика процесса: маршруты API, вызовы libvirt по операциям, медленные вызовы"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes: Dict[str, Dict] = {}
+        self.calls: Dict[str, Dict] = {}
+        self.phases: Dict[str, Dict] = {}
+        self.slow_calls = deque(maxlen=settings.SLOW_CALL_LOG_SIZE)
+        self.since = datetime.now().isoformat()
+
+    def record_call(self, operation: str, domain: Optional[str], seconds: float, error: bool = False):
+        """Вызов libvirt: в статистику операции, в фазу libvirt запроса и в журнал, если он медленный"""
+        request = _current.get()
+        if request is not None:
+            request.add("libvirt", seconds)
+        slow = seconds * 1000 >= settings.SLOW_CALL_THRESHOLD_MS
+        with self._lock:
+            entry = self.calls.get(operation)
+            if entry is None:
+                entry = self.calls[operation] = {"count": 0, "errors": 0, "total": 0.0, "max": 0.0, "slow": 0}
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            if error:
+                entry["errors"] += 1
+            if slow:
+                entry["slow"] += 1
+                self.slow_calls.append({
+                    "time": datetime.now().isoformat(),
+                    "operation": operation,
+                    "domain": domain,
+                    "duration_ms": round(seconds * 1000, 2),
+                    "error": error,
+                })
+        if slow:
+            print(f"🐢 Медленный вызов libvirt {operation}" + (f" ({domain})" if domain else "") +
+                  f": {seconds * 1000:.0f} мс")
+
+    def record_phase(self, phase: str, seconds: float):
+        request = _current.get()
+        if request is not None:
+            request.add(phase, seconds)
+        with self._lock:
+            entry = self.phases.setdefault(phase, {"count": 0, "total": 0.0})
+            entry["count"] += 1
+            entry["total"] += seconds
+
+    def record_route(self, route: str, seconds: float, status: int):
+        with self._lock:
+            entry = self.routes.get(route)
+            if entry is None:
+                entry = self.routes[route] = {
+                    "count": 0, "errors": 0, "total": 0.0, "max": 0.0,
+                    "samples": deque(maxlen=settings.TIMING_ROUTE_SAMPLES),
+                }
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["samples"].append(seconds)
+            if status >= 500:
+                entry["errors"] += 1
+
+    def get_stats(self) -> Dict:
+        """Маршруты с перцентилями по последним TIMING_ROUTE_SAMPLES запросам и операции libvirt по суммарному времени"""
+        with self._lock:
+            routes = {}
+            for route, entry in self.routes.items():
+                samples = sorted(entry["samples"])
+                routes[route] = {
+                    "count": entry["count"],
+                    "errors": entry["errors"],
+                    "mean_ms": round(entry["total"] / entry["count"] * 1000, 2),
+                    "p50_ms": _percentile(samples, 0.50),
+                    "p95_ms": _percentile(samples, 0.95),
+                    "p99_ms": _percentile(samples, 0.99),
+                    "max_ms": round(entry["max"] * 1000, 2),
+                }
+            calls = {
+                operation: {
+                    "count": entry["count"],
+                    "errors": entry["errors"],
+                    "slow": entry["slow"],
+                    "total_ms": round(entry["total"] * 1000, 2),
+                    "mean_ms": round(entry["total"] / entry["count"] * 1000, 3),
+                    "max_ms": round(entry["max"] * 1000, 2),
+                }
+                for operation, entry in sorted(self.calls.items(), key=lambda item: -item[1]["total"])
+            }
+            phases = {phase: {"count": entry["count"], "total_ms": round(entry["total"] * 1000, 2)}
+                      for phase, entry in self.phases.items()}
+            return {
+                "since": self.since,
+                "slow_threshold_ms": settings.SLOW_CALL_THRESHOLD_MS,
+                "routes": routes,
+                "libvirt_calls": calls,
+                "phases": phases,
+            }
+
+    def get_slow_calls(self, limit: int = 100, domain: Optional[str] = None) -> List[Dict]:
+        """Последние медленные вызовы, новые первыми"""
+        with self._lock:
+            entries = [entry for entry in reversed(self.slow_calls) if domain is None or entry["domain"] == domain]
+        return entries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+            self.calls.clear()
+            self.phases.clear()
+            self.slow_calls.clear()
+            self.since = datetime.now().isoformat()
+
+
+# Глобальный экземпляр статистики
+timing_stats = TimingStats()
+
+
+@contextmanager
+def timed(phase: str):
+    """Замерить фазу запроса (xml, serialize...)"""
+    if not settings.TIMING_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing_stats.record_phase(phase, time.perf_counter() - started)
+
+
+class TimingMiddleware:
+    """ASGI middleware: время каждого запроса по шаблону маршрута и заголовок Server-Timing
+
+    Подключается внешним слоем, чтобы в total вошли сериализация и сжатие.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TIMING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        token = begin_request()
+        timings = current_request()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", timings.header().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_request(token)
+            # Шаблон пути (/api/vms/{vm_name}), а не сам путь: иначе маршрут на каждую ВМ
+            route = getattr(scope.get("route"), "path", None)
+            if route is None:
+                route = "unmatched" if status == 404 else scope.get("path", "")
+            timing_stats.record_route(f"{scope.get('method', 'GET')} {route}", time.perf_counter() - timings.started,
+                                      status)
@@ -8,9 +8,14 @@ class VMCreate(BaseModel):
     name: str = Field(..., description="Имя виртуальной машины")
     memory: int = Field(1024, description="Объем оперативной памяти в МБ", ge=512)
     vcpus: int = Field(1, description="Количество виртуальных процессоров", ge=1, le=16)
+    max_vcpus: Optional[int] = Field(None, description="Максимум vCPU для горячего добавления (по умолчанию VM_MAX_VCPUS)", ge=1)
+    max_memory: Optional[int] = Field(None, description="Максимум памяти в МБ для горячего добавления DIMM", ge=512)
     disk_size: int = Field(10, description="Размер диска в ГБ", ge=5)
     iso_path: Optional[str] = Field(None, description="Путь к ISO образу для установки")
     network: str = Field("default", description="Сетевая конфигурация")
+    os_type: Optional[str] = Field(None, description="Операционная система гостя")
+    owner: Optional[str] = Field(None, description="Владелец ВМ")
+    tags: Optional[List[str]] = Field(None, description="Теги ВМ")
     
     class Config:
         schema_extra = {
@@ -106,11 +111,28 @@ class NetworkInfo(BaseModel):
     autostart: bool = Field(..., description="Автозапуск")
 
 
+class VMResize(BaseModel):
+    """Изменение vCPU и памяти ВМ (на лету, если возможно)"""
+    vcpus: Optional[int] = Field(None, description="Количество vCPU", ge=1)
+    memory: Optional[int] = Field(None, description="Объем памяти в МБ", ge=256)
+    live: bool = Field(True, description="Применить к запущенной ВМ; false — только конфигурация")
+
+
+class VMMetadataUpdate(BaseModel):
+    """Изменение сохраненных метаданных ВМ"""
+    os: Optional[str] = Field(None, description="Операционная система гостя")
+    owner: Optional[str] = Field(None, description="Владелец ВМ")
+    tags: Optional[List[str]] = Field(None, description="Теги ВМ (заменяют текущие)")
+    priority: Optional[int] = Field(None, description="Приоритет запуска: больше — раньше при возврате после обслуживания хоста")
+
+
 # Схемы для снапшотов
 class SnapshotCreate(BaseModel):
     """Создание снапшота"""
     name: str = Field(..., description="Имя снапшота")
     description: Optional[str] = Field(None, description="Описание снапшота")
+    include_memory: bool = Field(False, description="Сохранить состояние памяти запущенной ВМ")
+    quiesce: bool = Field(False, description="Заморозить ФС гостя через guest agent")
 
 
 class SnapshotInfo(BaseModel):
@@ -119,3 +141,144 @@ class SnapshotInfo(BaseModel):
     description: Optional[str] = Field(None, description="Описание")
     created: datetime = Field(..., description="Дата создания")
     state: str = Field(..., description="Состояние ВМ в момент снапшота")
+    parent: Optional[str] = Field(None, description="Родительский снапшот")
+    current: bool = Field(False, description="Текущий снапшот")
+    memory: bool = Field(False, description="Сохранено состояние памяти")
+    disks: Optional[List[Dict[str, Any]]] = Field(None, description="Overlay файлы дисков")
+
+
+# Схемы для клонов
+class CloneCreate(BaseModel):
+    """Создание связанного клона"""
+    name: str = Field(..., description="Имя новой ВМ")
+    start: bool = Field(False, description="Запустить клон после создания")
+    flatten: bool = Field(False, description="Сразу запустить фоновое превращение в полную копию")
+
+
+# Схемы для бэкапов
+class BackupCreate(BaseModel):
+    """Запуск бэкапа"""
+    mode: str = Field("auto", description="Режим: auto, full или incremental")
+
+
+class BackupRestore(BaseModel):
+    """Восстановление из бэкапа"""
+    format: str = Field("qcow2", description="Формат восстановленных дисков: qcow2 или raw")
+    target_dir: Optional[str] = Field(None, description="Каталог для восстановленных дисков")
+
+
+# Схемы для обслуживания дисков
+class DiskMaintenance(BaseModel):
+    """Обслуживание дисков выключенных ВМ"""
+    operation: str = Field(..., description="Операция: compact, sparsify или preallocate")
+    compress: bool = Field(False, description="Сжать qcow2 при compact")
+    preallocation: Optional[str] = Field(None, description="Режим preallocation: off, metadata, falloc, full")
+    vms: Optional[List[str]] = Field(None, description="Список ВМ (по умолчанию все выключенные)")
+
+
+class BulkPowerAction(BaseModel):
+    """Массовое действие питания над ВМ под селектором"""
+    action: str = Field(..., description="Действие: start, stop, force_stop или restart")
+    names: Optional[List[str]] = Field(None, description="Имена ВМ")
+    tags: Optional[List[str]] = Field(None, description="ВМ со всеми перечисленными тегами")
+    status: Optional[str] = Field(None, description="ВМ в статусе (running, stopped)")
+    all: bool = Field(False, description="Все ВМ (если не заданы names, tags и status)")
+    concurrency: Optional[int] = Field(None, description="Одновременных вызовов libvirt", ge=1)
+    wait: bool = Field(False, description="Ждать подтверждения состояния по событиям libvirt")
+    timeout: Optional[float] = Field(None, description="Срок ожидания в секундах", gt=0)
+    background: bool = Field(False, description="Выполнить фоновой задачей и вернуть job_id")
+
+
+# Схемы для ограничения ресурсов ВМ
+class CPUTune(BaseModel):
+    """Планировщик CPU (cputune)"""
+    shares: Optional[int] = Field(None, description="Относительный вес CPU (cpu_shares)", ge=2)
+    period: Optional[int] = Field(None, description="Период квоты vCPU, мкс", ge=1000, le=1000000)
+    quota: Optional[int] = Field(None, description="Квота vCPU за период, мкс (-1 — без ограничения)", ge=-1)
+
+
+class DiskIOTune(BaseModel):
+    """Ограничения диска (iotune), 0 — без ограничения"""
+    total_iops_sec: Optional[int] = Field(None, ge=0)
+    read_iops_sec: Optional[int] = Field(None, ge=0)
+    write_iops_sec: Optional[int] = Field(None, ge=0)
+    total_bytes_sec: Optional[int] = Field(None, ge=0)
+    read_bytes_sec: Optional[int] = Field(None, ge=0)
+    write_bytes_sec: Optional[int] = Field(None, ge=0)
+
+
+class InterfaceBandwidth(BaseModel):
+    """Ограничения сетевого интерфейса (bandwidth): average/peak в КиБ/с, burst в КиБ"""
+    inbound_average: Optional[int] = Field(None, ge=0)
+    inbound_peak: Optional[int] = Field(None, ge=0)
+    inbound_burst: Optional[int] = Field(None, ge=0)
+    outbound_average: Optional[int] = Field(None, ge=0)
+    outbound_peak: Optional[int] = Field(None, ge=0)
+    outbound_burst: Optional[int] = Field(None, ge=0)
+
+
+class VMTuning(BaseModel):
+    """Ограничения ресурсов ВМ; применяются к запущенной ВМ и к конфигурации домена"""
+    cpu: Optional[CPUTune] = Field(None, description="CPU shares и period/quota")
+    blkio_weight: Optional[int] = Field(None, description="Вес блочного ввода-вывода (blkiotune)", ge=100, le=1000)
+    disks: Optional[Dict[str, DiskIOTune]] = Field(None, description="target диска (или \"*\" — все диски) -> ограничения")
+    interfaces: Optional[Dict[str, InterfaceBandwidth]] = Field(None, description="MAC, dev запущенной ВМ или \"*\" -> ограничения")
+
+
+class BulkTuning(VMTuning):
+    """Ограничения ресурсов для ВМ под селектором"""
+    names: Optional[List[str]] = Field(None, description="Имена ВМ")
+    tags: Optional[List[str]] = Field(None, description="ВМ со всеми перечисленными тегами")
+    status: Optional[str] = Field(None, description="ВМ в статусе (running, stopped)")
+    all: bool = Field(False, description="Все ВМ (если не заданы names, tags и status)")
+    concurrency: Optional[int] = Field(None, description="Одновременных вызовов libvirt", ge=1)
+
+
+# Схемы для обслуживания хоста
+class HostDrain(BaseModel):
+    """Остановка всех ВМ хоста перед обслуживанием"""
+    wave_size: Optional[int] = Field(None, description="ВМ в одной волне остановки", ge=1)
+    shutdown_timeout: Optional[float] = Field(None, description="Срок штатного выключения до destroy, сек", ge=0)
+    force_timeout: Optional[float] = Field(None, description="Срок ожидания после destroy, сек", gt=0)
+
+
+class HostRestore(BaseModel):
+    """Возврат ВМ, работавших до остановки хоста"""
+    drain_id: Optional[str] = Field(None, description="ID остановки (по умолчанию — последняя невозвращенная)")
+    concurrency: Optional[int] = Field(None, description="Одновременных запусков в группе приоритета", ge=1)
+    timeout: Optional[float] = Field(None, description="Срок запуска группы перед следующей, сек", gt=0)
+
+
+# Схемы для балансировщика памяти
+class BalloonBounds(BaseModel):
+    """Границы памяти ВМ для balloon-балансировщика"""
+    min_mib: Optional[int] = Field(None, description="Минимальный объем памяти в МБ", ge=128)
+    max_mib: Optional[int] = Field(None, description="Максимальный объем памяти в МБ", ge=128)
+
+
+# Схемы для контроллера шумных соседей
+class ThrottlePolicyUpdate(BaseModel):
+    """Изменение политики ресурса (cpu или io); неуказанные поля не меняются"""
+    engage_pressure: Optional[float] = Field(None, description="Давление на ресурс хоста, с которого ВМ ограничиваются", ge=0, le=1)
+    release_pressure: Optional[float] = Field(None, description="Давление, ниже которого ограничения снимаются", ge=0, le=1)
+    min_share: Optional[float] = Field(None, description="Минимальная доля ВМ в нагрузке хоста для ограничения", ge=0, le=1)
+    trigger: Optional[int] = Field(None, description="Интервалов подряд до ограничения", ge=1)
+    release: Optional[int] = Field(None, description="Интервалов подряд до снятия ограничения", ge=1)
+    shares: Optional[int] = Field(None, description="cpu: cpu_shares ограниченной ВМ", ge=2)
+    iops_factor: Optional[float] = Field(None, description="io: лимит IOPS как доля текущих IOPS ВМ", gt=0, le=1)
+    min_iops: Optional[int] = Field(None, description="io: нижняя граница лимита IOPS", ge=1)
+
+
+# Схемы для симулятора гипервизора (демо-режим)
+class SimulatorUpdate(BaseModel):
+    """Задержки и сбои симулятора; 0 или null удаляет значение операции"""
+    latency: Optional[Dict[str, Optional[float]]] = Field(None, description="Задержка операции в секундах (start, shutdown, guest_shutdown, list...)")
+    failure_rate: Optional[Dict[str, Optional[float]]] = Field(None, description="Вероятность сбоя операции 0..1, \"*\" — всех операций")
+    jitter: Optional[float] = Field(None, description="Случайное отклонение задержки, доля", ge=0, lt=1)
+
+
+class SimulatorDomains(BaseModel):
+    """Добавление синтетических доменов в симулятор"""
+    count: int = Field(..., description="Число доменов", ge=1, le=100000)
+    running_ratio: float = Field(0.5, description="Доля запущенных доменов", ge=0, le=1)
+    prefix: str = Field("sim", description="Префикс имен доменов", pattern=r"^[A-Za-z0-9][A-Za-z0-9._-]{0,40}$")
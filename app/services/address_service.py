@@ -0,0 +1,201 @@
+import ipaddress
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.core.lifecycle import on_shutdown
+from app.core.timing import timed
+from app.services.libvirt_events import subscribe
+
+# Условный импорт libvirt только для Linux
+try:
+    import libvirt  # type: ignore
+    LIBVIRT_AVAILABLE = True
+except ImportError:
+    LIBVIRT_AVAILABLE = False
+    libvirt = None  # type: ignore
+
+
+# После этих событий адреса ВМ (и при переопределении — MAC) могут измениться
+_RESET_EVENTS = {"started", "stopped", "shutdown", "crashed", "resumed", "pmsuspended"}
+_REDEFINE_EVENTS = {"defined", "undefined"}
+
+
+def _usable(address: str) -> bool:
+    """Адрес, по которому к ВМ можно обратиться: без loopback и link-local"""
+    try:
+        ip = ipaddress.ip_address(address.split("%")[0])
+    except ValueError:
+        return False
+    return not (ip.is_loopback or ip.is_link_local)
+
+
+def _ordered(addresses: List[str]) -> List[str]:
+    """IPv4 первыми: ip_address — первый адрес списка"""
+    return sorted(dict.fromkeys(addresses), key=lambda address: ":" in address)
+
+
+class AddressResolver:
+    """IP-адреса ВМ для списка и карточки ВМ
+
+    Аренды DHCP всех активных сетей libvirt читаются одним вызовом на сеть и
+    сопоставляются с MAC интерфейсов ВМ. Гостевой агент
+    (org.qemu.guest_agent.0) опрашивается только для запущенных ВМ без
+    аренды (статический адрес, мостовая сеть) и в фоне: список ВМ не ждет
+    агента, найденный адрес появится в следующем срезе инвентаря.
+    Результаты кэшируются на ADDRESS_CACHE_TTL и сбрасываются событиями
+    жизненного цикла доменов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._macs: Dict[str, List[str]] = {}  # имя ВМ -> MAC интерфейсов
+        self._leases: Dict[str, List[str]] = {}  # MAC -> адреса из аренд
+        self._leases_at = 0.0
+        self._agent: Dict[str, Dict] = {}  # имя ВМ -> {"addresses", "time"}
+        self._pending: Set[str] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {"lease_refreshes": 0, "agent_queries": 0, "agent_failures": 0}
+        subscribe(self._on_event)
+
+    def _on_event(self, vm_name: str, event: str, detail=None):
+        if event in _RESET_EVENTS or event in _REDEFINE_EVENTS:
+            with self._lock:
+                self._agent.pop(vm_name, None)
+                if event in _REDEFINE_EVENTS:
+                    self._macs.pop(vm_name, None)
+                if event == "started":
+                    # Новая ВМ получит аренду в ближайшие секунды
+                    self._leases_at = 0.0
+
+    def invalidate(self, vm_name: Optional[str] = None):
+        """Сбросить кэш адресов одной ВМ или всех"""
+        with self._lock:
+            if vm_name is None:
+                self._macs.clear()
+                self._agent.clear()
+            else:
+                self._macs.pop(vm_name, None)
+                self._agent.pop(vm_name, None)
+            self._leases_at = 0.0
+
+    # Аренды DHCP
+
+    def _refresh_leases(self, conn):
+        """Перечитать аренды всех активных сетей, если кэш устарел"""
+        if time.monotonic() - self._leases_at < settings.ADDRESS_CACHE_TTL:
+            return
+        leases: Dict[str, List[str]] = {}
+        try:
+            networks = conn.listAllNetworks(libvirt.VIR_CONNECT_LIST_NETWORKS_ACTIVE)
+        except libvirt.libvirtError as e:
+            print(f"⚠️  Не удалось получить список сетей libvirt: {e}")
+            networks = []
+        for network in networks:
+            try:
+                for lease in network.DHCPLeases():
+                    if lease.get("mac") and lease.get("ipaddr"):
+                        leases.setdefault(lease["mac"].lower(), []).append(lease["ipaddr"])
+            except libvirt.libvirtError as e:
+                print(f"⚠️  Не удалось прочитать аренды сети {network.name()}: {e}")
+        with self._lock:
+            self._leases = leases
+            self._leases_at = time.monotonic()
+        self.stats["lease_refreshes"] += 1
+
+    def _domain_macs(self, domain, vm_name: str) -> List[str]:
+        """MAC интерфейсов ВМ (XML читается один раз до переопределения домена)"""
+        macs = self._macs.get(vm_name)
+        if macs is None:
+            try:
+                xml = domain.XMLDesc(0)
+            except libvirt.libvirtError:
+                return []
+            with timed("xml"):
+                root = ET.fromstring(xml)
+            macs = [mac.get("address").lower() for mac in root.findall("./devices/interface/mac") if mac.get("address")]
+            with self._lock:
+                self._macs[vm_name] = macs
+        return macs
+
+    # Гостевой агент
+
+    def _schedule_agent(self, vm_name: str):
+        with self._lock:
+            if vm_name in self._pending:
+                return
+            self._pending.add(vm_name)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=settings.ADDRESS_AGENT_WORKERS,
+                                                    thread_name_prefix="guest-agent")
+        self._executor.submit(self._query_agent, vm_name)
+
+    def _query_agent(self, vm_name: str):
+        from app.services.kvm_service import kvm_service
+        addresses: List[str] = []
+        try:
+            self.stats["agent_queries"] += 1
+            with kvm_service.pool.connection() as conn:
+                domain = conn.lookupByName(vm_name)
+                interfaces = domain.interfaceAddresses(libvirt.VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_AGENT, 0)
+            for name, interface in (interfaces or {}).items():
+                if name == "lo":
+                    continue
+                addresses.extend(item["addr"] for item in interface.get("addrs") or [] if _usable(item["addr"]))
+        except Exception:
+            # Агент не установлен или еще не запустился: повторим после TTL
+            self.stats["agent_failures"] += 1
+        finally:
+            with self._lock:
+                self._pending.discard(vm_name)
+                self._agent[vm_name] = {"addresses": _ordered(addresses), "time": time.monotonic()}
+
+        if addresses:
+            from app.services.inventory_service import vm_inventory
+            vm_inventory.invalidate()
+
+    # Разрешение
+
+    def annotate(self, conn, domains: List, vms: List[Dict]) -> List[Dict]:
+        """Добавить ip_address и ip_addresses к словарям ВМ (domains и vms — в одном порядке)"""
+        running = [(domain, vm) for domain, vm in zip(domains, vms) if vm.get("status") == "running"]
+        for vm in vms:
+            vm["ip_address"], vm["ip_addresses"] = None, []
+        if not running:
+            return vms
+
+        self._refresh_leases(conn)
+        now = time.monotonic()
+        for domain, vm in running:
+            name = vm["name"]
+            addresses = [ip for mac in self._domain_macs(domain, name) for ip in self._leases.get(mac, [])]
+            if not addresses:
+                cached = self._agent.get(name)
+                if cached is None or now - cached["time"] >= settings.ADDRESS_CACHE_TTL:
+                    self._schedule_agent(name)
+                addresses = cached["addresses"] if cached else []
+            addresses = _ordered(addresses)
+            vm["ip_address"] = addresses[0] if addresses else None
+            vm["ip_addresses"] = addresses
+        return vms
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "cached_vms": len(self._macs),
+                "leases": sum(len(addresses) for addresses in self._leases.values()),
+                "agent_pending": len(self._pending),
+            }
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+# Глобальный экземпляр сервиса
+address_resolver = AddressResolver()
+on_shutdown(address_resolver.stop)
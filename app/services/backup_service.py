@@ -0,0 +1,454 @@
+import hashlib
+import json
+import os
+import subprocess
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.kvm_service import kvm_service, LIBVIRT_AVAILABLE
+from app.services.job_service import job_manager
+from app.services.nbd_client import NBDClient
+from app.services import qemu_img
+
+if LIBVIRT_AVAILABLE:
+    import libvirt  # type: ignore
+    import xml.etree.ElementTree as ET
+
+# zstd быстрее и лучше сжимает, но необязателен
+try:
+    import zstandard  # type: ignore
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+MIB = 1024 * 1024
+CHECKPOINT_PREFIX = "backup-"
+
+
+class Codec:
+    """Алгоритм сжатия чанков бэкапа"""
+
+    def __init__(self, name: str, level: int):
+        if name == "zstd" and not ZSTD_AVAILABLE:
+            name = "zlib"
+        self.name = name
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        if self.name == "zlib":
+            return zlib.compress(data, self.level)
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return zstandard.ZstdDecompressor().decompress(data)
+        if self.name == "zlib":
+            return zlib.decompress(data)
+        return data
+
+
+class BackupWriter:
+    """Потоковая запись диска в pack-файл: чанки сжимаются параллельно, пишутся по порядку"""
+
+    def __init__(self, pack_path: Path, codec: Codec, chunk_size: Optional[int] = None,
+                 workers: Optional[int] = None):
+        self.pack_path = pack_path
+        self.codec = codec
+        self.chunk_size = chunk_size or settings.BACKUP_CHUNK_SIZE
+        self.workers = workers or settings.BACKUP_COMPRESSION_WORKERS
+        self._zero = bytes(self.chunk_size)
+
+    def _encode(self, data: bytes) -> Optional[Tuple[bytes, str]]:
+        # Выполняется в пуле: zlib/zstd и sha256 отпускают GIL на больших буферах
+        if data == self._zero[:len(data)]:
+            return None
+        return self.codec.compress(data), hashlib.sha256(data).hexdigest()
+
+    def write(self, read: Callable[[int, int], bytes], extents: Iterable[Tuple[int, int, str]],
+              progress: Optional[Callable[[int], None]] = None) -> Dict:
+        """Записать экстенты (offset, length, 'data'|'zero'); read(length, offset) читает диск"""
+        result = {"chunks": [], "zero_extents": [], "bytes_read": 0, "bytes_stored": 0}
+        window = deque()
+        max_inflight = self.workers * 2
+
+        with open(self.pack_path, "wb") as pack, ThreadPoolExecutor(self.workers) as pool:
+            def drain_one():
+                offset, length, future = window.popleft()
+                encoded = future.result()
+                if encoded is None:
+                    self._add_zero(result["zero_extents"], offset, length)
+                    return
+                payload, digest = encoded
+                result["chunks"].append({
+                    "offset": offset,
+                    "length": length,
+                    "pos": pack.tell(),
+                    "size": len(payload),
+                    "sha256": digest,
+                })
+                pack.write(payload)
+                result["bytes_stored"] += len(payload)
+
+            for offset, length, kind in extents:
+                if kind == "zero":
+                    self._add_zero(result["zero_extents"], offset, length)
+                    continue
+
+                end = offset + length
+                for chunk_offset in range(offset, end, self.chunk_size):
+                    chunk_length = min(self.chunk_size, end - chunk_offset)
+                    data = read(chunk_length, chunk_offset)
+                    result["bytes_read"] += chunk_length
+                    window.append((chunk_offset, chunk_length, pool.submit(self._encode, data)))
+                    if len(window) >= max_inflight:
+                        drain_one()
+                    if progress:
+                        progress(result["bytes_read"])
+
+            while window:
+                drain_one()
+
+        return result
+
+    @staticmethod
+    def _add_zero(zero_extents: List, offset: int, length: int):
+        if zero_extents and zero_extents[-1][0] + zero_extents[-1][1] == offset:
+            zero_extents[-1][1] += length
+        else:
+            zero_extents.append([offset, length])
+
+
+def restore_disk(chain: List[Tuple[Dict, Path]], disk: str, output, workers: Optional[int] = None):
+    """Наложить диск из цепочки бэкапов (полный, затем инкрементальные) на открытый файл"""
+    workers = workers or settings.BACKUP_COMPRESSION_WORKERS
+    fd = output.fileno()
+
+    for manifest, backup_dir in chain:
+        info = manifest["disks"].get(disk)
+        if info is None:
+            continue
+        codec = Codec(manifest["compression"], 0)
+
+        # Полный бэкап накладывается на пустой разреженный файл: нули уже на месте
+        zero_extents = info["zero_extents"] if manifest["type"] != "full" else []
+        for offset, length in zero_extents:
+            for pos in range(offset, offset + length, MIB):
+                os.pwrite(fd, bytes(min(MIB, offset + length - pos)), pos)
+
+        def decode(chunk, payload):
+            data = codec.decompress(payload)
+            if hashlib.sha256(data).hexdigest() != chunk["sha256"]:
+                raise ValueError(f"Повреждённый чанк {disk}@{chunk['offset']} в бэкапе {manifest['id']}")
+            return data
+
+        window = deque()
+        with open(backup_dir / f"{disk}.pack", "rb") as pack, ThreadPoolExecutor(workers) as pool:
+            for chunk in info["chunks"]:
+                pack.seek(chunk["pos"])
+                window.append((chunk, pool.submit(decode, chunk, pack.read(chunk["size"]))))
+                if len(window) >= workers * 2:
+                    done, future = window.popleft()
+                    os.pwrite(fd, future.result(), done["offset"])
+            while window:
+                done, future = window.popleft()
+                os.pwrite(fd, future.result(), done["offset"])
+
+
+class BackupService:
+    """Полные и инкрементальные бэкапы дисков ВМ"""
+
+    def __init__(self):
+        self.storage = Path(settings.BACKUP_STORAGE_PATH)
+
+    def _vm_dir(self, vm_name: str) -> Path:
+        return self.storage / vm_name
+
+    def list_backups(self, vm_name: str) -> List[Dict]:
+        """Бэкапы ВМ от старых к новым"""
+        backups = []
+        vm_dir = self._vm_dir(vm_name)
+        if not vm_dir.exists():
+            return backups
+        for manifest_path in vm_dir.glob("*/manifest.json"):
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            # Списки чанков не нужны в листинге
+            manifest["disks"] = {
+                name: {k: v for k, v in disk.items() if k not in ("chunks", "zero_extents")}
+                for name, disk in manifest["disks"].items()
+            }
+            backups.append(manifest)
+        return sorted(backups, key=lambda b: b["created"])
+
+    def _load_manifest(self, vm_name: str, backup_id: str) -> Dict:
+        with open(self._vm_dir(vm_name) / backup_id / "manifest.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _backup_chain(self, vm_name: str, backup_id: str) -> List[Tuple[Dict, Path]]:
+        """Цепочка от полного бэкапа до указанного"""
+        chain = []
+        current = backup_id
+        while current:
+            manifest = self._load_manifest(vm_name, current)
+            chain.append((manifest, self._vm_dir(vm_name) / current))
+            current = manifest.get("parent")
+        return chain[::-1]
+
+    def start_backup(self, vm_name: str, mode: str = "auto") -> Dict:
+        """Запустить бэкап ВМ: full, incremental или auto (инкрементальный, если возможно)"""
+        if mode not in ("auto", "full", "incremental"):
+            return {"success": False, "message": "Режим бэкапа должен быть auto, full или incremental"}
+
+        if kvm_service.demo_mode:
+            return kvm_service._demo_vm_action(vm_name, "backup")
+
+        try:
+            kvm_service.conn.lookupByName(vm_name)
+        except Exception as e:
+            return {"success": False, "message": f"ВМ не найдена: {e}"}
+
+        if job_manager.is_busy(vm_name):
+            return {"success": False, "message": f"Для ВМ {vm_name} уже выполняется фоновая задача"}
+
+        job = job_manager.submit("backup", vm_name, self._backup_job, vm_name, mode)
+        return {"success": True, "message": f"Бэкап ВМ {vm_name} запущен", "job_id": job["id"]}
+
+    def _find_parent(self, domain, vm_name: str) -> Optional[Dict]:
+        """Последний бэкап, чей checkpoint еще существует в libvirt"""
+        backups = self.list_backups(vm_name)
+        if not backups or not backups[-1].get("checkpoint"):
+            return None
+        try:
+            domain.checkpointLookupByName(backups[-1]["checkpoint"])
+        except libvirt.libvirtError:
+            return None
+        return backups[-1]
+
+    def _backup_job(self, job: Dict, vm_name: str, mode: str) -> Dict:
+        domain = kvm_service.conn.lookupByName(vm_name)
+        active = domain.isActive()
+        disks = [d for d in kvm_service.get_domain_disks(domain, inactive=not active) if d["format"] == "qcow2"]
+
+        parent = None if mode == "full" else self._find_parent(domain, vm_name)
+        if mode == "incremental" and parent is None:
+            raise RuntimeError("Нет базового бэкапа с checkpoint для инкрементального бэкапа")
+
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        backup_id = f"{stamp}-{'inc' if parent else 'full'}"
+        checkpoint = f"{CHECKPOINT_PREFIX}{stamp}"
+        backup_dir = self._vm_dir(vm_name) / backup_id
+        backup_dir.mkdir(parents=True, exist_ok=True)
+
+        codec = Codec(settings.BACKUP_COMPRESSION, settings.BACKUP_COMPRESSION_LEVEL)
+        manifest = {
+            "id": backup_id,
+            "vm_name": vm_name,
+            "created": datetime.now().isoformat(),
+            "type": "incremental" if parent else "full",
+            "parent": parent["id"] if parent else None,
+            "checkpoint": None,
+            "compression": codec.name,
+            "chunk_size": settings.BACKUP_CHUNK_SIZE,
+            "disks": {},
+        }
+
+        started = time.time()
+        total_size = 0
+        export = self._pull_export if active else self._offline_export
+        with export(domain, disks, parent["checkpoint"] if parent else None, checkpoint) as exports:
+            for disk in disks:
+                job["message"] = f"{manifest['type']} {disk['target']}"
+                result = self._backup_disk(
+                    *exports[disk["target"]], backup_dir / f"{disk['target']}.pack", codec,
+                    progress=lambda percent: job.update(progress=percent)
+                )
+                manifest["disks"][disk["target"]] = dict(result, source=disk["source"])
+                total_size += result["virtual_size"]
+
+            if active:
+                manifest["checkpoint"] = checkpoint
+            else:
+                # Для выключенной ВМ checkpoint создается после чтения: записей в диск не было
+                try:
+                    domain.checkpointCreateXML(self._checkpoint_xml(checkpoint, disks), 0)
+                    manifest["checkpoint"] = checkpoint
+                except libvirt.libvirtError as e:
+                    # Следующий бэкап будет полным
+                    print(f"⚠️  Бэкап {vm_name}: checkpoint не создан: {e}")
+        duration = time.time() - started
+        bytes_read = sum(d["bytes_read"] for d in manifest["disks"].values())
+        bytes_stored = sum(d["bytes_stored"] for d in manifest["disks"].values())
+        manifest["stats"] = {
+            "duration": round(duration, 3),
+            "virtual_size": total_size,
+            "bytes_read": bytes_read,
+            "bytes_stored": bytes_stored,
+            "throughput_mib_s": round(bytes_read / MIB / max(duration, 1e-6), 2),
+            "compression_ratio": round(bytes_stored / bytes_read, 4) if bytes_read else None,
+        }
+
+        with open(backup_dir / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        # Нужен только последний checkpoint: старые bitmap замедляют запись гостя
+        if parent:
+            try:
+                domain.checkpointLookupByName(parent["checkpoint"]).delete(0)
+            except libvirt.libvirtError:
+                pass
+
+        return {"backup_id": backup_id, "type": manifest["type"], "stats": manifest["stats"]}
+
+    def _backup_disk(self, socket_path: str, export_name: str, bitmap: Optional[str], pack_path: Path,
+                     codec: Codec, progress: Optional[Callable[[int], None]] = None) -> Dict:
+        """Записать экстенты одного NBD экспорта в pack-файл; progress получает проценты"""
+        # Карта читается до подключения клиента: qemu-nbd без --shared обслуживает одного клиента за раз,
+        # и qemu-img map при открытом NBDClient ждал бы вечно
+        extents = self._read_extents(socket_path, export_name, bitmap)
+        to_read = max(sum(length for _, length, _ in extents), 1)
+
+        with NBDClient(socket_path, export_name) as client:
+            result = BackupWriter(pack_path, codec).write(
+                client.pread, extents,
+                progress=(lambda done: progress(int(done * 100 / to_read))) if progress else None
+            )
+        result["virtual_size"] = client.size
+        return result
+
+    def _read_extents(self, socket_path: str, export_name: str, bitmap: Optional[str]) -> List[Tuple[int, int, str]]:
+        """Экстенты для чтения: выделенные (полный) или измененные (инкрементальный)"""
+        opts = f"driver=nbd,server.type=unix,server.path={socket_path},export={export_name}"
+        if bitmap:
+            # С x-dirty-bitmap qemu-img map инвертирует смысл: data=false — измененный блок
+            opts += f",x-dirty-bitmap={bitmap}"
+
+        extents = []
+        for entry in qemu_img.allocation_map(opts, image_opts=True):
+            wanted = not entry["data"] if bitmap else entry["data"]
+            if not wanted:
+                continue
+            if extents and extents[-1][0] + extents[-1][1] == entry["start"]:
+                extents[-1] = (extents[-1][0], extents[-1][1] + entry["length"], "data")
+            else:
+                extents.append((entry["start"], entry["length"], "data"))
+        return extents
+
+    def _checkpoint_xml(self, name: str, disks: List[Dict]) -> str:
+        root = ET.Element("domaincheckpoint")
+        ET.SubElement(root, "name").text = name
+        disks_el = ET.SubElement(root, "disks")
+        for disk in disks:
+            ET.SubElement(disks_el, "disk", name=disk["target"], checkpoint="bitmap")
+        return ET.tostring(root, encoding="unicode")
+
+    @contextmanager
+    def _pull_export(self, domain, disks: List[Dict], parent_checkpoint: Optional[str], checkpoint: str):
+        """Pull-mode бэкап libvirt: консистентный NBD экспорт запущенной ВМ"""
+        tmp_dir = self.storage / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        socket_path = str(tmp_dir / f"{domain.name()}.sock")
+
+        root = ET.Element("domainbackup", mode="pull")
+        if parent_checkpoint:
+            ET.SubElement(root, "incremental").text = parent_checkpoint
+        ET.SubElement(root, "server", transport="unix", socket=socket_path)
+        disks_el = ET.SubElement(root, "disks")
+        for disk in disks:
+            disk_el = ET.SubElement(disks_el, "disk", name=disk["target"], backup="yes", type="file")
+            ET.SubElement(disk_el, "scratch", file=str(tmp_dir / f"{domain.name()}-{disk['target']}.scratch"))
+
+        domain.backupBegin(ET.tostring(root, encoding="unicode"), self._checkpoint_xml(checkpoint, disks), 0)
+        try:
+            yield {
+                disk["target"]: (
+                    socket_path,
+                    disk["target"],
+                    f"qemu:dirty-bitmap:backup-{disk['target']}" if parent_checkpoint else None,
+                )
+                for disk in disks
+            }
+        finally:
+            # Завершение pull-mode бэкапа
+            domain.abortJob()
+
+    @contextmanager
+    def _offline_export(self, domain, disks: List[Dict], parent_checkpoint: Optional[str], checkpoint: str):
+        """qemu-nbd экспорт дисков выключенной ВМ (с bitmap checkpoint для инкремента)"""
+        tmp_dir = self.storage / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        processes = []
+        exports = {}
+        try:
+            for disk in disks:
+                socket_path = str(tmp_dir / f"{domain.name()}-{disk['target']}.sock")
+                cmd = ["qemu-nbd", "--read-only", "--persistent", "--format=qcow2",
+                       f"--socket={socket_path}", f"--export-name={disk['target']}"]
+                if parent_checkpoint:
+                    cmd.append(f"--bitmap={parent_checkpoint}")
+                cmd.append(disk["source"])
+                processes.append(subprocess.Popen(cmd, stderr=subprocess.PIPE))
+
+                deadline = time.time() + 10
+                while not os.path.exists(socket_path):
+                    if processes[-1].poll() is not None or time.time() > deadline:
+                        raise RuntimeError(f"qemu-nbd не запустился для {disk['target']}")
+                    time.sleep(0.05)
+
+                bitmap = f"qemu:dirty-bitmap:{parent_checkpoint}" if parent_checkpoint else None
+                exports[disk["target"]] = (socket_path, disk["target"], bitmap)
+            yield exports
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    def restore_backup(self, vm_name: str, backup_id: str, target_dir: Optional[str] = None,
+                       fmt: str = "qcow2") -> Dict:
+        """Запустить восстановление дисков из бэкапа в отдельные файлы"""
+        if fmt not in ("qcow2", "raw"):
+            return {"success": False, "message": "Формат восстановления должен быть qcow2 или raw"}
+        if not (self._vm_dir(vm_name) / backup_id / "manifest.json").exists():
+            return {"success": False, "message": f"Бэкап '{backup_id}' не найден"}
+
+        job = job_manager.submit("restore", vm_name, self._restore_job, vm_name, backup_id, target_dir, fmt)
+        return {"success": True, "message": f"Восстановление бэкапа '{backup_id}' запущено", "job_id": job["id"]}
+
+    def _restore_job(self, job: Dict, vm_name: str, backup_id: str, target_dir: Optional[str], fmt: str) -> Dict:
+        chain = self._backup_chain(vm_name, backup_id)
+        target = Path(target_dir or settings.VM_STORAGE_PATH)
+        target.mkdir(parents=True, exist_ok=True)
+
+        restored = {}
+        disks = chain[-1][0]["disks"]
+        for index, (disk, info) in enumerate(disks.items()):
+            job["message"] = f"restore {disk}"
+            raw_path = target / f"{vm_name}-restore-{backup_id}-{disk}.raw"
+            with open(raw_path, "wb") as output:
+                output.truncate(info["virtual_size"])
+                restore_disk(chain, disk, output)
+
+            if fmt == "qcow2":
+                qcow_path = raw_path.with_suffix(".qcow2")
+                qemu_img.run(["convert", "-q", "-f", "raw", "-O", "qcow2", str(raw_path), str(qcow_path)])
+                raw_path.unlink()
+                restored[disk] = str(qcow_path)
+            else:
+                restored[disk] = str(raw_path)
+            job["progress"] = int((index + 1) * 100 / len(disks))
+
+        return {"backup_id": backup_id, "chain": [m["id"] for m, _ in chain], "disks": restored}
+
+
+# Глобальный экземпляр сервиса
+backup_service = BackupService()
@@ -0,0 +1,318 @@
+import random
+import threading
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Optional
+
+from app.core.config import settings
+from app.core.lifecycle import LazyService, is_initialized, on_shutdown
+from app.services.kvm_service import kvm_service, LIBVIRT_AVAILABLE
+
+if LIBVIRT_AVAILABLE:
+    import libvirt  # type: ignore
+
+
+MIB = 1024  # KiB в MiB — libvirt отдает память в KiB
+
+
+def _read_host_memory() -> Dict:
+    """Общая и доступная память хоста в KiB"""
+    try:
+        import psutil
+        vm = psutil.virtual_memory()
+        return {"total": vm.total // 1024, "available": vm.available // 1024}
+    except ImportError:
+        pass
+
+    # Fallback без psutil: /proc/meminfo уже в KiB
+    meminfo = {}
+    with open("/proc/meminfo", encoding="utf-8") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            meminfo[key] = int(value.split()[0])
+    return {"total": meminfo["MemTotal"], "available": meminfo.get("MemAvailable", meminfo["MemFree"])}
+
+
+class LibvirtBalloonBackend:
+    """Доступ к balloon-статистике гостей через libvirt"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def enable_stats(self, period: int):
+        """Включить сбор статистики balloon у всех запущенных ВМ"""
+        flags = libvirt.VIR_DOMAIN_AFFECT_LIVE
+        for domain in self.service.conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE):
+            try:
+                domain.setMemoryStatsPeriod(period, flags)
+            except libvirt.libvirtError as e:
+                print(f"⚠️  Balloon: не удалось включить статистику для {domain.name()}: {e}")
+
+    def collect(self) -> List[Dict]:
+        """Прочитать статистику balloon всех запущенных ВМ одним запросом"""
+        records = self.service.conn.getAllDomainStats(
+            libvirt.VIR_DOMAIN_STATS_BALLOON,
+            libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE
+        )
+
+        guests = []
+        for domain, stats in records:
+            guests.append({
+                "name": domain.name(),
+                "current": stats.get("balloon.current"),
+                "maximum": stats.get("balloon.maximum"),
+                "unused": stats.get("balloon.unused"),
+                "available": stats.get("balloon.available"),
+            })
+        return guests
+
+    def host_memory(self) -> Dict:
+        return _read_host_memory()
+
+    def set_target(self, vm_name: str, target_kib: int):
+        domain = self.service.conn.lookupByName(vm_name)
+        domain.setMemoryFlags(target_kib, libvirt.VIR_DOMAIN_AFFECT_LIVE)
+
+
+class SimulatedBalloonBackend:
+    """Симулятор хоста с гостями для отладки политик без гипервизора"""
+
+    def __init__(self, host_total_mib: int = 16384, host_reserved_mib: int = 2048,
+                 guests: Optional[List[Dict]] = None, seed: Optional[int] = None):
+        self.host_total = host_total_mib * MIB
+        self.host_reserved = host_reserved_mib * MIB
+        self.random = random.Random(seed)
+        self.guests = {}
+
+        if guests is None:
+            guests = [
+                {"name": f"sim-vm-{i}", "maximum_mib": 4096, "used_mib": self.random.randint(512, 3072)}
+                for i in range(6)
+            ]
+        for guest in guests:
+            maximum = guest["maximum_mib"] * MIB
+            self.guests[guest["name"]] = {
+                "maximum": maximum,
+                "current": guest.get("current_mib", guest["maximum_mib"]) * MIB,
+                "used": guest["used_mib"] * MIB,
+            }
+
+    def enable_stats(self, period: int):
+        pass
+
+    def step(self):
+        """Случайное изменение нагрузки гостей между тиками"""
+        for guest in self.guests.values():
+            drift = self.random.randint(-256, 256) * MIB
+            guest["used"] = max(256 * MIB, min(guest["current"], guest["used"] + drift))
+
+    def collect(self) -> List[Dict]:
+        self.step()
+        return [
+            {
+                "name": name,
+                "current": guest["current"],
+                "maximum": guest["maximum"],
+                "unused": guest["current"] - guest["used"],
+                "available": guest["current"],
+            }
+            for name, guest in self.guests.items()
+        ]
+
+    def host_memory(self) -> Dict:
+        used = self.host_reserved + sum(g["current"] for g in self.guests.values())
+        return {"total": self.host_total, "available": max(0, self.host_total - used)}
+
+    def set_target(self, vm_name: str, target_kib: int):
+        guest = self.guests[vm_name]
+        guest["current"] = min(target_kib, guest["maximum"])
+        # Гость не может использовать больше, чем ему оставил balloon
+        guest["used"] = min(guest["used"], guest["current"])
+
+
+class BalloonService:
+    """Фоновый контроллер balloon-памяти для безопасного overcommit"""
+
+    def __init__(self, backend=None):
+        if backend is None:
+            if settings.BALLOON_SIMULATOR or kvm_service.demo_mode:
+                backend = SimulatedBalloonBackend()
+            else:
+                backend = LibvirtBalloonBackend(kvm_service)
+
+        self.backend = backend
+        self.dry_run = settings.BALLOON_DRY_RUN
+        self.bounds: Dict[str, Dict] = {}
+        self.decisions = deque(maxlen=settings.BALLOON_DECISION_LOG_SIZE)
+        self.last_run: Optional[str] = None
+        self.last_pressure: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def simulated(self) -> bool:
+        return isinstance(self.backend, SimulatedBalloonBackend)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def set_bounds(self, vm_name: str, min_mib: Optional[int] = None, max_mib: Optional[int] = None) -> Dict:
+        """Задать границы памяти ВМ для балансировщика"""
+        if min_mib is not None and max_mib is not None and min_mib > max_mib:
+            return {"success": False, "message": "Минимум памяти больше максимума"}
+
+        with self._lock:
+            self.bounds[vm_name] = {"min_mib": min_mib, "max_mib": max_mib}
+        return {"success": True, "message": f"Границы памяти для ВМ {vm_name} обновлены", "bounds": self.bounds[vm_name]}
+
+    def _guest_bounds(self, guest: Dict) -> Dict:
+        """Границы в KiB: заданные пользователем, ограниченные maxMemory домена"""
+        bounds = self.bounds.get(guest["name"], {})
+        maximum = guest["maximum"]
+
+        min_kib = (bounds.get("min_mib") or settings.BALLOON_MIN_MEMORY_MIB) * MIB
+        max_kib = maximum if bounds.get("max_mib") is None else min(bounds["max_mib"] * MIB, maximum)
+        return {"min": min(min_kib, max_kib), "max": max_kib}
+
+    def decide(self, guest: Dict, pressure: float) -> Optional[Dict]:
+        """Рассчитать новую цель balloon для одного гостя"""
+        current = guest["current"]
+        unused = guest.get("unused")
+        available = guest.get("available")
+        if not current or unused is None or available is None:
+            # Гость не отдает статистику (нет драйвера virtio-balloon)
+            return None
+
+        bounds = self._guest_bounds(guest)
+        used = max(0, available - unused)
+        step = settings.BALLOON_MAX_STEP_MIB * MIB
+
+        if unused < current * settings.BALLOON_GUEST_STARVING:
+            target, reason = current + step, "гость испытывает нехватку памяти"
+        elif pressure >= settings.BALLOON_PRESSURE_HIGH:
+            # Только сжатие: при нехватке памяти хоста гость не получает больше, чем у него есть
+            target = min(current, max(int(used * (1 + settings.BALLOON_GUEST_HEADROOM)), current - step))
+            reason = "высокая нагрузка на память хоста"
+        elif pressure <= settings.BALLOON_PRESSURE_LOW:
+            target, reason = current + step, "память хоста свободна"
+        else:
+            return None
+
+        target = max(bounds["min"], min(bounds["max"], target))
+        if abs(target - current) < settings.BALLOON_MIN_CHANGE_MIB * MIB:
+            return None
+
+        return {
+            "vm_name": guest["name"],
+            "action": "grow" if target > current else "shrink",
+            "from_kib": current,
+            "to_kib": target,
+            "used_kib": used,
+            "reason": reason,
+        }
+
+    def run_once(self) -> List[Dict]:
+        """Один цикл: собрать статистику, принять и применить решения"""
+        host = self.backend.host_memory()
+        pressure = 1 - host["available"] / host["total"] if host["total"] else 0.0
+        guests = self.backend.collect()
+
+        decisions = []
+        for guest in guests:
+            decision = self.decide(guest, pressure)
+            if decision is None:
+                continue
+
+            decision.update({
+                "timestamp": datetime.now().isoformat(),
+                "host_pressure": round(pressure, 4),
+                "dry_run": self.dry_run,
+                "simulated": self.simulated,
+                "applied": False,
+            })
+
+            if not self.dry_run:
+                try:
+                    self.backend.set_target(guest["name"], decision["to_kib"])
+                    decision["applied"] = True
+                except Exception as e:
+                    decision["error"] = str(e)
+
+            decisions.append(decision)
+
+        with self._lock:
+            self.decisions.extend(decisions)
+            self.last_run = datetime.now().isoformat()
+            self.last_pressure = round(pressure, 4)
+
+        return decisions
+
+    def _loop(self, interval: float):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️  Balloon: ошибка цикла балансировки: {e}")
+            self._stop_event.wait(interval)
+
+    def start(self, interval: Optional[float] = None) -> Dict:
+        """Запустить фоновый контроллер"""
+        if self.running:
+            return {"success": False, "message": "Балансировщик уже запущен"}
+
+        try:
+            self.backend.enable_stats(settings.BALLOON_STATS_PERIOD)
+        except Exception as e:
+            return {"success": False, "message": f"Ошибка включения статистики balloon: {e}"}
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._loop,
+            args=(interval or settings.BALLOON_INTERVAL,),
+            name="balloon-balancer",
+            daemon=True
+        )
+        self._thread.start()
+        return {"success": True, "message": "Балансировщик памяти запущен"}
+
+    def stop(self) -> Dict:
+        """Остановить фоновый контроллер"""
+        if not self.running:
+            return {"success": False, "message": "Балансировщик не запущен"}
+
+        self._stop_event.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        return {"success": True, "message": "Балансировщик памяти остановлен"}
+
+    def get_status(self) -> Dict:
+        """Состояние балансировщика"""
+        return {
+            "running": self.running,
+            "simulated": self.simulated,
+            "dry_run": self.dry_run,
+            "last_run": self.last_run,
+            "host_pressure": self.last_pressure,
+            "bounds": dict(self.bounds),
+        }
+
+    def get_decisions(self, limit: int = 100, vm_name: Optional[str] = None) -> List[Dict]:
+        """Журнал последних решений, новые первыми"""
+        with self._lock:
+            decisions = list(self.decisions)
+        if vm_name:
+            decisions = [d for d in decisions if d["vm_name"] == vm_name]
+        return decisions[::-1][:limit]
+
+
+# Глобальный экземпляр сервиса (выбор бэкенда требует подключения к libvirt — создается лениво)
+balloon_service = LazyService(BalloonService)
+
+
+@on_shutdown
+def _stop_balancer():
+    if is_initialized(balloon_service) and balloon_service.running:
+        balloon_service.stop()
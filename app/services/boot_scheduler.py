@@ -0,0 +1,296 @@
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.lifecycle import on_shutdown
+from app.services.job_service import job_manager
+from app.services.kvm_service import kvm_service
+from app.services.libvirt_events import subscribe
+
+
+# Классы приоритета в порядке обслуживания; critical допускается без учета нагрузки хоста
+PRIORITY_CLASSES = ("critical", "high", "normal", "low")
+
+# События, после которых ВМ больше не загружается и освобождает слот
+_RELEASE_EVENTS = {"stopped", "shutdown", "crashed", "undefined"}
+
+
+def _read_cpu_times() -> Optional[Tuple[float, float, float]]:
+    """Накопленное время CPU хоста: (всего, занято, iowait)"""
+    try:
+        import psutil
+        times = psutil.cpu_times()
+        iowait = getattr(times, "iowait", 0.0)
+        idle = times.idle + iowait
+        total = sum(times)
+        return total, total - idle, iowait
+    except ImportError:
+        pass
+
+    # Fallback без psutil: первая строка /proc/stat (user nice system idle iowait irq softirq steal ...)
+    try:
+        with open("/proc/stat", encoding="utf-8") as f:
+            values = [float(v) for v in f.readline().split()[1:9]]
+    except (OSError, ValueError):
+        return None
+    idle, iowait = values[3], values[4]
+    total = sum(values)
+    return total, total - idle - iowait, iowait
+
+
+class HostLoad:
+    """Загрузка CPU и iowait хоста в процентах между двумя последними замерами"""
+
+    def __init__(self):
+        self._last: Optional[Tuple[float, float, float]] = None
+        self.cpu_percent: Optional[float] = None
+        self.iowait_percent: Optional[float] = None
+
+    def sample(self):
+        current = _read_cpu_times()
+        if current is None or self._last is None:
+            self._last = current
+            return
+        total = current[0] - self._last[0]
+        if total > 0:
+            self.cpu_percent = round((current[1] - self._last[1]) * 100 / total, 1)
+            self.iowait_percent = round((current[2] - self._last[2]) * 100 / total, 1)
+        self._last = current
+
+
+class BootScheduler:
+    """Допуск запусков ВМ при массовом старте (boot storm)
+
+    Запуски встают в очередь по классу приоритета и допускаются, пока число
+    загружающихся ВМ меньше BOOT_MAX_CONCURRENT, а iowait и загрузка CPU хоста
+    ниже порогов. ВМ считается загружающейся BOOT_SETTLE_TIME секунд после
+    старта (или до остановки). Если ничего не загружается, следующая ВМ
+    допускается при любой нагрузке, иначе очередь может встать навсегда.
+    """
+
+    def __init__(self):
+        self.tickets: Dict[str, Dict] = {}
+        self._queue: List[Tuple[int, int, str]] = []  # (класс, порядковый номер, id билета)
+        self._booting: Dict[str, float] = {}  # имя ВМ -> когда освободит слот (monotonic)
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stopped = False
+        self.load = HostLoad()
+        self.stats = {"admitted": 0, "held_by_load": 0, "failed": 0, "cancelled": 0}
+        subscribe(self._on_event)
+
+    def _on_event(self, vm_name: str, event: str, detail=None):
+        if event in _RELEASE_EVENTS:
+            with self._cond:
+                if self._booting.pop(vm_name, None) is not None:
+                    self._cond.notify_all()
+
+    def _ensure_dispatcher(self):
+        # Поток и пул создаются при первом запуске, а не при импорте (под self._cond)
+        if self._dispatcher is None:
+            self._executor = ThreadPoolExecutor(max_workers=settings.BOOT_MAX_CONCURRENT, thread_name_prefix="boot")
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="boot-scheduler", daemon=True)
+            self._dispatcher.start()
+
+    # Очередь
+
+    def submit(self, vm_name: str, priority: str = "normal") -> Dict:
+        """Поставить запуск ВМ в очередь и вернуть билет"""
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Класс приоритета должен быть одним из: {', '.join(PRIORITY_CLASSES)}")
+        if job_manager.is_busy(vm_name, "disk-"):
+            raise ValueError(f"Для ВМ {vm_name} выполняется обслуживание дисков")
+        with self._cond:
+            for ticket in self.tickets.values():
+                if ticket["vm_name"] == vm_name and ticket["status"] in ("queued", "starting"):
+                    return self._view(ticket)
+            ticket = {
+                "id": uuid.uuid4().hex[:12],
+                "vm_name": vm_name,
+                "priority": priority,
+                "status": "queued",
+                "result": None,
+                "enqueued": datetime.now().isoformat(),
+                "admitted": None,
+                "_enqueued_at": time.monotonic(),
+                "_done": threading.Event(),
+            }
+            self.tickets[ticket["id"]] = ticket
+            heapq.heappush(self._queue, (PRIORITY_CLASSES.index(priority), next(self._order), ticket["id"]))
+            self._trim()
+            self._ensure_dispatcher()
+            self._cond.notify_all()
+            return self._view(ticket)
+
+    def start(self, vm_name: str, priority: str = "normal", timeout: Optional[float] = None) -> Dict:
+        """Запустить ВМ через очередь и дождаться результата start_vm"""
+        ticket_id = self.submit(vm_name, priority)["id"]
+        ticket = self.tickets[ticket_id]
+        if not ticket["_done"].wait(timeout):
+            return {"success": False, "message": f"ВМ {vm_name} ожидает запуска в очереди", **self._view(ticket)}
+        result = dict(ticket["result"] or {"success": False, "message": f"Запуск ВМ {vm_name} отменен"})
+        result["queued_for"] = ticket.get("queued_for")
+        result["ticket_id"] = ticket_id
+        return result
+
+    def cancel(self, ticket_id: str) -> Dict:
+        """Убрать из очереди еще не допущенный запуск"""
+        with self._cond:
+            ticket = self.tickets.get(ticket_id)
+            if ticket is None:
+                raise LookupError(f"Билет {ticket_id} не найден")
+            if ticket["status"] != "queued":
+                return {"success": False, "message": f"Запуск уже в состоянии {ticket['status']}"}
+            self._queue = [item for item in self._queue if item[2] != ticket_id]
+            heapq.heapify(self._queue)
+            ticket["status"] = "cancelled"
+            ticket["_done"].set()
+            self.stats["cancelled"] += 1
+            return {"success": True, "message": f"Запуск ВМ {ticket['vm_name']} отменен"}
+
+    def _trim(self):
+        """Ограничить историю завершенных билетов (под self._cond)"""
+        finished = [t for t in self.tickets.values() if t["status"] in ("started", "failed", "cancelled")]
+        for ticket in finished[:max(0, len(finished) - settings.BOOT_HISTORY_SIZE)]:
+            self.tickets.pop(ticket["id"], None)
+
+    # Допуск
+
+    def _release_expired(self):
+        now = time.monotonic()
+        for vm_name, until in list(self._booting.items()):
+            if until <= now:
+                del self._booting[vm_name]
+
+    def _admissible(self, priority: int) -> bool:
+        """Можно ли допустить запуск класса priority (под self._cond)"""
+        if len(self._booting) >= settings.BOOT_MAX_CONCURRENT:
+            return False
+        if not self._booting or PRIORITY_CLASSES[priority] == "critical":
+            return True
+        iowait, cpu = self.load.iowait_percent, self.load.cpu_percent
+        if iowait is not None and iowait > settings.BOOT_MAX_IOWAIT:
+            return False
+        if cpu is not None and cpu > settings.BOOT_MAX_CPU:
+            return False
+        return True
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                self._release_expired()
+                while self._queue:
+                    if not self._admissible(self._queue[0][0]):
+                        if len(self._booting) < settings.BOOT_MAX_CONCURRENT:
+                            self.stats["held_by_load"] += 1
+                        break
+                    _, _, ticket_id = heapq.heappop(self._queue)
+                    ticket = self.tickets.get(ticket_id)
+                    if ticket is None or ticket["status"] != "queued":
+                        continue
+                    ticket["status"] = "starting"
+                    ticket["admitted"] = datetime.now().isoformat()
+                    ticket["queued_for"] = round(time.monotonic() - ticket["_enqueued_at"], 3)
+                    self._booting[ticket["vm_name"]] = time.monotonic() + settings.BOOT_SETTLE_TIME
+                    self.stats["admitted"] += 1
+                    self._executor.submit(self._boot, ticket)
+                self._cond.wait(settings.BOOT_SAMPLE_INTERVAL)
+            self.load.sample()
+
+    def _boot(self, ticket: Dict):
+        try:
+            result = kvm_service.start_vm(ticket["vm_name"])
+        except Exception as e:
+            result = {"success": False, "message": str(e)}
+        with self._cond:
+            ticket["result"] = result
+            ticket["status"] = "started" if result.get("success") else "failed"
+            if not result.get("success"):
+                # ВМ не загружается — слот свободен сразу
+                self._booting.pop(ticket["vm_name"], None)
+                self.stats["failed"] += 1
+            ticket["_done"].set()
+            self._cond.notify_all()
+
+    # Состояние
+
+    def _expected_waits(self) -> Dict[str, float]:
+        """Оценка ожидания для билетов в очереди по лимиту одновременных загрузок (под self._cond)
+
+        Каждая ВМ занимает слот на BOOT_SETTLE_TIME; нагрузка хоста может
+        задержать допуск сверх оценки.
+        """
+        now = time.monotonic()
+        slots = sorted(max(until - now, 0.0) for until in self._booting.values())
+        slots += [0.0] * max(settings.BOOT_MAX_CONCURRENT - len(slots), 0)
+        heapq.heapify(slots)
+        waits = {}
+        for _, _, ticket_id in sorted(self._queue):
+            free_at = heapq.heappop(slots)
+            waits[ticket_id] = round(free_at, 1)
+            heapq.heappush(slots, free_at + settings.BOOT_SETTLE_TIME)
+        return waits
+
+    def _view(self, ticket: Dict, position: Optional[int] = None, expected_wait: Optional[float] = None) -> Dict:
+        view = {key: value for key, value in ticket.items() if not key.startswith("_")}
+        if ticket["status"] == "queued":
+            if position is None:
+                order = [item[2] for item in sorted(self._queue)]
+                position = order.index(ticket["id"]) + 1 if ticket["id"] in order else None
+                expected_wait = self._expected_waits().get(ticket["id"])
+            view["position"] = position
+            view["expected_wait"] = expected_wait
+        return view
+
+    def get_ticket(self, ticket_id: str) -> Optional[Dict]:
+        with self._cond:
+            ticket = self.tickets.get(ticket_id)
+            return self._view(ticket) if ticket else None
+
+    def get_status(self) -> Dict:
+        """Очередь с позициями и ожидаемым временем, загружающиеся ВМ и нагрузка хоста"""
+        with self._cond:
+            self._release_expired()
+            now = time.monotonic()
+            waits = self._expected_waits()
+            queue = [
+                self._view(self.tickets[ticket_id], position, waits.get(ticket_id))
+                for position, (_, _, ticket_id) in enumerate(sorted(self._queue), start=1)
+            ]
+            return {
+                "queue": queue,
+                "booting": [
+                    {"vm_name": name, "settles_in": round(max(until - now, 0), 1)}
+                    for name, until in sorted(self._booting.items(), key=lambda item: item[1])
+                ],
+                "host": {"cpu_percent": self.load.cpu_percent, "iowait_percent": self.load.iowait_percent},
+                "limits": {
+                    "max_concurrent": settings.BOOT_MAX_CONCURRENT,
+                    "max_iowait": settings.BOOT_MAX_IOWAIT,
+                    "max_cpu": settings.BOOT_MAX_CPU,
+                    "settle_time": settings.BOOT_SETTLE_TIME,
+                },
+                "stats": dict(self.stats),
+            }
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+# Глобальный экземпляр планировщика
+boot_scheduler = BootScheduler()
+on_shutdown(boot_scheduler.stop)
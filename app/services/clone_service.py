@@ -0,0 +1,219 @@
+import random
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from app.core.config import settings
+from app.services.kvm_service import kvm_service, LIBVIRT_AVAILABLE
+from app.services.job_service import job_manager
+from app.services.state_store import state_store
+from app.services import qemu_img
+
+if LIBVIRT_AVAILABLE:
+    import libvirt  # type: ignore
+    import xml.etree.ElementTree as ET
+
+
+CLONE_METADATA_NS = "urn:kvm-web-platform:clone"
+CLONE_METADATA_PREFIX = "kwp"
+VM_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+
+
+def generate_mac() -> str:
+    """Случайный MAC адрес из диапазона QEMU/KVM (52:54:00)"""
+    return "52:54:00:%02x:%02x:%02x" % tuple(random.randint(0, 255) for _ in range(3))
+
+
+class CloneService:
+    """Связанные (linked) клоны: qcow2 overlay поверх замороженного образа родителя"""
+
+    def clone_vm(self, vm_name: str, clone_name: str, start: bool = False) -> Dict:
+        """Создать связанный клон ВМ за постоянное время"""
+        if not VM_NAME_RE.match(clone_name):
+            return {"success": False, "message": "Недопустимое имя ВМ"}
+
+        if kvm_service.demo_mode:
+            from app.services.hypervisor_simulator import hypervisor_simulator, SimulatedFailure
+            try:
+                hypervisor_simulator.clone(vm_name, clone_name)
+                if start:
+                    hypervisor_simulator.start(clone_name)
+            except (LookupError, ValueError, SimulatedFailure) as e:
+                return {"success": False, "message": f"Ошибка клонирования ВМ: {e}", "demo_mode": True}
+            return {"success": True, "message": f"Демо: клон {clone_name} ВМ {vm_name} создан",
+                    "vm_name": clone_name, "demo_mode": True}
+
+        try:
+            try:
+                kvm_service.conn.lookupByName(clone_name)
+                return {"success": False, "message": f"ВМ с именем '{clone_name}' уже существует"}
+            except libvirt.libvirtError:
+                pass
+
+            domain = kvm_service.conn.lookupByName(vm_name)
+            if job_manager.is_busy(vm_name):
+                return {"success": False, "message": f"Для ВМ {vm_name} выполняется фоновая задача"}
+
+            frozen = self._freeze_disks(domain)
+
+            # Overlay клона поверх замороженных образов родителя
+            overlays = {}
+            Path(settings.VM_STORAGE_PATH).mkdir(parents=True, exist_ok=True)
+            for target, (base, base_format) in frozen.items():
+                overlay = str(Path(settings.VM_STORAGE_PATH) / f"{clone_name}-{target}.qcow2")
+                qemu_img.create_overlay(overlay, base, base_format)
+                overlays[target] = overlay
+
+            xml = self._clone_xml(domain, vm_name, clone_name, overlays)
+            clone = kvm_service.conn.defineXML(xml)
+            # Замороженные образы и все слои под ними теперь читает клон: снапшоты родителя не должны их менять
+            state_store.add_clone_backings(clone_name, vm_name, self._chain_files(frozen))
+            if start:
+                clone.create()
+
+            return {
+                "success": True,
+                "message": f"Связанный клон '{clone_name}' ВМ {vm_name} создан",
+                "vm_name": clone_name,
+                "parent": vm_name,
+                "disks": overlays,
+            }
+        except Exception as e:
+            return {"success": False, "message": f"Ошибка клонирования ВМ: {e}"}
+
+    def _freeze_disks(self, domain) -> Dict[str, tuple]:
+        """Заморозить текущие образы дисков родителя, переключив его на новые overlay"""
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        active = domain.isActive()
+        disks = kvm_service.get_domain_disks(domain, inactive=not active)
+        frozen = {disk["target"]: (disk["source"], disk["format"]) for disk in disks}
+
+        def parent_overlay(disk):
+            return str(Path(disk["source"]).parent / f"{domain.name()}-frozen-{stamp}-{disk['target']}.qcow2")
+
+        if active:
+            # Запущенная ВМ: внешний disk-only снапшот без метаданных
+            root = ET.Element("domainsnapshot")
+            disks_el = ET.SubElement(root, "disks")
+            for disk in disks:
+                disk_el = ET.SubElement(disks_el, "disk", name=disk["target"], snapshot="external")
+                ET.SubElement(disk_el, "driver", type="qcow2")
+                ET.SubElement(disk_el, "source", file=parent_overlay(disk))
+            domain.snapshotCreateXML(
+                ET.tostring(root, encoding="unicode"),
+                libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY
+                | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_ATOMIC
+                | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_NO_METADATA
+            )
+            return frozen
+
+        # Выключенная ВМ: создаем overlay сами и переопределяем домен
+        sources = {}
+        for disk in disks:
+            sources[disk["target"]] = parent_overlay(disk)
+            qemu_img.create_overlay(sources[disk["target"]], disk["source"], disk["format"])
+
+        root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+        self._replace_disk_sources(root, sources)
+        kvm_service.conn.defineXML(ET.tostring(root, encoding="unicode"))
+        return frozen
+
+    def _chain_files(self, frozen: Dict[str, tuple]) -> List[str]:
+        """Файлы backing chain под overlay клона: замороженные образы и их backing"""
+        files = []
+        for base, base_format in frozen.values():
+            if base_format == "qcow2":
+                files += [layer["filename"] for layer in qemu_img.info(base, backing_chain=True)]
+            else:
+                files.append(base)
+        return files
+
+    def _replace_disk_sources(self, root, sources: Dict[str, str]):
+        for disk in root.findall(".//devices/disk"):
+            target = disk.find("target")
+            if target is None or target.get("dev") not in sources:
+                continue
+            disk.find("source").set("file", sources[target.get("dev")])
+            driver = disk.find("driver")
+            if driver is not None:
+                driver.set("type", "qcow2")
+            # Описание backing chain перестраивается libvirt при запуске
+            for backing in disk.findall("backingStore"):
+                disk.remove(backing)
+
+    def _clone_xml(self, domain, vm_name: str, clone_name: str, overlays: Dict[str, str]) -> str:
+        """XML клона: новое имя, UUID, MAC адреса и диски"""
+        root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+
+        root.find("name").text = clone_name
+        uuid_el = root.find("uuid")
+        if uuid_el is None:
+            uuid_el = ET.SubElement(root, "uuid")
+        uuid_el.text = kvm_service._generate_uuid()
+
+        for interface in root.findall(".//devices/interface"):
+            mac = interface.find("mac")
+            if mac is None:
+                mac = ET.SubElement(interface, "mac")
+            mac.set("address", generate_mac())
+
+        self._replace_disk_sources(root, overlays)
+
+        # Связь с родителем в метаданных домена
+        metadata = root.find("metadata")
+        if metadata is None:
+            metadata = ET.SubElement(root, "metadata")
+        for old in metadata.findall(f"{{{CLONE_METADATA_NS}}}clone"):
+            metadata.remove(old)
+        ET.register_namespace(CLONE_METADATA_PREFIX, CLONE_METADATA_NS)
+        ET.SubElement(metadata, f"{{{CLONE_METADATA_NS}}}clone", parent=vm_name, created=datetime.now().isoformat())
+
+        return ET.tostring(root, encoding="unicode")
+
+    def flatten_vm(self, vm_name: str) -> Dict:
+        """Запустить фоновое превращение клона в полную копию"""
+        if kvm_service.demo_mode:
+            return kvm_service._demo_vm_action(vm_name, "flatten")
+
+        try:
+            kvm_service.conn.lookupByName(vm_name)
+        except Exception as e:
+            return {"success": False, "message": f"ВМ не найдена: {e}"}
+
+        if job_manager.is_busy(vm_name):
+            return {"success": False, "message": f"Для ВМ {vm_name} уже выполняется фоновая задача"}
+
+        job = job_manager.submit("flatten", vm_name, self._flatten_job, vm_name)
+        return {"success": True, "message": f"Flatten ВМ {vm_name} запущен", "job_id": job["id"]}
+
+    def _flatten_job(self, job: Dict, vm_name: str):
+        domain = kvm_service.conn.lookupByName(vm_name)
+        disks = kvm_service.get_domain_disks(domain)
+        bandwidth = settings.CLONE_FLATTEN_BANDWIDTH
+
+        for index, disk in enumerate(disks):
+            job["message"] = f"flatten {disk['target']}"
+            if domain.isActive():
+                # Подтягиваем все данные backing chain в активный слой без остановки гостя
+                domain.blockPull(disk["target"], bandwidth, 0)
+                kvm_service.wait_block_job(domain, disk["target"])
+            else:
+                # Безопасный rebase на пустой backing копирует данные в сам overlay
+                qemu_img.run(["rebase", "-q", "-f", "qcow2", "-b", "", disk["source"]])
+            job["progress"] = int((index + 1) * 100 / max(len(disks), 1))
+
+        flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG
+        if domain.isActive():
+            flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+        try:
+            domain.setMetadata(libvirt.VIR_DOMAIN_METADATA_ELEMENT, None, None, CLONE_METADATA_NS, flags)
+        except libvirt.libvirtError:
+            pass
+        state_store.delete_clone_backings(vm_name)
+
+        return {"disks": [d["target"] for d in disks]}
+
+
+# Глобальный экземпляр сервиса
+clone_service = CloneService()
@@ -0,0 +1,377 @@
+"""
+Коллектор для режима нескольких процессов API (main.py --workers N)
+
+Один процесс-коллектор владеет соединением с libvirt, потоком событий и
+фоновыми задачами. Воркеры uvicorn не открывают libvirt: список ВМ они
+отдают из локальной копии среза инвентаря, которую синхронизируют по
+номеру поколения, а остальные вызовы сервисов пересылают коллектору через
+локальный unix-сокет (multiprocessing.connection).
+"""
+
+import builtins
+import importlib
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.lifecycle import shutdown, startup, unwrap
+from app.core.timing import timed, timing_stats
+from app.services.libvirt_pool import LibvirtUnavailable
+
+
+# Глобальные экземпляры, вызовы которых воркеры пересылают коллектору
+REMOTE_SERVICES = {
+    "kvm_service": "app.services.kvm_service",
+    "snapshot_service": "app.services.snapshot_service",
+    "clone_service": "app.services.clone_service",
+    "backup_service": "app.services.backup_service",
+    "maintenance_service": "app.services.maintenance_service",
+    "power_service": "app.services.power_service",
+    "drain_service": "app.services.drain_service",
+    "boot_scheduler": "app.services.boot_scheduler",
+    "tuning_service": "app.services.tuning_service",
+    "resize_service": "app.services.resize_service",
+    "balloon_service": "app.services.balloon_service",
+    "throttle_service": "app.services.throttle_service",
+    "hypervisor_simulator": "app.services.hypervisor_simulator",
+    "job_manager": "app.services.job_service",
+    "state_store": "app.services.state_store",
+    "vm_inventory": "app.services.inventory_service",
+    "vnc_proxy": "app.services.console_service",
+}
+
+# Сервисы, которые в воркере остаются локальными: relay держит WebSocket воркера, который не
+# передается в другой процесс. У коллектора воркер запрашивает только адрес VNC консоли
+WORKER_LOCAL_SERVICES = {"vnc_proxy"}
+
+# Исключения, которые воссоздаются в воркере тем же типом (маршруты отличают, например, ValueError)
+_REBUILT_ERRORS = {
+    name: getattr(builtins, name)
+    for name in ("ValueError", "KeyError", "LookupError", "FileNotFoundError", "PermissionError", "TimeoutError")
+}
+_REBUILT_ERRORS["LibvirtUnavailable"] = LibvirtUnavailable
+
+
+class CollectorError(RuntimeError):
+    """Ошибка на стороне коллектора или связи с ним"""
+
+
+def collect_host_stats() -> Optional[Dict]:
+    """Статистика хоста; cpu_percent — загрузка с прошлого вызова"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+
+    from app.services.kvm_service import kvm_service
+    return {
+        "cpu_percent": psutil.cpu_percent(interval=None),
+        "memory": dict(psutil.virtual_memory()._asdict()),
+        "disk": dict(psutil.disk_usage('/')._asdict()),
+        "network": dict(psutil.net_io_counters()._asdict()),
+        "timestamp": datetime.now().isoformat(),
+        "demo_mode": kvm_service.demo_mode
+    }
+
+
+def _service(name: str):
+    if name not in REMOTE_SERVICES:
+        raise CollectorError(f"Неизвестный сервис: {name}")
+    return unwrap(getattr(importlib.import_module(REMOTE_SERVICES[name]), name))
+
+
+class CollectorServer:
+    """Сервер коллектора: срез инвентаря, статистика хоста и вызовы сервисов для воркеров"""
+
+    def __init__(self, address: Optional[str] = None, authkey: Optional[bytes] = None):
+        self.address = address or settings.COLLECTOR_SOCKET
+        self.authkey = authkey if authkey is not None else settings.COLLECTOR_AUTHKEY.encode()
+        self.metrics: Optional[Dict] = None
+        self.stats = {"connections": 0, "requests": 0, "inventory_transfers": 0}
+        self._listener: Optional[Listener] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Открыть сокет и запустить потоки приема соединений и сбора статистики"""
+        if os.path.exists(self.address):
+            # Сокет прошлого запуска: bind на существующий путь не пройдет
+            os.unlink(self.address)
+        self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        threading.Thread(target=self._accept_loop, name="collector-accept", daemon=True).start()
+        threading.Thread(target=self._metrics_loop, name="collector-metrics", daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+
+    def _metrics_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.metrics = collect_host_stats()
+            except Exception as e:
+                print(f"⚠️  Коллектор: ошибка сбора статистики хоста: {e}")
+            self._stop.wait(settings.COLLECTOR_METRICS_INTERVAL)
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self._stop.is_set():
+                    return
+                continue
+            except Exception as e:
+                # Неверный authkey и оборванные рукопожатия
+                print(f"⚠️  Коллектор: отклонено подключение: {e}")
+                continue
+            self.stats["connections"] += 1
+            threading.Thread(target=self._serve, args=(conn,), name="collector-conn", daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    # Запрос прочитан целиком, но не распаковался pickle: соединение остается рабочим
+                    reply = ("error", "CollectorError", f"Запрос не разобран: {e}")
+                else:
+                    self.stats["requests"] += 1
+                    try:
+                        reply = ("ok", self._dispatch(*message))
+                    except Exception as e:
+                        reply = ("error", type(e).__name__, str(e))
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    # Результат не сериализуется pickle (например, объект libvirt); pickle отказывает до записи в сокет
+                    try:
+                        conn.send(("error", type(e).__name__, str(e)))
+                    except (EOFError, OSError):
+                        return
+
+    def _dispatch(self, op: str, *args):
+        if op == "inventory":
+            # Полный срез отправляется, только если поколение воркера устарело
+            from app.services.inventory_service import vm_inventory
+            snap = vm_inventory.snapshot()
+            if snap.generation == args[0]:
+                return None
+            self.stats["inventory_transfers"] += 1
+            return snap.generation, list(snap.vms.values())
+
+        if op == "metrics":
+            return self.metrics
+
+        if op == "timing":
+            # Вызовы libvirt выполняются в коллекторе: их статистика и журнал медленных вызовов — здесь
+            method, call_args = args
+            if method not in ("get_stats", "get_slow_calls", "reset"):
+                raise CollectorError(f"Неизвестный метод статистики: {method}")
+            return getattr(timing_stats, method)(*call_args)
+
+        name, *rest = args
+        if op == "describe":
+            service = _service(name)
+            return [attr for attr in dir(type(service)) if not attr.startswith("_") and callable(getattr(service, attr))]
+
+        attr = rest[0]
+        if attr.startswith("_"):
+            raise CollectorError(f"Закрытый атрибут: {attr}")
+        if op == "getattr":
+            return getattr(_service(name), attr)
+        if op == "call":
+            _, call_args, call_kwargs = rest
+            return getattr(_service(name), attr)(*call_args, **call_kwargs)
+        raise CollectorError(f"Неизвестная операция: {op}")
+
+
+class CollectorClient:
+    """Клиент коллектора: по одному соединению на поток, переподключение при обрыве"""
+
+    def __init__(self, address: Optional[str] = None, authkey: Optional[bytes] = None):
+        self.address = address or settings.COLLECTOR_SOCKET
+        self.authkey = authkey if authkey is not None else settings.COLLECTOR_AUTHKEY.encode()
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                conn = self._local.conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            except (OSError, AuthenticationError) as e:
+                raise CollectorError(f"Коллектор недоступен ({self.address}): {e}")
+        return conn
+
+    def request(self, *message):
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.send(message)
+                reply = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                # Коллектор перезапустился: одна попытка с новым соединением
+                self._local.conn = None
+                conn.close()
+                if attempt == 2:
+                    raise CollectorError(f"Связь с коллектором потеряна: {e}")
+
+        if reply[0] == "ok":
+            return reply[1]
+        _, error_type, text = reply
+        if error_type in _REBUILT_ERRORS:
+            raise _REBUILT_ERRORS[error_type](text)
+        raise CollectorError(f"{error_type}: {text}")
+
+    def inventory(self, generation: Optional[int]):
+        return self.request("inventory", generation)
+
+    def metrics(self) -> Optional[Dict]:
+        return self.request("metrics")
+
+    def timing(self, method: str, *args):
+        return self.request("timing", method, args)
+
+    def call(self, service: str, method: str, *args, **kwargs):
+        # Вызовы libvirt выполняются в коллекторе: в Server-Timing воркера это фаза collector
+        with timed("collector"):
+            return self.request("call", service, method, args, kwargs)
+
+
+class RemoteService:
+    """Заместитель глобального сервиса в воркере: методы и атрибуты читаются у коллектора"""
+
+    def __init__(self, client: CollectorClient, name: str):
+        self._client = client
+        self._name = name
+        self._methods: Optional[List[str]] = None
+
+    def __getattr__(self, attr: str):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        if self._methods is None:
+            self._methods = self._client.request("describe", self._name)
+        if attr in self._methods:
+            def method(*args, **kwargs):
+                return self._client.call(self._name, attr, *args, **kwargs)
+            method.__name__ = attr
+            return method
+        return self._client.request("getattr", self._name, attr)
+
+    def __repr__(self):
+        return f"<RemoteService {self._name} via {self._client.address}>"
+
+
+def _mirrored_inventory_class():
+    from app.services.inventory_service import InventorySnapshot, VMInventory
+
+    class MirroredInventory(VMInventory):
+        """Копия инвентаря коллектора в воркере
+
+        Срез и номер поколения берутся у коллектора, поэтому ETag одинаковы
+        во всех воркерах, а libvirt опрашивается одним процессом. Фильтры,
+        пагинация и кэш сериализованных страниц работают локально.
+        """
+
+        def __init__(self, client: CollectorClient):
+            super().__init__(ttl=settings.COLLECTOR_SYNC_INTERVAL)
+            self._client = client
+
+        def snapshot(self):
+            if self._snapshot is None or time.monotonic() - self._loaded_at > self.ttl:
+                with self._refresh_lock:
+                    if self._snapshot is None or time.monotonic() - self._loaded_at > self.ttl:
+                        known = self._snapshot.generation if self._snapshot is not None else None
+                        update = self._client.inventory(known)
+                        if update is not None:
+                            generation, vms = update
+                            self.generation = generation
+                            self._snapshot = InventorySnapshot(vms, generation)
+                        self._loaded_at = time.monotonic()
+            return self._snapshot
+
+        def changes(self, since: int, fields: Optional[List[str]] = None) -> Dict:
+            # Журнал изменений ведет только коллектор
+            return self._client.call("vm_inventory", "changes", since, fields=fields)
+
+    return MirroredInventory
+
+
+_client: Optional[CollectorClient] = None
+
+
+def collector_client() -> CollectorClient:
+    global _client
+    if _client is None:
+        _client = CollectorClient()
+    return _client
+
+
+def install_worker_proxies():
+    """Заменить глобальные сервисы воркера заместителями коллектора
+
+    Вызывается до импорта маршрутов: модули, импортировавшие сервис по имени
+    (from ... import kvm_service), тоже получают заместитель.
+    """
+    client = collector_client()
+    # id -> (исходный объект, заместитель); исходный объект держим, чтобы id не переиспользовался
+    replacements = {}
+    for name, module_name in REMOTE_SERVICES.items():
+        if name in WORKER_LOCAL_SERVICES:
+            continue
+        original = getattr(importlib.import_module(module_name), name)
+        replacements[id(original)] = (original, RemoteService(client, name))
+    inventory = importlib.import_module("app.services.inventory_service")
+    replacements[id(inventory.vm_inventory)] = (inventory.vm_inventory, _mirrored_inventory_class()(client))
+
+    for module_name, module in list(sys.modules.items()):
+        if not module_name.startswith("app.") or module is None:
+            continue
+        for attr, value in list(vars(module).items()):
+            found = replacements.get(id(value))
+            if found is not None and found[0] is value:
+                setattr(module, attr, found[1])
+
+    # VNC трафик идет из воркера напрямую, коллектор только сообщает адрес консоли
+    from app.services.console_service import vnc_proxy
+    vnc_proxy.resolver = RemoteService(client, "vnc_proxy").get_vnc_endpoint
+
+
+def run_collector(address: Optional[str] = None, authkey: Optional[bytes] = None):
+    """Точка входа процесса-коллектора"""
+    settings.PROCESS_ROLE = "collector"
+    # terminate() от главного процесса: выходим через finally с хуками остановки
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # Подключение к libvirt, цикл событий и хранилище состояния открываются здесь, один раз
+    for module_name in REMOTE_SERVICES.values():
+        importlib.import_module(module_name)
+    startup()
+    from app.services.kvm_service import kvm_service
+    from app.services.inventory_service import vm_inventory
+
+    server = CollectorServer(address, authkey)
+    server.start()
+    print(f"📡 Коллектор запущен: {server.address} (демо-режим: {kvm_service.demo_mode})")
+    vm_inventory.snapshot()
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        shutdown()
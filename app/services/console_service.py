@@ -0,0 +1,211 @@
+import asyncio
+import html
+import json
+import time
+import uuid
+from typing import Callable, Awaitable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from app.core.config import settings
+from app.services.kvm_service import kvm_service, LIBVIRT_AVAILABLE
+
+if LIBVIRT_AVAILABLE:
+    import libvirt  # type: ignore
+    import xml.etree.ElementTree as ET
+
+
+class ConsoleError(Exception):
+    """Ошибка открытия консольной сессии"""
+
+
+class ConsoleSession:
+    """Учет одной консольной сессии"""
+
+    def __init__(self, vm_name: str, kind: str, client: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.vm_name = vm_name
+        self.kind = kind
+        self.client = client
+        self.started = time.time()
+        self.bytes_to_client = 0
+        self.bytes_from_client = 0
+
+    def to_dict(self) -> Dict:
+        duration = max(time.time() - self.started, 1e-6)
+        return {
+            "id": self.id,
+            "vm_name": self.vm_name,
+            "kind": self.kind,
+            "client": self.client,
+            "started": self.started,
+            "duration": round(duration, 3),
+            "bytes_to_client": self.bytes_to_client,
+            "bytes_from_client": self.bytes_from_client,
+            "rate_to_client": round(self.bytes_to_client / duration),
+            "rate_from_client": round(self.bytes_from_client / duration),
+        }
+
+
+class VNCProxy:
+    """Встроенный WebSocket↔TCP прокси к VNC консолям ВМ"""
+
+    def __init__(self, resolver: Optional[Callable[[str], Optional[Tuple[str, int]]]] = None,
+                 max_sessions: Optional[int] = None):
+        self.resolver = resolver or self.get_vnc_endpoint
+        self.max_sessions = max_sessions or settings.CONSOLE_MAX_SESSIONS
+        self.buffer_size = settings.CONSOLE_BUFFER_SIZE
+        self.sessions: Dict[str, ConsoleSession] = {}
+        self.totals = {"sessions": 0, "peak_sessions": 0, "bytes_to_client": 0, "bytes_from_client": 0}
+
+    def get_vnc_endpoint(self, vm_name: str) -> Optional[Tuple[str, int]]:
+        """Адрес VNC сервера ВМ из живой XML конфигурации домена"""
+        if kvm_service.demo_mode:
+            return None
+
+        try:
+            domain = kvm_service.conn.lookupByName(vm_name)
+        except libvirt.libvirtError as e:
+            raise ConsoleError(f"ВМ {vm_name} не найдена: {e}")
+        if not domain.isActive():
+            return None
+
+        root = ET.fromstring(domain.XMLDesc(0))
+        graphics = root.find(".//devices/graphics[@type='vnc']")
+        if graphics is None:
+            return None
+
+        port = int(graphics.get("port", "-1"))
+        if port <= 0:
+            return None
+
+        listen = graphics.get("listen") or settings.VNC_HOST
+        # QEMU слушает на всех интерфейсах — подключаемся локально
+        if listen in ("0.0.0.0", "::"):
+            listen = settings.VNC_HOST
+        return listen, port
+
+    async def relay(self, vm_name: str,
+                    receive: Callable[[], Awaitable[Optional[bytes]]],
+                    send: Callable[[bytes], Awaitable[None]],
+                    client: Optional[str] = None) -> Dict:
+        """Пересылать кадры между WebSocket клиентом и VNC сервером ВМ"""
+        if len(self.sessions) >= self.max_sessions:
+            raise ConsoleError("Превышено максимальное число консольных сессий")
+
+        loop = asyncio.get_running_loop()
+        try:
+            endpoint = await loop.run_in_executor(None, self.resolver, vm_name)
+        except ConsoleError:
+            raise
+        except Exception as e:
+            # В воркере адрес запрашивается у коллектора: его ошибки приходят как CollectorError
+            raise ConsoleError(f"VNC консоль ВМ {vm_name} недоступна: {e}")
+        if endpoint is None:
+            raise ConsoleError(f"VNC консоль ВМ {vm_name} недоступна")
+
+        # Повторная проверка: пока искали порт, могли открыться другие сессии
+        if len(self.sessions) >= self.max_sessions:
+            raise ConsoleError("Превышено максимальное число консольных сессий")
+
+        reader, writer = await asyncio.open_connection(*endpoint)
+        session = ConsoleSession(vm_name, "vnc", client)
+        self.sessions[session.id] = session
+        self.totals["sessions"] += 1
+        self.totals["peak_sessions"] = max(self.totals["peak_sessions"], len(self.sessions))
+
+        upstream = asyncio.ensure_future(self._client_to_vnc(receive, writer, session))
+        downstream = asyncio.ensure_future(self._vnc_to_client(reader, send, session))
+        try:
+            await asyncio.wait({upstream, downstream}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (upstream, downstream):
+                task.cancel()
+            await asyncio.gather(upstream, downstream, return_exceptions=True)
+            writer.close()
+            self._close_session(session)
+
+        return session.to_dict()
+
+    async def _client_to_vnc(self, receive, writer: asyncio.StreamWriter, session: ConsoleSession):
+        while True:
+            data = await receive()
+            if data is None:
+                return  # Клиент отключился; пустой кадр — не конец потока
+            session.bytes_from_client += len(data)
+            writer.write(data)
+            await writer.drain()
+
+    async def _vnc_to_client(self, reader: asyncio.StreamReader, send, session: ConsoleSession):
+        while True:
+            # Читаем крупными блоками: мелкие RFB сообщения склеиваются в один кадр
+            data = await reader.read(self.buffer_size)
+            if not data:
+                return
+            session.bytes_to_client += len(data)
+            await send(data)
+
+    def _close_session(self, session: ConsoleSession):
+        self.sessions.pop(session.id, None)
+        self.totals["bytes_to_client"] += session.bytes_to_client
+        self.totals["bytes_from_client"] += session.bytes_from_client
+
+    def get_sessions(self, vm_name: Optional[str] = None) -> List[Dict]:
+        """Активные консольные сессии с учетом трафика"""
+        return [
+            session.to_dict() for session in list(self.sessions.values())
+            if vm_name is None or session.vm_name == vm_name
+        ]
+
+    def get_stats(self) -> Dict:
+        """Сводная статистика прокси"""
+        active = self.get_sessions()
+        return {
+            "active_sessions": len(active),
+            "max_sessions": self.max_sessions,
+            "peak_sessions": self.totals["peak_sessions"],
+            "total_sessions": self.totals["sessions"],
+            "bytes_to_client": self.totals["bytes_to_client"] + sum(s["bytes_to_client"] for s in active),
+            "bytes_from_client": self.totals["bytes_from_client"] + sum(s["bytes_from_client"] for s in active),
+        }
+
+
+def render_vnc_viewer(vm_name: str, ws_base: Optional[str] = None) -> str:
+    """HTML страница noVNC клиента для консоли ВМ"""
+    ws_path = f"/ws/vms/{quote(vm_name, safe='')}/vnc"
+    ws_base = ws_base or settings.CONSOLE_WS_BASE
+
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <title>Console - {html.escape(vm_name)}</title>
+    <meta charset="utf-8">
+    <style>
+        body {{ margin: 0; background: #2c3e50; color: white; font-family: monospace; }}
+        #status {{ padding: 6px 12px; background: #34495e; }}
+        #screen {{ width: 100vw; height: calc(100vh - 32px); }}
+    </style>
+</head>
+<body>
+    <div id="status">🖥️ {html.escape(vm_name)}: подключение...</div>
+    <div id="screen"></div>
+    <script type="module">
+        import RFB from '{settings.NOVNC_URL}/core/rfb.js';
+
+        const status = document.getElementById('status');
+        const wsBase = {json.dumps(ws_base)} ||
+            `${{location.protocol === 'https:' ? 'wss' : 'ws'}}://${{location.host}}`;
+        const rfb = new RFB(document.getElementById('screen'), wsBase + {json.dumps(ws_path)});
+        rfb.scaleViewport = true;
+
+        rfb.addEventListener('connect', () => {{ status.textContent = '🟢 ' + {json.dumps(vm_name)}; }});
+        rfb.addEventListener('disconnect', (e) => {{
+            status.textContent = e.detail.clean ? '⚪ Соединение закрыто' : '🔴 Соединение потеряно';
+        }});
+    </script>
+</body>
+</html>
+"""
+
+
+# Глобальный экземпляр прокси
+vnc_proxy = VNCProxy()
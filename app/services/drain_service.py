@@ -0,0 +1,196 @@
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.kvm_service import kvm_service
+from app.services.job_service import job_manager
+from app.services.power_service import power_service
+from app.services.state_store import state_store
+
+
+def _priority(vm: Dict) -> int:
+    return (vm.get("metadata") or {}).get("priority") or 0
+
+
+class DrainService:
+    """Обслуживание хоста: остановка всех ВМ волнами и возврат запущенных ранее
+
+    Список запущенных ВМ сохраняется в хранилище до первой остановки, поэтому
+    restore работает и после перезагрузки хоста.
+    """
+
+    def drain(self, wave_size: Optional[int] = None, shutdown_timeout: Optional[float] = None,
+              force_timeout: Optional[float] = None) -> Dict:
+        """Остановить все запущенные ВМ в фоне; ВМ, не выключившиеся к сроку, уничтожаются"""
+        if job_manager.is_busy("host"):
+            raise ValueError("Остановка или возврат ВМ хоста уже выполняется")
+
+        running = [vm for vm in kvm_service.get_all_vms() if vm.get("status") == "running"]
+        drain = {
+            "id": uuid.uuid4().hex[:12],
+            "status": "draining",
+            "vms": [{"name": vm["name"], "priority": _priority(vm)} for vm in running],
+            "report": None,
+            "created_at": datetime.now().isoformat(),
+        }
+        state_store.save_drain(drain)
+
+        job = job_manager.submit(
+            "host-drain", "host", self._drain_job, drain,
+            wave_size or settings.DRAIN_WAVE_SIZE,
+            settings.DRAIN_SHUTDOWN_TIMEOUT if shutdown_timeout is None else shutdown_timeout,
+            settings.DRAIN_FORCE_TIMEOUT if force_timeout is None else force_timeout
+        )
+        return {
+            "success": True,
+            "message": f"Остановка {len(running)} запущенных ВМ поставлена в очередь",
+            "drain_id": drain["id"],
+            "job_id": job["id"],
+            "vms": drain["vms"],
+        }
+
+    def _drain_job(self, job: Dict, drain: Dict, wave_size: int, shutdown_timeout: float, force_timeout: float):
+        # Первыми останавливаются наименее важные ВМ: важные работают дольше
+        ordered = sorted(drain["vms"], key=lambda vm: (vm["priority"], vm["name"]))
+        waves = [ordered[i:i + wave_size] for i in range(0, len(ordered), wave_size)]
+        started = time.monotonic()
+        entries: List[Dict] = []
+
+        try:
+            for number, wave in enumerate(waves, start=1):
+                job["message"] = f"Волна {number}/{len(waves)}: штатное выключение {len(wave)} ВМ"
+                wave_offset = time.monotonic() - started
+                names = [vm["name"] for vm in wave]
+                shutdown = power_service.execute("stop", names, concurrency=len(names), wait=True, timeout=shutdown_timeout)
+                by_name = {entry["name"]: entry for entry in shutdown["results"]}
+
+                stragglers = [name for name in names if by_name[name]["state"] in ("timeout", "failed")]
+                forced = {}
+                if stragglers:
+                    job["message"] = f"Волна {number}/{len(waves)}: destroy для {len(stragglers)} ВМ"
+                    result = power_service.execute("force_stop", stragglers, concurrency=len(stragglers),
+                                                   wait=True, timeout=force_timeout)
+                    forced = {entry["name"]: entry for entry in result["results"]}
+
+                for vm in wave:
+                    entry = forced.get(vm["name"]) or by_name[vm["name"]]
+                    # Время от начала волны до подтвержденной остановки
+                    elapsed = entry.get("elapsed", 0.0)
+                    if vm["name"] in forced:
+                        elapsed = shutdown["duration"] + elapsed
+                    entries.append({
+                        "name": vm["name"],
+                        "priority": vm["priority"],
+                        "wave": number,
+                        "state": entry["state"],
+                        "forced": vm["name"] in forced,
+                        "success": entry["success"],
+                        "message": entry["message"],
+                        "elapsed": round(elapsed, 3),
+                        "stopped_after": round(wave_offset + elapsed, 3),
+                    })
+                job["progress"] = int(number * 100 / len(waves))
+        except Exception:
+            drain["status"] = "failed"
+            drain["report"] = {"drain": {"vms": entries}}
+            state_store.save_drain(drain)
+            raise
+
+        failed = [entry["name"] for entry in entries if not entry["success"]]
+        report = {
+            "waves": len(waves),
+            "total": len(entries),
+            "graceful": sum(1 for entry in entries if entry["success"] and not entry["forced"]),
+            "forced": sum(1 for entry in entries if entry["forced"]),
+            "failed": failed,
+            "duration": round(time.monotonic() - started, 3),
+            "vms": entries,
+        }
+        drain["status"] = "drained"
+        drain["report"] = {"drain": report}
+        state_store.save_drain(drain)
+        print(f"🔧 Хост освобожден за {report['duration']} с: {report['graceful']} штатно, "
+              f"{report['forced']} через destroy, не остановлено {len(failed)}")
+        return report
+
+    def restore(self, drain_id: Optional[str] = None, concurrency: Optional[int] = None,
+                timeout: Optional[float] = None) -> Dict:
+        """Запустить ВМ, работавшие до остановки хоста, группами по убыванию приоритета"""
+        if job_manager.is_busy("host"):
+            raise ValueError("Остановка или возврат ВМ хоста уже выполняется")
+
+        if drain_id is not None:
+            drain = state_store.get_drain(drain_id)
+            if drain is None:
+                raise LookupError(f"Запись об остановке {drain_id} не найдена")
+        else:
+            drain = next((d for d in state_store.list_drains() if d["status"] != "restored"), None)
+            if drain is None:
+                raise LookupError("Нет остановок хоста, ожидающих возврата ВМ")
+
+        job = job_manager.submit(
+            "host-restore", "host", self._restore_job, drain,
+            concurrency or settings.RESTORE_CONCURRENCY,
+            settings.RESTORE_START_TIMEOUT if timeout is None else timeout
+        )
+        return {
+            "success": True,
+            "message": f"Запуск {len(drain['vms'])} ВМ поставлен в очередь",
+            "drain_id": drain["id"],
+            "job_id": job["id"],
+        }
+
+    def _restore_job(self, job: Dict, drain: Dict, concurrency: int, timeout: float):
+        # Группа следующего приоритета стартует, когда предыдущая запустилась или истек срок
+        groups: Dict[int, List[str]] = {}
+        for vm in drain["vms"]:
+            groups.setdefault(vm["priority"], []).append(vm["name"])
+        priorities = sorted(groups, reverse=True)
+
+        drain["status"] = "restoring"
+        state_store.save_drain(drain)
+        started = time.monotonic()
+        entries: List[Dict] = []
+        for number, priority in enumerate(priorities, start=1):
+            job["message"] = f"Приоритет {priority}: запуск {len(groups[priority])} ВМ"
+            group_offset = time.monotonic() - started
+            result = power_service.execute("start", sorted(groups[priority]), concurrency=concurrency,
+                                           wait=True, timeout=timeout)
+            for entry in result["results"]:
+                entries.append({
+                    "name": entry["name"],
+                    "priority": priority,
+                    "state": entry["state"],
+                    "success": entry["success"],
+                    "message": entry["message"],
+                    "elapsed": entry.get("elapsed", 0.0),
+                    "started_after": round(group_offset + entry.get("elapsed", 0.0), 3),
+                })
+            job["progress"] = int(number * 100 / len(priorities))
+
+        failed = [entry["name"] for entry in entries if not entry["success"]]
+        report = {
+            "groups": len(priorities),
+            "total": len(entries),
+            "started": len(entries) - len(failed),
+            "failed": failed,
+            "duration": round(time.monotonic() - started, 3),
+            "vms": entries,
+        }
+        drain["status"] = "restored"
+        drain["report"] = dict(drain.get("report") or {}, restore=report)
+        state_store.save_drain(drain)
+        print(f"🔧 Возвращено {report['started']} из {report['total']} ВМ за {report['duration']} с")
+        return report
+
+    def get(self, drain_id: str) -> Optional[Dict]:
+        return state_store.get_drain(drain_id)
+
+    def list(self, limit: int = 20) -> List[Dict]:
+        return state_store.list_drains(limit)
+
+
+# Глобальный экземпляр сервиса
+drain_service = DrainService()
@@ -0,0 +1,353 @@
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.lifecycle import LazyService, on_shutdown, is_initialized
+from app.services.libvirt_events import publish
+
+
+# Коды virDomainState для поля state, как у настоящих доменов
+_STATE_RUNNING = 1
+_STATE_SHUTOFF = 5
+
+
+class SimulatedFailure(Exception):
+    """Сбой, внедренный симулятором (SIMULATOR_FAILURE_RATE)"""
+
+
+class HypervisorSimulator:
+    """Симулятор гипервизора для демо-режима и нагрузочного тестирования без libvirt
+
+    Домены живут в памяти и проходят те же переходы, что в libvirt: start и
+    destroy меняют состояние сразу, shutdown отправляет гостю запрос, и ВМ
+    выключается через задержку guest_shutdown. Каждый переход публикует
+    событие жизненного цикла (libvirt_events), поэтому ожидание состояний,
+    очередь запусков и инвентарь работают как с настоящим хостом.
+
+    Задержка каждой операции и вероятность сбоя задаются в
+    SIMULATOR_LATENCY и SIMULATOR_FAILURE_RATE и меняются на лету.
+    """
+
+    def __init__(self, domains: Optional[int] = None, seed: Optional[int] = None):
+        self._domains: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(settings.SIMULATOR_SEED if seed is None else seed)
+        self._ids = itertools.count(1)
+        self._addresses = itertools.count(2)
+        self.latency: Dict[str, float] = dict(settings.SIMULATOR_LATENCY)
+        self.failure_rate: Dict[str, float] = dict(settings.SIMULATOR_FAILURE_RATE)
+        self.jitter = settings.SIMULATOR_JITTER
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+        # Отложенные переходы (выключение гостя): один поток на все домены
+        self._timers: List[Tuple[float, int, Callable[[], None]]] = []
+        self._timer_order = itertools.count()
+        self._timer_cond = threading.Condition()
+        self._timer_thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+        self._load_demo_file()
+        count = settings.SIMULATOR_DOMAINS if domains is None else domains
+        if count:
+            self.add_domains(count, settings.SIMULATOR_RUNNING_RATIO)
+        print(f"🎭 Симулятор гипервизора: {len(self._domains)} доменов")
+
+    # Начальные домены
+
+    def _load_demo_file(self):
+        """Домены из data/demo_vms.json (demo.py), иначе две демо-ВМ"""
+        demo_file = settings.DATA_DIR / "demo_vms.json"
+        vms = None
+        if demo_file.exists():
+            try:
+                with open(demo_file, encoding="utf-8") as f:
+                    vms = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Не удалось прочитать {demo_file}: {e}")
+        if vms is None:
+            vms = [
+                {"name": "Ubuntu-Demo", "status": "running", "memory": 2048, "vcpus": 2,
+                 "disk_size": "20G", "os": "Ubuntu 22.04 (демо)"},
+                {"name": "CentOS-Demo", "status": "stopped", "memory": 1024, "vcpus": 1,
+                 "disk_size": "15G", "os": "CentOS Stream 9 (демо)"},
+            ]
+        for vm in vms:
+            self._insert(vm["name"], vm.get("memory", 1024), vm.get("vcpus", 1), vm.get("disk_size"),
+                         vm.get("os"), running=vm.get("status") == "running")
+
+    def _insert(self, name: str, memory: int, vcpus: int, disk_size=None, os_name: Optional[str] = None,
+                running: bool = False) -> Dict:
+        """Добавить домен в таблицу (под self._lock или до запуска потоков)"""
+        address = next(self._addresses)
+        domain = {
+            "id": None,
+            "uuid": str(uuid.UUID(int=self._random.getrandbits(128), version=4)),
+            "name": name,
+            "status": "stopped",
+            "state": _STATE_SHUTOFF,
+            "memory": memory,
+            "vcpus": vcpus,
+            "disk_size": f"{disk_size}G" if isinstance(disk_size, int) else disk_size,
+            "os": os_name,
+            "ip_address": None,
+            "ip_addresses": [],
+            "created": datetime.now().isoformat(),
+            "started_at": None,
+            "_address": f"192.168.{122 + address // 254 % 100}.{address % 254 + 1}",
+            "_shutting_down": False,
+        }
+        if running:
+            self._set_running(domain)
+        self._domains[name] = domain
+        return domain
+
+    def add_domains(self, count: int, running_ratio: float = 0.5, prefix: str = "sim") -> Dict:
+        """Добавить count синтетических доменов (для нагрузочных тестов до десятков тысяч)"""
+        if count < 1:
+            raise ValueError("count должен быть положительным")
+        if not 0 <= running_ratio <= 1:
+            raise ValueError("running_ratio должен быть от 0 до 1")
+        added = []
+        with self._lock:
+            number = len(self._domains)
+            while len(added) < count:
+                number += 1
+                name = f"{prefix}-{number:05d}"
+                if name in self._domains:
+                    continue
+                self._insert(name, self._random.choice((512, 1024, 2048, 4096)), self._random.choice((1, 2, 4)),
+                             self._random.choice((10, 20, 40)), "Simulated Linux",
+                             running=self._random.random() < running_ratio)
+                added.append(name)
+        # Без события на каждый домен: инвентарь перечитает список целиком
+        from app.services.inventory_service import vm_inventory
+        vm_inventory.invalidate()
+        return {"success": True, "message": f"Добавлено доменов: {len(added)}", "total": len(self._domains)}
+
+    # Задержки и сбои
+
+    def _simulate(self, operation: str):
+        """Задержка операции и внедрение сбоя; вызывается вне self._lock"""
+        with self._lock:
+            counters = self.stats.setdefault(operation, {"calls": 0, "failures": 0})
+            counters["calls"] += 1
+            delay = self.latency.get(operation, self.latency.get("default", 0.0))
+            if delay and self.jitter:
+                delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+            rate = self.failure_rate.get(operation, self.failure_rate.get("*", 0.0))
+            failed = rate > 0 and self._random.random() < rate
+            if failed:
+                counters["failures"] += 1
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise SimulatedFailure(f"внедренный сбой операции {operation}")
+
+    def _get(self, name: str) -> Dict:
+        domain = self._domains.get(name)
+        if domain is None:
+            raise LookupError(f"ВМ {name} не найдена")
+        return domain
+
+    # Переходы состояний
+
+    def _set_running(self, domain: Dict):
+        domain.update(id=next(self._ids), status="running", state=_STATE_RUNNING,
+                      started_at=datetime.now().isoformat(), ip_address=domain["_address"],
+                      ip_addresses=[domain["_address"]], _shutting_down=False)
+
+    def _set_stopped(self, domain: Dict):
+        domain.update(id=None, status="stopped", state=_STATE_SHUTOFF, started_at=None,
+                      ip_address=None, ip_addresses=[], _shutting_down=False)
+
+    def start(self, name: str):
+        self._simulate("start")
+        with self._lock:
+            domain = self._get(name)
+            if domain["status"] == "running":
+                raise ValueError("ВМ уже запущена")
+            self._set_running(domain)
+        publish(name, "started", 0)
+
+    def shutdown(self, name: str):
+        """Запрос штатного выключения: гость выключится через guest_shutdown секунд"""
+        self._simulate("shutdown")
+        with self._lock:
+            domain = self._get(name)
+            if domain["status"] != "running":
+                raise ValueError("ВМ уже остановлена")
+            if domain["_shutting_down"]:
+                return
+            # Гость может проигнорировать ACPI-запрос, как настоящий зависший гость
+            counters = self.stats.setdefault("guest_shutdown", {"calls": 0, "failures": 0})
+            counters["calls"] += 1
+            rate = self.failure_rate.get("guest_shutdown", 0.0)
+            if rate > 0 and self._random.random() < rate:
+                counters["failures"] += 1
+                return
+            domain["_shutting_down"] = True
+            delay = self.latency.get("guest_shutdown", 0.0)
+            started_at = domain["started_at"]
+        self._schedule(delay, lambda: self._finish_shutdown(name, started_at))
+
+    def _finish_shutdown(self, name: str, started_at: str):
+        with self._lock:
+            domain = self._domains.get(name)
+            # ВМ могли уничтожить или перезапустить, пока гость выключался
+            if domain is None or not domain["_shutting_down"] or domain["started_at"] != started_at:
+                return
+            self._set_stopped(domain)
+        publish(name, "shutdown", 0)
+        publish(name, "stopped", 0)
+
+    def destroy(self, name: str):
+        self._simulate("destroy")
+        with self._lock:
+            domain = self._get(name)
+            if domain["status"] != "running":
+                raise ValueError("ВМ не запущена")
+            self._set_stopped(domain)
+        publish(name, "stopped", 1)
+
+    def reboot(self, name: str):
+        self._simulate("reboot")
+        with self._lock:
+            domain = self._get(name)
+            if domain["status"] != "running":
+                raise ValueError("ВМ не запущена")
+            domain["started_at"] = datetime.now().isoformat()
+
+    def define(self, name: str, memory: int, vcpus: int, disk_size=None, os_name: Optional[str] = None) -> Dict:
+        self._simulate("define")
+        with self._lock:
+            if name in self._domains:
+                raise ValueError(f"ВМ с именем '{name}' уже существует")
+            domain = self._insert(name, memory, vcpus, disk_size, os_name)
+        publish(name, "defined", 0)
+        return self._view(domain)
+
+    def undefine(self, name: str):
+        self._simulate("undefine")
+        with self._lock:
+            was_running = self._get(name)["status"] == "running"
+            del self._domains[name]
+        if was_running:
+            publish(name, "stopped", 1)
+        publish(name, "undefined", 0)
+
+    def clone(self, source: str, name: str) -> Dict:
+        self._simulate("clone")
+        with self._lock:
+            original = self._get(source)
+            if name in self._domains:
+                raise ValueError(f"ВМ с именем '{name}' уже существует")
+            domain = self._insert(name, original["memory"], original["vcpus"], original["disk_size"], original["os"])
+        publish(name, "defined", 0)
+        return self._view(domain)
+
+    def action(self, name: str, action: str):
+        """Операция без смены состояния (снапшот, бэкап, тюнинг...): проверка ВМ, задержка и сбой"""
+        with self._lock:
+            self._get(name)
+        self._simulate(action)
+
+    # Чтение
+
+    def _view(self, domain: Dict) -> Dict:
+        return {key: value for key, value in domain.items() if not key.startswith("_")}
+
+    def list_domains(self) -> List[Dict]:
+        self._simulate("list")
+        with self._lock:
+            return [self._view(domain) for domain in self._domains.values()]
+
+    def get_domain(self, name: str) -> Optional[Dict]:
+        self._simulate("lookup")
+        with self._lock:
+            domain = self._domains.get(name)
+            return self._view(domain) if domain else None
+
+    # Таймеры
+
+    def _schedule(self, delay: float, callback: Callable[[], None]):
+        with self._timer_cond:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_order), callback))
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._timer_loop, name="simulator-timers", daemon=True)
+                self._timer_thread.start()
+            self._timer_cond.notify()
+
+    def _timer_loop(self):
+        while True:
+            with self._timer_cond:
+                while not self._stopped and (not self._timers or self._timers[0][0] > time.monotonic()):
+                    self._timer_cond.wait(self._timers[0][0] - time.monotonic() if self._timers else None)
+                if self._stopped:
+                    return
+                _, _, callback = heapq.heappop(self._timers)
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  Ошибка отложенного перехода симулятора: {e}")
+
+    # Настройка
+
+    def configure(self, latency: Optional[Dict[str, float]] = None, failure_rate: Optional[Dict[str, float]] = None,
+                  jitter: Optional[float] = None) -> Dict:
+        """Изменить задержки (сек), вероятности сбоев (0..1) и разброс задержек; 0 или null удаляет значение"""
+        for operation, value in (latency or {}).items():
+            if value is not None and value < 0:
+                raise ValueError(f"Задержка {operation} не может быть отрицательной")
+        for operation, value in (failure_rate or {}).items():
+            if value is not None and not 0 <= value <= 1:
+                raise ValueError(f"Вероятность сбоя {operation} должна быть от 0 до 1")
+        if jitter is not None and not 0 <= jitter < 1:
+            raise ValueError("jitter должен быть от 0 до 1")
+
+        with self._lock:
+            for target, values in ((self.latency, latency), (self.failure_rate, failure_rate)):
+                for operation, value in (values or {}).items():
+                    if value:
+                        target[operation] = value
+                    else:
+                        target.pop(operation, None)
+            if jitter is not None:
+                self.jitter = jitter
+        return {"success": True, "message": "Параметры симулятора обновлены", **self.get_status()}
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for domain in self._domains.values():
+                counts[domain["status"]] = counts.get(domain["status"], 0) + 1
+            return {
+                "domains": len(self._domains),
+                "by_status": counts,
+                "shutting_down": sum(1 for domain in self._domains.values() if domain["_shutting_down"]),
+                "latency": dict(self.latency),
+                "failure_rate": dict(self.failure_rate),
+                "jitter": self.jitter,
+                "stats": {operation: dict(counters) for operation, counters in self.stats.items()},
+            }
+
+    def stop(self):
+        with self._timer_cond:
+            self._stopped = True
+            self._timer_cond.notify_all()
+
+
+# Глобальный экземпляр симулятора: домены создаются при первом обращении в демо-режиме
+hypervisor_simulator = LazyService(HypervisorSimulator)
+
+
+@on_shutdown
+def _stop_simulator():
+    if is_initialized(hypervisor_simulator):
+        hypervisor_simulator.stop()
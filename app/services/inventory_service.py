@@ -0,0 +1,331 @@
+import base64
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Callable, List, Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.serialization import PreEncoded, ResponseCache
+from app.services.libvirt_events import subscribe
+
+
+def _number(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _created(vm: Dict) -> str:
+    metadata = vm.get("metadata") or {}
+    return str(metadata.get("created_at") or vm.get("created") or "")
+
+
+# Поля сортировки: извлечение значения, приведенного к одному типу внутри поля
+SORT_FIELDS: Dict[str, Callable[[Dict], object]] = {
+    "name": lambda vm: vm["name"],
+    "status": lambda vm: str(vm.get("status") or ""),
+    "memory": lambda vm: _number(vm.get("memory")),
+    "vcpus": lambda vm: _number(vm.get("vcpus")),
+    "created": _created,
+}
+
+
+# Поля, которые меняются постоянно и не считаются изменением ВМ для delta-sync
+VOLATILE_FIELDS = {"cpu_time"}
+
+
+def _fingerprint(vm: Dict) -> Dict:
+    return {key: value for key, value in vm.items() if key not in VOLATILE_FIELDS}
+
+
+def make_etag(generation: int) -> str:
+    return f'"{generation}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадает ли ETag с заголовком If-None-Match (список, * и слабые теги)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+
+def vm_tags(vm: Dict) -> List[str]:
+    """Теги ВМ из сохраненных метаданных"""
+    return (vm.get("metadata") or {}).get("tags") or []
+
+
+def encode_cursor(sort_value, name: str) -> str:
+    """Непрозрачный курсор: значение сортировки и имя последней выданной ВМ"""
+    raw = json.dumps([sort_value, name], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, name = json.loads(raw)
+        return sort_value, name
+    except Exception:
+        raise ValueError("Некорректный курсор")
+
+
+class InventorySnapshot:
+    """Неизменяемый срез инвентаря со вторичными индексами
+
+    Индексы по статусу и тегам строятся сразу, упорядоченные индексы
+    для полей сортировки — при первом запросе с этой сортировкой.
+    """
+
+    def __init__(self, vms: List[Dict], generation: int = 0):
+        self.generation = generation
+        self.vms: Dict[str, Dict] = {vm["name"]: vm for vm in vms if vm.get("name")}
+        self.by_status: Dict[str, Set[str]] = {}
+        self.by_tag: Dict[str, Set[str]] = {}
+        for name, vm in self.vms.items():
+            self.by_status.setdefault(vm.get("status"), set()).add(name)
+            for tag in vm_tags(vm):
+                self.by_tag.setdefault(tag, set()).add(name)
+
+        self._orders: Dict[str, Tuple[List[Tuple], Dict[str, int]]] = {}
+        self._lock = threading.Lock()
+
+    def order(self, sort: str) -> Tuple[List[Tuple], Dict[str, int]]:
+        """Отсортированные ключи (значение, имя) и позиция каждой ВМ в этом порядке"""
+        order = self._orders.get(sort)
+        if order is None:
+            with self._lock:
+                order = self._orders.get(sort)
+                if order is None:
+                    extract = SORT_FIELDS[sort]
+                    keys = sorted((extract(vm), name) for name, vm in self.vms.items())
+                    order = (keys, {name: index for index, (_, name) in enumerate(keys)})
+                    self._orders[sort] = order
+        return order
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """Диапазон позиций имен с префиксом в индексе по имени"""
+        keys, _ = self.order("name")
+        start = bisect_left(keys, (prefix, ""))
+        end = bisect_left(keys, (prefix + "\U0010ffff", ""))
+        return start, end
+
+
+class VMInventory:
+    """Инвентарь ВМ в памяти: фильтрация, сортировка и постраничная выдача по индексам
+
+    Срез обновляется из libvirt не чаще INVENTORY_TTL и сразу после событий
+    жизненного цикла доменов. Каждое обновление с изменениями увеличивает
+    номер поколения; журнал изменений позволяет отдавать клиентам только
+    разницу с известным им поколением.
+    """
+
+    def __init__(self, source: Optional[Callable[[], List[Dict]]] = None, ttl: Optional[float] = None):
+        self._source = source
+        self.ttl = settings.INVENTORY_TTL if ttl is None else ttl
+        self._snapshot: Optional[InventorySnapshot] = None
+        self._loaded_at = 0.0
+        self._stale = True
+        self._refresh_lock = threading.Lock()
+        self._pages = ResponseCache()
+
+        # Поколения начинаются с текущего времени в мс, чтобы расти и между перезапусками
+        self.generation = int(time.time() * 1000)
+        self._fingerprints: Dict[str, Dict] = {}
+        self._changelog: List[Tuple[int, str]] = []
+        self._oldest = self.generation  # Самое раннее поколение, от которого известна разница
+
+    def _load(self) -> List[Dict]:
+        if self._source is not None:
+            return self._source()
+        from app.services.kvm_service import kvm_service
+        return kvm_service.get_all_vms()
+
+    def invalidate(self, *args):
+        """Пометить срез устаревшим (подходит как обработчик событий libvirt)"""
+        self._stale = True
+
+    def snapshot(self) -> InventorySnapshot:
+        """Актуальный срез инвентаря"""
+        if self._snapshot is None or self._stale or time.monotonic() - self._loaded_at > self.ttl:
+            with self._refresh_lock:
+                if self._snapshot is None or self._stale or time.monotonic() - self._loaded_at > self.ttl:
+                    self._stale = False
+                    try:
+                        vms = self._load()
+                    except Exception as e:
+                        # libvirt недоступен: отдаем последний известный срез до восстановления
+                        if self._snapshot is None:
+                            raise
+                        print(f"⚠️  Инвентарь: обновление не удалось, используется срез поколения {self.generation}: {e}")
+                        self._loaded_at = time.monotonic()
+                        return self._snapshot
+                    self._record_changes(vms)
+                    self._snapshot = InventorySnapshot(vms, self.generation)
+                    self._loaded_at = time.monotonic()
+        return self._snapshot
+
+    def _record_changes(self, vms: List[Dict]):
+        """Сравнить новый срез с предыдущим и записать изменения в журнал (под _refresh_lock)"""
+        fingerprints = {vm["name"]: _fingerprint(vm) for vm in vms if vm.get("name")}
+        changed = [name for name, fp in fingerprints.items() if self._fingerprints.get(name) != fp]
+        removed = [name for name in self._fingerprints if name not in fingerprints]
+        self._fingerprints = fingerprints
+        if not changed and not removed:
+            return
+
+        self.generation += 1
+        self._changelog.extend((self.generation, name) for name in changed + removed)
+        overflow = len(self._changelog) - settings.INVENTORY_CHANGELOG_SIZE
+        if overflow > 0:
+            # Клиенты старше обрезанной части журнала получат полный список
+            self._oldest = self._changelog[overflow - 1][0]
+            del self._changelog[:overflow]
+
+    def changes(self, since: int, fields: Optional[List[str]] = None) -> Dict:
+        """ВМ, добавленные или измененные после поколения since, и имена удаленных"""
+        self.snapshot()
+        with self._refresh_lock:
+            # Срез и журнал меняются вместе под этой блокировкой
+            snap = self._snapshot
+            full = since < self._oldest or since > snap.generation
+            entries = [] if full else self._changelog[bisect_right(self._changelog, (since, "\U0010ffff")):]
+
+        if full:
+            # Разница неизвестна: клиент должен заменить свой список целиком
+            changed, removed = list(snap.vms.values()), []
+        else:
+            names = dict.fromkeys(name for _, name in entries)
+            changed = [snap.vms[name] for name in names if name in snap.vms]
+            removed = [name for name in names if name not in snap.vms]
+
+        if fields:
+            changed = [{field: vm.get(field) for field in fields} for vm in changed]
+        return {"generation": snap.generation, "full": full, "changed": changed, "removed": removed}
+
+    def query(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+              status: Optional[str] = None, prefix: Optional[str] = None,
+              tags: Optional[List[str]] = None, sort: str = "name",
+              fields: Optional[List[str]] = None) -> Dict:
+        """Страница ВМ: items, next_cursor и total (число ВМ под фильтром)"""
+        descending = sort.startswith("-")
+        sort_field = sort.lstrip("-")
+        if sort_field not in SORT_FIELDS:
+            raise ValueError(f"Сортировка возможна по полям: {', '.join(SORT_FIELDS)}")
+        if limit is not None and limit < 1:
+            raise ValueError("limit должен быть положительным")
+
+        snap = self.snapshot()
+        keys, rank = snap.order(sort_field)
+
+        # Кандидаты из вторичных индексов: пересечение, начиная с наименьшего множества
+        filters = []
+        if status:
+            filters.append(snap.by_status.get(status, set()))
+        for tag in tags or []:
+            filters.append(snap.by_tag.get(tag, set()))
+
+        candidates: Optional[Set[str]] = None
+        if filters:
+            filters.sort(key=len)
+            candidates = filters[0]
+            for other in filters[1:]:
+                candidates = candidates & other
+        if prefix:
+            start, end = snap.prefix_range(prefix)
+            name_keys, _ = snap.order("name")
+            if candidates is not None and len(candidates) <= end - start:
+                candidates = {name for name in candidates if name.startswith(prefix)}
+            elif candidates is not None:
+                candidates = {name for _, name in name_keys[start:end] if name in candidates}
+            elif sort_field != "name":
+                candidates = {name for _, name in name_keys[start:end]}
+
+        # Курсор — ключ последней выданной ВМ; границу находим бинарным поиском
+        lo, hi = 0, len(keys)
+        if prefix and sort_field == "name":
+            lo, hi = start, end
+        if cursor:
+            after = tuple(decode_cursor(cursor))
+            try:
+                if descending:
+                    hi = min(hi, bisect_left(keys, after))
+                else:
+                    lo = max(lo, bisect_right(keys, after))
+            except TypeError:
+                raise ValueError("Курсор не соответствует сортировке")
+
+        want = limit + 1 if limit is not None else None
+        if candidates is None:
+            total = (end - start) if prefix else len(keys)
+            positions = range(lo, hi)
+            if descending:
+                positions = positions[::-1]
+            positions = positions[:want] if want is not None else positions
+        elif want is not None and len(candidates) * settings.INVENTORY_SCAN_RATIO >= len(keys):
+            # Плотный фильтр: идем по индексу и проверяем принадлежность, пока не наберем страницу
+            total = len(candidates)
+            walk = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+            positions = []
+            for position in walk:
+                if keys[position][1] in candidates:
+                    positions.append(position)
+                    if len(positions) == want:
+                        break
+        else:
+            # Редкий фильтр: сортируем кандидатов по позиции в индексе
+            total = len(candidates)
+            positions = sorted(p for p in (rank[name] for name in candidates) if lo <= p < hi)
+            if descending:
+                positions.reverse()
+            positions = positions[:want] if want is not None else positions
+
+        page = positions[:limit] if limit is not None else positions
+        items = [snap.vms[keys[position][1]] for position in page]
+        next_cursor = None
+        if limit is not None and len(positions) > limit:
+            sort_value, name = keys[page[-1]]
+            next_cursor = encode_cursor(sort_value, name)
+
+        if fields:
+            items = [{field: vm.get(field) for field in fields} for vm in items]
+
+        return {"items": items, "next_cursor": next_cursor, "total": total, "generation": snap.generation}
+
+    def encoded_page(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                     status: Optional[str] = None, prefix: Optional[str] = None,
+                     tags: Optional[List[str]] = None, sort: str = "name",
+                     fields: Optional[List[str]] = None) -> PreEncoded:
+        """Сериализованная страница списка ВМ с заголовками ETag, X-Total-Count и X-Next-Cursor
+
+        Страницы кэшируются по поколению и параметрам запроса, поэтому
+        повторный запрос без изменений инвентаря не сериализуется заново.
+        """
+        if limit is not None:
+            limit = min(limit, settings.INVENTORY_MAX_LIMIT)
+        key = (
+            self.snapshot().generation, limit, cursor, status, prefix,
+            tuple(tags or ()), sort, tuple(fields or ())
+        )
+
+        def build() -> PreEncoded:
+            page = self.query(limit=limit, cursor=cursor, status=status, prefix=prefix,
+                              tags=tags, sort=sort, fields=fields)
+            headers = {
+                "ETag": make_etag(page["generation"]),
+                # no-cache: браузер каждый раз перепроверяет ETag и получает 304
+                "Cache-Control": "no-cache",
+                "X-Total-Count": str(page["total"]),
+            }
+            if page["next_cursor"]:
+                headers["X-Next-Cursor"] = page["next_cursor"]
+            return PreEncoded(page["items"], headers=headers)
+
+        return self._pages.get(key, build)
+
+
+# Глобальный экземпляр инвентаря
+vm_inventory = VMInventory()
+subscribe(vm_inventory.invalidate)
@@ -0,0 +1,105 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.state_store import state_store
+
+
+class JobManager:
+    """Фоновые задачи: block-commit, flatten, бэкапы, обслуживание дисков"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.JOB_WORKERS,
+            thread_name_prefix="job"
+        )
+        self.jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, target: str, func: Callable, *args, **kwargs) -> Dict:
+        """Поставить задачу в очередь
+
+        func получает первым аргументом словарь задачи и может обновлять
+        в нем поля progress и message; возвращаемое значение попадает в result.
+        """
+        job = self.create(kind, target)
+        self.run(job, func, *args, **kwargs)
+        return job
+
+    def create(self, kind: str, target: str) -> Dict:
+        """Зарегистрировать задачу без запуска (pending), запуск — run()
+
+        Для сервисов со своей очередью: задача видна в списке и занимает
+        объект (is_busy), но не держит поток пула, пока ждет ресурса.
+        """
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "kind": kind,
+            "target": target,
+            "status": "pending",
+            "progress": 0,
+            "message": "",
+            "result": None,
+            "error": None,
+            "created": datetime.now().isoformat(),
+            "started": None,
+            "finished": None,
+        }
+
+        with self._lock:
+            self.jobs[job["id"]] = job
+            self._trim()
+        return job
+
+    def run(self, job: Dict, func: Callable, *args, **kwargs):
+        """Выполнить зарегистрированную задачу в пуле"""
+        self.executor.submit(self._run, job, func, args, kwargs)
+
+    def _run(self, job: Dict, func: Callable, args, kwargs):
+        job["status"] = "running"
+        job["started"] = datetime.now().isoformat()
+        state_store.record_job(job)
+        try:
+            job["result"] = func(job, *args, **kwargs)
+            job["status"] = "completed"
+            job["progress"] = 100
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"⚠️  Задача {job['kind']} ({job['target']}) завершилась с ошибкой: {e}")
+        finally:
+            job["finished"] = datetime.now().isoformat()
+            state_store.record_job(job)
+
+    def _trim(self):
+        """Ограничить историю завершенных задач (под self._lock)"""
+        finished = [j for j in self.jobs.values() if j["status"] in ("completed", "failed")]
+        for job in finished[:max(0, len(finished) - settings.JOB_HISTORY_SIZE)]:
+            self.jobs.pop(job["id"], None)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Получить задачу по ID (вытесненные из памяти — из истории в хранилище)"""
+        job = self.jobs.get(job_id)
+        return dict(job) if job else state_store.get_job(job_id)
+
+    def list(self, kind: Optional[str] = None, target: Optional[str] = None) -> List[Dict]:
+        """Список задач, новые первыми"""
+        with self._lock:
+            jobs = [dict(j) for j in self.jobs.values()]
+        jobs = [j for j in jobs if (kind is None or j["kind"] == kind) and (target is None or j["target"] == target)]
+        return sorted(jobs, key=lambda j: j["created"], reverse=True)
+
+    def is_busy(self, target: str, kind_prefix: Optional[str] = None) -> bool:
+        """Есть ли незавершенные задачи для объекта (при kind_prefix — только такого вида)"""
+        return any(
+            j["target"] == target and j["status"] in ("pending", "running")
+            and (kind_prefix is None or j["kind"].startswith(kind_prefix))
+            for j in list(self.jobs.values())
+        )
+
+
+# Глобальный менеджер задач
+job_manager = JobManager()
@@ -1,8 +1,7 @@
 import platform
-import json
+import time
 from pathlib import Path
 from typing import List, Dict, Optional
-from datetime import datetime
 
 # Условный импорт libvirt только для Linux
 try:
@@ -14,170 +13,221 @@ except ImportError:
     libvirt = None  # type: ignore
 
 from app.core.config import settings
+from app.core.timing import timed
+from app.core.lifecycle import LazyService, is_initialized, on_shutdown, on_startup, unwrap
+from app.services.address_service import address_resolver
+from app.services.hypervisor_simulator import hypervisor_simulator, SimulatedFailure
+from app.services.job_service import job_manager
+from app.services.libvirt_events import register_domain_events
+from app.services.libvirt_pool import LibvirtPool, LibvirtUnavailable
+from app.services.libvirt_timing import timed_connection
+from app.services.state_store import state_store
 
 
 class KVMService:
     """Сервис для работы с KVM через libvirt или в демо-режиме"""
     
     def __init__(self):
-        self.conn = None
-        self.demo_mode = not LIBVIRT_AVAILABLE or platform.system() != "Linux"
-        
+        self.pool = LibvirtPool()
+        # Демо-режим работает на симуляторе гипервизора (app/services/hypervisor_simulator.py)
+        self.demo_mode = settings.SIMULATOR or not LIBVIRT_AVAILABLE or platform.system() != "Linux"
+
+        if settings.PROCESS_ROLE == "worker":
+            # В воркере libvirt не открывается: вызовы идут через коллектор (app/services/collector.py)
+            return
+
         if not self.demo_mode:
             self.connect()
+        elif settings.SIMULATOR:
+            print("🎭 Запуск на симуляторе гипервизора (KVM_SIMULATOR=1)")
         else:
             print("🎭 Запуск в демо-режиме (libvirt недоступен)")
     
     def connect(self):
-        """Подключение к libvirt"""
+        """Подключение к libvirt
+
+        Недоступный libvirtd не переводит сервис в демо-режим: вызовы
+        получают ошибку, пока фоновая проверка не восстановит соединение.
+        """
         if self.demo_mode:
             return
-            
+
+        # События доменов регистрируются на каждом новом основном соединении
+        self.pool.on_connect(register_domain_events)
+        self.pool.start_monitor()
         try:
-            self.conn = libvirt.open(settings.LIBVIRT_URI)
-            if self.conn is None:
-                raise Exception("Не удалось подключиться к libvirt")
-        except Exception as e:
-            print(f"⚠️  Переключение в демо-режим: {e}")
-            self.demo_mode = True
+            self.pool.primary()
+        except LibvirtUnavailable as e:
+            print(f"⚠️  {e}")
+
+    @property
+    def conn(self):
+        """Основное соединение с libvirt (переподключается после обрыва)"""
+        if self.demo_mode:
+            return None
+        return timed_connection(self.pool.primary())
+
+    def get_status(self) -> Dict:
+        """Состояние подключения к libvirt: ok, degraded или demo"""
+        if self.demo_mode:
+            return {"state": "demo", "demo_mode": True}
+        return {"demo_mode": False, **self.pool.status()}
+
+    def close(self):
+        """Закрыть соединения с libvirt"""
+        self.pool.close()
 
     def get_all_vms(self) -> List[Dict]:
         """Получить список всех ВМ"""
         if self.demo_mode:
-            return self._get_demo_vms()
+            return self._attach_metadata(self._get_demo_vms())
             
+        # Все домены (запущенные и остановленные) одним вызовом. Ошибка не превращается
+        # в пустой список: инвентарь иначе решил бы, что все ВМ удалены
+        with self.pool.connection() as conn:
+            domains = conn.listAllDomains(0)
+            vms = [self._domain_to_dict(domain) for domain in domains]
+            address_resolver.annotate(conn, domains, vms)
+        return self._attach_metadata(vms)
+
+    def _attach_metadata(self, vms: List[Dict]) -> List[Dict]:
+        """Добавить к ВМ сохраненные метаданные (один запрос к хранилищу на весь список)"""
         try:
-            vms = []
-            # Запущенные домены
-            for vm_id in self.conn.listDomainsID():
-                domain = self.conn.lookupByID(vm_id)
-                vms.append(self._domain_to_dict(domain))
-            
-            # Остановленные домены
-            for vm_name in self.conn.listDefinedDomains():
-                domain = self.conn.lookupByName(vm_name)
-                vms.append(self._domain_to_dict(domain))
-            
-            return vms
+            metadata = state_store.get_vms_meta()
         except Exception as e:
-            return []
+            print(f"⚠️  Метаданные ВМ недоступны: {e}")
+            metadata = {}
+        for vm in vms:
+            vm["metadata"] = metadata.get(vm.get("name"))
+        return vms
 
     def get_vm_info(self, vm_name: str) -> Optional[Dict]:
         """Получить информацию о ВМ"""
         if self.demo_mode:
-            vms = self._get_demo_vms()
-            for vm in vms:
-                if vm["name"] == vm_name:
-                    return vm
-            return None
+            vm = hypervisor_simulator.get_domain(vm_name)
+            return self._attach_metadata([vm])[0] if vm else None
             
         try:
-            domain = self.conn.lookupByName(vm_name)
-            return self._domain_to_dict(domain)
+            with self.pool.connection() as conn:
+                domain = conn.lookupByName(vm_name)
+                vm = self._domain_to_dict(domain)
+                address_resolver.annotate(conn, [domain], [vm])
+            vm["metadata"] = state_store.get_vm_meta(vm_name)
+            return vm
+        except LibvirtUnavailable:
+            raise
         except Exception as e:
             return None
 
     def start_vm(self, vm_name: str) -> Dict:
         """Запустить ВМ"""
+        if job_manager.is_busy(vm_name, "disk-"):
+            # qemu-img переписывает образ: запущенный гость потерял бы свои записи
+            return {"success": False, "message": f"Для ВМ {vm_name} выполняется обслуживание дисков"}
         if self.demo_mode:
-            return self._demo_vm_action(vm_name, "start")
+            return self._simulate(hypervisor_simulator.start, vm_name, f"ВМ {vm_name} запущена", "Ошибка запуска ВМ")
             
         try:
-            domain = self.conn.lookupByName(vm_name)
-            if domain.isActive():
-                return {"success": False, "message": "ВМ уже запущена"}
+            with self.pool.connection() as conn:
+                domain = conn.lookupByName(vm_name)
+                if domain.isActive():
+                    return {"success": False, "message": "ВМ уже запущена"}
             
-            domain.create()
-            return {"success": True, "message": f"ВМ {vm_name} запущена"}
+                domain.create()
+                return {"success": True, "message": f"ВМ {vm_name} запущена"}
         except Exception as e:
             return {"success": False, "message": f"Ошибка запуска ВМ: {e}"}
 
     def stop_vm(self, vm_name: str) -> Dict:
         """Остановить ВМ"""
         if self.demo_mode:
-            return self._demo_vm_action(vm_name, "stop")
+            return self._simulate(hypervisor_simulator.shutdown, vm_name, f"ВМ {vm_name} остановлена",
+                                  "Ошибка остановки ВМ")
             
         try:
-            domain = self.conn.lookupByName(vm_name)
-            if not domain.isActive():
-                return {"success": False, "message": "ВМ уже остановлена"}
+            with self.pool.connection() as conn:
+                domain = conn.lookupByName(vm_name)
+                if not domain.isActive():
+                    return {"success": False, "message": "ВМ уже остановлена"}
             
-            domain.shutdown()
-            return {"success": True, "message": f"ВМ {vm_name} остановлена"}
+                domain.shutdown()
+                return {"success": True, "message": f"ВМ {vm_name} остановлена"}
         except Exception as e:
             return {"success": False, "message": f"Ошибка остановки ВМ: {e}"}
 
     def force_stop_vm(self, vm_name: str) -> Dict:
         """Принудительно остановить ВМ"""
         if self.demo_mode:
-            return self._demo_vm_action(vm_name, "force_stop")
+            return self._simulate(hypervisor_simulator.destroy, vm_name, f"ВМ {vm_name} принудительно остановлена",
+                                  "Ошибка принудительной остановки ВМ")
             
         try:
-            domain = self.conn.lookupByName(vm_name)
-            domain.destroy()
-            return {"success": True, "message": f"ВМ {vm_name} принудительно остановлена"}
+            with self.pool.connection() as conn:
+                domain = conn.lookupByName(vm_name)
+                domain.destroy()
+                return {"success": True, "message": f"ВМ {vm_name} принудительно остановлена"}
         except Exception as e:
             return {"success": False, "message": f"Ошибка принудительной остановки ВМ: {e}"}
 
     def restart_vm(self, vm_name: str) -> Dict:
         """Перезагрузить ВМ"""
         if self.demo_mode:
-            return self._demo_vm_action(vm_name, "restart")
+            return self._simulate(hypervisor_simulator.reboot, vm_name, f"ВМ {vm_name} перезагружена",
+                                  "Ошибка перезагрузки ВМ")
             
         try:
-            domain = self.conn.lookupByName(vm_name)
-            domain.reboot()
-            return {"success": True, "message": f"ВМ {vm_name} перезагружена"}
+            with self.pool.connection() as conn:
+                domain = conn.lookupByName(vm_name)
+                domain.reboot()
+                return {"success": True, "message": f"ВМ {vm_name} перезагружена"}
         except Exception as e:
             return {"success": False, "message": f"Ошибка перезагрузки ВМ: {e}"}
 
     def delete_vm(self, vm_name: str) -> Dict:
         """Удалить ВМ"""
         if self.demo_mode:
-            return self._demo_vm_action(vm_name, "delete")
+            result = self._simulate(hypervisor_simulator.undefine, vm_name, f"ВМ {vm_name} удалена", "Ошибка удаления ВМ")
+            if result["success"]:
+                state_store.delete_vm(vm_name)
+            return result
             
         try:
-            domain = self.conn.lookupByName(vm_name)
-            
-            if domain.isActive():
-                domain.destroy()
+            with self.pool.connection() as conn:
+                domain = conn.lookupByName(vm_name)
             
-            # Получаем пути к дискам для удаления
-            xml_desc = domain.XMLDesc(0)
-            root = ET.fromstring(xml_desc)
+                if domain.isActive():
+                    domain.destroy()
             
-            disks = []
-            for disk in root.findall(".//devices/disk[@type='file']"):
-                source = disk.find("source")
-                if source is not None and "file" in source.attrib:
-                    disks.append(source.attrib["file"])
+                # Получаем пути к дискам для удаления
+                disks = [disk["source"] for disk in self.get_domain_disks(domain, device=None)]
             
-            # Удаляем домен
-            domain.undefine()
+                # Удаляем домен
+                domain.undefine()
+                state_store.delete_vm(vm_name)
             
-            # Удаляем диски
-            for disk_path in disks:
-                try:
-                    Path(disk_path).unlink()
-                except:
-                    pass
+                # Удаляем диски
+                for disk_path in disks:
+                    try:
+                        Path(disk_path).unlink()
+                    except:
+                        pass
             
-            return {"success": True, "message": f"ВМ {vm_name} удалена"}
+                return {"success": True, "message": f"ВМ {vm_name} удалена"}
         except Exception as e:
             return {"success": False, "message": f"Ошибка удаления ВМ: {e}"}
 
     def create_vm(self, vm_config: Dict) -> Dict:
         """Создать новую ВМ"""
+        # Проверяем обязательные параметры
+        required_fields = ['name', 'memory', 'vcpus', 'disk_size']
+        for field in required_fields:
+            if field not in vm_config:
+                return {"success": False, "message": f"Отсутствует обязательное поле: {field}"}
+
         if self.demo_mode:
-            return self._demo_vm_action(vm_config.get("name", "demo-vm"), "create")
-        
+            return self._create_simulated_vm(vm_config)
+
         try:
-            # Проверяем обязательные параметры
-            required_fields = ['name', 'memory', 'vcpus', 'disk_size']
-            for field in required_fields:
-                if field not in vm_config:
-                    return {"success": False, "message": f"Отсутствует обязательное поле: {field}"}
-            
             vm_name = vm_config['name']
             
             # Проверяем, что ВМ с таким именем не существует
@@ -189,6 +239,7 @@ class KVMService:
             
             # Создаем диск для ВМ
             disk_path = Path(settings.VM_STORAGE_PATH) / f"{vm_name}.qcow2"
+            disk_path.parent.mkdir(parents=True, exist_ok=True)
             disk_size = vm_config['disk_size']
             
             # Создаем qcow2 диск
@@ -203,6 +254,23 @@ class KVMService:
             
             # Создаем домен в libvirt
             domain = self.conn.defineXML(xml_config)
+
+            # Метаданные, которых нет в libvirt: ОС, ISO, владелец, теги
+            try:
+                state_store.upsert_vm(
+                    vm_name,
+                    uuid=domain.UUIDString(),
+                    os=vm_config.get("os_type"),
+                    iso_path=vm_config.get("iso_path"),
+                    owner=vm_config.get("owner"),
+                    tags=vm_config.get("tags"),
+                    memory_mb=vm_config["memory"],
+                    vcpus=vm_config["vcpus"],
+                    disk_size_gb=disk_size,
+                )
+                state_store.add_image(str(disk_path), vm_name, "disk", "qcow2", int(disk_size) * 1024 ** 3)
+            except Exception as e:
+                print(f"⚠️  Не удалось сохранить метаданные ВМ {vm_name}: {e}")
             
             return {
                 "success": True, 
@@ -220,6 +288,13 @@ class KVMService:
         memory_mb = config['memory']
         vcpus = config['vcpus']
         iso_path = config.get('iso_path', '')
+        # Запас для горячего добавления: vCPU до max_vcpus, память DIMM-модулями до max_memory
+        max_vcpus = max(vcpus, config.get('max_vcpus') or settings.VM_MAX_VCPUS)
+        max_memory_mb = max(memory_mb, config.get('max_memory') or memory_mb * settings.VM_MAX_MEMORY_FACTOR)
+        max_memory_xml = (
+            f"\n  <maxMemory slots='{settings.VM_MEMORY_SLOTS}' unit='MiB'>{max_memory_mb}</maxMemory>"
+            if max_memory_mb > memory_mb else ""
+        )
         
         # Определяем архитектуру
         arch = "x86_64"
@@ -228,10 +303,10 @@ class KVMService:
         # Базовая XML конфигурация
         xml = f"""<domain type='kvm'>
   <name>{vm_name}</name>
-  <uuid>{self._generate_uuid()}</uuid>
+  <uuid>{self._generate_uuid()}</uuid>{max_memory_xml}
   <memory unit='MiB'>{memory_mb}</memory>
   <currentMemory unit='MiB'>{memory_mb}</currentMemory>
-  <vcpu placement='static'>{vcpus}</vcpu>
+  <vcpu placement='static' current='{vcpus}'>{max_vcpus}</vcpu>
   <os>
     <type arch='{arch}' machine='{machine}'>hvm</type>
     <boot dev='cdrom'/>
@@ -242,7 +317,12 @@ class KVMService:
     <apic/>
     <pae/>
   </features>
-  <cpu mode='host-passthrough' check='none'/>
+  <cpu mode='host-passthrough' check='none'>
+    <!-- NUMA узел обязателен для горячего добавления памяти (DIMM) -->
+    <numa>
+      <cell id='0' cpus='0-{max_vcpus - 1}' memory='{memory_mb}' unit='MiB'/>
+    </numa>
+  </cpu>
   <clock offset='utc'>
     <timer name='rtc' tickpolicy='catchup'/>
     <timer name='pit' tickpolicy='delay'/>
@@ -332,6 +412,12 @@ class KVMService:
       <target type='serial' port='0'/>
     </console>
     
+    <!-- Balloon для динамического управления памятью -->
+    <memballoon model='virtio'>
+      <stats period='{settings.BALLOON_STATS_PERIOD}'/>
+      <address type='pci' domain='0x0000' bus='0x00' slot='0x07' function='0x0'/>
+    </memballoon>
+    
     <!-- Канал для QEMU guest agent -->
     <channel type='unix'>
       <target type='virtio' name='org.qemu.guest_agent.0'/>
@@ -343,6 +429,40 @@ class KVMService:
         
         return xml
     
+    def get_domain_disks(self, domain, inactive: bool = False, device: Optional[str] = "disk") -> List[Dict]:
+        """Файловые диски домена из XML: target, source, format"""
+        flags = libvirt.VIR_DOMAIN_XML_INACTIVE if inactive else 0
+        xml = domain.XMLDesc(flags)
+        with timed("xml"):
+            root = ET.fromstring(xml)
+
+        disks = []
+        for disk in root.findall(".//devices/disk[@type='file']"):
+            if device is not None and disk.get("device") != device:
+                continue
+            source = disk.find("source")
+            target = disk.find("target")
+            driver = disk.find("driver")
+            if source is None or "file" not in source.attrib:
+                continue
+            disks.append({
+                "target": target.get("dev") if target is not None else None,
+                "source": source.attrib["file"],
+                "format": driver.get("type", "raw") if driver is not None else "raw",
+                "device": disk.get("device"),
+            })
+        return disks
+
+    def wait_block_job(self, domain, target: str, ready: bool = False):
+        """Дождаться завершения (или, при ready, готовности к pivot) block job диска"""
+        while True:
+            info = domain.blockJobInfo(target, 0)
+            if not info:
+                return
+            if ready and info.get("cur") == info.get("end"):
+                return
+            time.sleep(settings.BLOCK_JOB_POLL_INTERVAL)
+
     def _generate_uuid(self) -> str:
         """Генерация UUID для ВМ"""
         import uuid
@@ -382,47 +502,48 @@ class KVMService:
         </domain>
         '''
 
-    # Демо-методы для работы без libvirt
+    # Демо-режим: операции выполняет симулятор гипервизора
+    def _simulate(self, operation, vm_name: str, message: str, error: str) -> Dict:
+        """Выполнить операцию симулятора и вернуть ответ в формате libvirt-ветки"""
+        try:
+            operation(vm_name)
+        except (LookupError, ValueError, SimulatedFailure) as e:
+            return {"success": False, "message": f"{error}: {e}", "demo_mode": True}
+        return {"success": True, "message": message, "vm_name": vm_name, "demo_mode": True}
+
+    def _create_simulated_vm(self, vm_config: Dict) -> Dict:
+        vm_name = vm_config["name"]
+        try:
+            domain = hypervisor_simulator.define(vm_name, vm_config["memory"], vm_config["vcpus"],
+                                                 vm_config["disk_size"], vm_config.get("os_type"))
+        except (ValueError, SimulatedFailure) as e:
+            return {"success": False, "message": f"Ошибка создания ВМ: {e}", "demo_mode": True}
+        try:
+            state_store.upsert_vm(
+                vm_name,
+                uuid=domain["uuid"],
+                os=vm_config.get("os_type"),
+                owner=vm_config.get("owner"),
+                tags=vm_config.get("tags"),
+                memory_mb=vm_config["memory"],
+                vcpus=vm_config["vcpus"],
+                disk_size_gb=vm_config["disk_size"],
+            )
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить метаданные ВМ {vm_name}: {e}")
+        return {"success": True, "message": f"ВМ '{vm_name}' создана успешно", "vm_name": vm_name, "demo_mode": True}
+
     def _get_demo_vms(self) -> List[Dict]:
-        """Получить демо-список ВМ"""
-        demo_file = Path("data/demo_vms.json")
-        if demo_file.exists():
-            try:
-                with open(demo_file, encoding="utf-8") as f:
-                    return json.load(f)
-            except:
-                pass
-        
-        # Базовые демо-данные если файл не найден
-        return [
-            {
-                "id": "demo-vm-1",
-                "name": "Ubuntu-Demo",
-                "status": "running",
-                "memory": 2048,
-                "vcpus": 2,
-                "disk_size": "20G",
-                "ip_address": "192.168.122.100",
-                "os": "Ubuntu 22.04 (демо)",
-                "created": datetime.now().isoformat(),
-                "uptime": "Demo mode"
-            },
-            {
-                "id": "demo-vm-2", 
-                "name": "CentOS-Demo",
-                "status": "stopped",
-                "memory": 1024,
-                "vcpus": 1,
-                "disk_size": "15G",
-                "ip_address": "192.168.122.101",
-                "os": "CentOS Stream 9 (демо)",
-                "created": datetime.now().isoformat(),
-                "uptime": "0"
-            }
-        ]
-    
+        """Домены симулятора"""
+        return hypervisor_simulator.list_domains()
+
     def _demo_vm_action(self, vm_name: str, action: str) -> Dict:
-        """Эмуляция действий с ВМ в демо-режиме"""
+        """Операция без смены состояния ВМ на симуляторе: проверка ВМ, задержка и внедренный сбой"""
+        try:
+            hypervisor_simulator.action(vm_name, action)
+        except (LookupError, SimulatedFailure) as e:
+            return {"success": False, "message": f"Демо: {action} для ВМ {vm_name} не выполнено: {e}",
+                    "vm_name": vm_name, "action": action, "demo_mode": True}
         return {
             "success": True,
             "message": f"Демо: {action} для ВМ {vm_name} выполнено успешно",
@@ -432,5 +553,16 @@ class KVMService:
         }
 
 
-# Создаем глобальный экземпляр сервиса
-kvm_service = KVMService()
+# Глобальный экземпляр сервиса: подключение к libvirt при запуске приложения или первом обращении
+kvm_service = LazyService(KVMService)
+
+
+@on_startup
+def _connect():
+    unwrap(kvm_service)
+
+
+@on_shutdown
+def _disconnect():
+    if is_initialized(kvm_service):
+        kvm_service.close()
@@ -0,0 +1,88 @@
+import threading
+from typing import Optional
+
+# Условный импорт libvirt только для Linux
+try:
+    import libvirt  # type: ignore
+    LIBVIRT_AVAILABLE = True
+except ImportError:
+    LIBVIRT_AVAILABLE = False
+    libvirt = None  # type: ignore
+
+
+_event_loop_lock = threading.Lock()
+_event_loop_thread = None
+_subscribers = []
+
+# Порядок совпадает с virDomainEventType
+LIFECYCLE_EVENTS = (
+    "defined", "undefined", "started", "suspended", "resumed",
+    "stopped", "shutdown", "pmsuspended", "crashed",
+)
+
+
+def _run_event_loop():
+    while True:
+        try:
+            libvirt.virEventRunDefaultImpl()
+        except Exception as e:
+            print(f"⚠️  Ошибка цикла событий libvirt: {e}")
+
+
+def ensure_event_loop() -> bool:
+    """Запустить цикл событий libvirt в фоновом потоке (один раз на процесс)
+
+    Должен вызываться до открытия соединений: без зарегистрированного цикла
+    libvirt не доставляет события доменов и потоков (streams).
+    """
+    global _event_loop_thread
+
+    if not LIBVIRT_AVAILABLE:
+        return False
+
+    with _event_loop_lock:
+        if _event_loop_thread is None:
+            libvirt.virEventRegisterDefaultImpl()
+            _event_loop_thread = threading.Thread(
+                target=_run_event_loop,
+                name="libvirt-events",
+                daemon=True
+            )
+            _event_loop_thread.start()
+    return True
+
+
+def subscribe(callback):
+    """Подписаться на события жизненного цикла доменов: callback(vm_name, event, detail)
+
+    Callback вызывается в потоке цикла событий libvirt и должен быть быстрым.
+    """
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+
+
+def unsubscribe(callback):
+    """Отписаться от событий доменов"""
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+
+def publish(vm_name: str, event: str, detail=None):
+    """Разослать событие подписчикам"""
+    for callback in list(_subscribers):
+        try:
+            callback(vm_name, event, detail)
+        except Exception as e:
+            print(f"⚠️  Ошибка обработчика события {event} ВМ {vm_name}: {e}")
+
+
+def _on_lifecycle(conn, domain, event, detail, opaque):
+    name = LIFECYCLE_EVENTS[event] if 0 <= event < len(LIFECYCLE_EVENTS) else str(event)
+    publish(domain.name(), name, detail)
+
+
+def register_domain_events(conn) -> Optional[int]:
+    """Подписать соединение на события жизненного цикла всех доменов"""
+    if not LIBVIRT_AVAILABLE or conn is None:
+        return None
+    return conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, _on_lifecycle, None)
@@ -0,0 +1,267 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# Условный импорт libvirt только для Linux
+try:
+    import libvirt  # type: ignore
+    LIBVIRT_AVAILABLE = True
+except ImportError:
+    LIBVIRT_AVAILABLE = False
+    libvirt = None  # type: ignore
+
+from app.core.config import settings
+from app.services.libvirt_events import ensure_event_loop
+from app.services.libvirt_timing import timed_connection
+
+
+# Коды ошибок, означающие потерю соединения, а не ошибку самой операции
+_CONNECTION_ERROR_NAMES = ("VIR_ERR_SYSTEM_ERROR", "VIR_ERR_NO_CONNECT", "VIR_ERR_INVALID_CONN", "VIR_ERR_RPC")
+
+
+class LibvirtUnavailable(RuntimeError):
+    """libvirt недоступен: подключение не удалось или автомат разомкнут до следующей попытки"""
+
+
+def is_connection_error(error: Exception) -> bool:
+    if not LIBVIRT_AVAILABLE or not isinstance(error, libvirt.libvirtError):
+        return False
+    codes = {getattr(libvirt, name) for name in _CONNECTION_ERROR_NAMES if hasattr(libvirt, name)}
+    return error.get_error_code() in codes
+
+
+def _alive(conn) -> bool:
+    try:
+        return bool(conn.isAlive())
+    except Exception:
+        return False
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class LibvirtPool:
+    """Пул соединений с libvirt с keepalive, переподключением и автоматическим выключателем
+
+    Основное соединение живет долго: на нем события доменов и потоки консолей.
+    Остальные выдаются операциям через connection(), чтобы независимые вызовы
+    не выстраивались в очередь на одном сокете. После неудачного подключения
+    автомат размыкается: до следующей попытки (экспоненциальная задержка с
+    разбросом) вызовы сразу получают LibvirtUnavailable, а не ждут таймаута.
+    """
+
+    def __init__(self, uri: Optional[str] = None, size: Optional[int] = None):
+        self.uri = uri or settings.LIBVIRT_URI
+        self.size = size or settings.LIBVIRT_POOL_SIZE
+        self._idle: List = []
+        self._open_count = 0  # Выданные и свободные соединения пула, без основного
+        self._cond = threading.Condition()
+        self._primary = None
+        self._primary_lock = threading.Lock()
+        self._on_connect: List[Callable] = []
+        self._monitor: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+
+        # closed — работаем, open — ждем retry_at, half_open — идет пробное подключение
+        self.circuit = "closed"
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error: Optional[str] = None
+        self.stats = {"opened": 0, "failed": 0, "lost": 0, "acquired": 0, "waited": 0}
+
+    def on_connect(self, callback: Callable):
+        """callback(conn) для каждого нового основного соединения (регистрация событий)"""
+        self._on_connect.append(callback)
+
+    # Автомат
+
+    def _before_attempt(self):
+        with self._cond:
+            if self.circuit == "closed":
+                return
+            now = time.monotonic()
+            if self.circuit == "half_open" or now < self.retry_at:
+                raise LibvirtUnavailable(
+                    f"libvirt недоступен, повтор через {max(self.retry_at - now, 0):.1f} с: {self.last_error}"
+                )
+            # Одна пробная попытка, остальные отклоняются до ее результата
+            self.circuit = "half_open"
+
+    def _record_failure(self, error: Exception):
+        with self._cond:
+            self.failures += 1
+            self.stats["failed"] += 1
+            self.last_error = str(error)
+            delay = min(settings.LIBVIRT_RECONNECT_MAX, settings.LIBVIRT_RECONNECT_MIN * 2 ** (self.failures - 1))
+            self.retry_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+            if self.circuit != "open":
+                print(f"⚠️  libvirt недоступен ({error}), повтор через {delay:.1f} с")
+            self.circuit = "open"
+
+    def _record_success(self):
+        with self._cond:
+            if self.circuit != "closed":
+                print(f"✅ Соединение с libvirt восстановлено после {self.failures} неудачных попыток")
+            self.circuit = "closed"
+            self.failures = 0
+
+    def _open(self):
+        self._before_attempt()
+        try:
+            if not LIBVIRT_AVAILABLE:
+                raise LibvirtUnavailable("libvirt-python не установлен")
+            # Без цикла событий не работают keepalive, события доменов и streams
+            ensure_event_loop()
+            conn = libvirt.open(self.uri)
+            if conn is None:
+                raise LibvirtUnavailable(f"Не удалось подключиться к {self.uri}")
+            conn.setKeepAlive(settings.LIBVIRT_KEEPALIVE_INTERVAL, settings.LIBVIRT_KEEPALIVE_COUNT)
+            conn.registerCloseCallback(self._on_closed, None)
+        except Exception as e:
+            self._record_failure(e)
+            if isinstance(e, LibvirtUnavailable):
+                raise
+            raise LibvirtUnavailable(f"Не удалось подключиться к {self.uri}: {e}") from e
+        self._record_success()
+        self.stats["opened"] += 1
+        return conn
+
+    def _on_closed(self, conn, reason, opaque):
+        # Вызывается из цикла событий: keepalive не дождался ответа или libvirtd закрыл соединение
+        self.stats["lost"] += 1
+        self.last_error = f"соединение закрыто libvirt (причина {reason})"
+        if self._primary is conn:
+            self._primary = None
+
+    # Соединения
+
+    def primary(self):
+        """Долгоживущее соединение для событий доменов, консолей и прямых вызовов сервисов"""
+        conn = self._primary
+        if conn is not None and _alive(conn):
+            return conn
+        with self._primary_lock:
+            conn = self._primary
+            if conn is not None and _alive(conn):
+                return conn
+            if conn is not None:
+                _close_quietly(conn)
+                self._primary = None
+            conn = self._open()
+            for callback in self._on_connect:
+                try:
+                    callback(conn)
+                except Exception as e:
+                    print(f"⚠️  Ошибка настройки соединения с libvirt: {e}")
+            self._primary = conn
+            return conn
+
+    def _acquire(self, timeout: Optional[float]):
+        deadline = time.monotonic() + (settings.LIBVIRT_ACQUIRE_TIMEOUT if timeout is None else timeout)
+        with self._cond:
+            while True:
+                while self._idle:
+                    conn = self._idle.pop()
+                    if _alive(conn):
+                        self.stats["acquired"] += 1
+                        return conn
+                    self._open_count -= 1
+                    _close_quietly(conn)
+                if self._open_count < self.size:
+                    self._open_count += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LibvirtUnavailable(f"Нет свободных соединений с libvirt (пул {self.size})")
+                self.stats["waited"] += 1
+                self._cond.wait(remaining)
+
+        # Подключение вне блокировки: оно может занять время, остальные берут свободные
+        try:
+            conn = self._open()
+        except Exception:
+            with self._cond:
+                self._open_count -= 1
+                self._cond.notify()
+            raise
+        self.stats["acquired"] += 1
+        return conn
+
+    def _release(self, conn, broken: bool):
+        with self._cond:
+            if broken or self._closed.is_set() or not _alive(conn):
+                self._open_count -= 1
+                self._cond.notify()
+            else:
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+        _close_quietly(conn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Соединение из пула на время операции; потерянное соединение в пул не возвращается
+
+        Вызовы через выданное соединение и полученные из него домены замеряются (app/core/timing.py).
+        """
+        conn = self._acquire(timeout)
+        broken = False
+        try:
+            yield timed_connection(conn)
+        except Exception as e:
+            if is_connection_error(e) or not _alive(conn):
+                broken = True
+                self._record_failure(e)
+            raise
+        finally:
+            self._release(conn, broken)
+
+    # Проверка здоровья
+
+    def start_monitor(self):
+        """Фоновая проверка основного соединения: после рестарта libvirtd события возобновятся сами"""
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._monitor_loop, name="libvirt-health", daemon=True)
+            self._monitor.start()
+
+    def _monitor_loop(self):
+        while not self._closed.wait(settings.LIBVIRT_HEALTH_INTERVAL):
+            try:
+                self.primary()
+            except LibvirtUnavailable:
+                pass
+
+    def status(self) -> Dict:
+        """Состояние подключения для /health: ok или degraded"""
+        with self._cond:
+            retry_in = max(self.retry_at - time.monotonic(), 0) if self.circuit != "closed" else 0
+            return {
+                "state": "ok" if self.circuit == "closed" else "degraded",
+                "circuit": self.circuit,
+                "uri": self.uri,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "retry_in": round(retry_in, 1),
+                "pool_size": self.size,
+                "pool_open": self._open_count,
+                "pool_idle": len(self._idle),
+                "primary_alive": self._primary is not None and _alive(self._primary),
+                **self.stats,
+            }
+
+    def close(self):
+        """Закрыть все соединения (при остановке приложения)"""
+        self._closed.set()
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+        with self._primary_lock:
+            primary, self._primary = self._primary, None
+        for conn in idle + ([primary] if primary is not None else []):
+            _close_quietly(conn)
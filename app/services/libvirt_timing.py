@@ -0,0 +1,108 @@
+import time
+from typing import Optional
+
+# Условный импорт libvirt только для Linux
+try:
+    import libvirt  # type: ignore
+    LIBVIRT_AVAILABLE = True
+except ImportError:
+    LIBVIRT_AVAILABLE = False
+    libvirt = None  # type: ignore
+
+from app.core.config import settings
+from app.core.timing import timing_stats
+
+
+def _unwrap(value):
+    """Настоящие объекты libvirt в аргументах (libvirt проверяет их тип)"""
+    if isinstance(value, _TimedProxy):
+        return value._target
+    if isinstance(value, list) and value and isinstance(value[0], _TimedProxy):
+        return [_unwrap(item) for item in value]
+    return value
+
+
+def _wrap(value):
+    """Обернуть домены в результате вызова: список доменов, (домен, статистика) из getAllDomainStats"""
+    if not LIBVIRT_AVAILABLE:
+        return value
+    if isinstance(value, libvirt.virDomain):
+        return TimedDomain(value)
+    if isinstance(value, list) and value and isinstance(value[0], (libvirt.virDomain, tuple)):
+        return [_wrap(item) for item in value]
+    if isinstance(value, tuple) and value and isinstance(value[0], libvirt.virDomain):
+        return (TimedDomain(value[0]),) + value[1:]
+    return value
+
+
+class _TimedProxy:
+    """Объект libvirt, каждый вызов метода которого учитывается в timing_stats"""
+
+    __slots__ = ("_target",)
+    _kind = ""
+
+    def __init__(self, target):
+        object.__setattr__(self, "_target", target)
+
+    def _domain_name(self, method: str, args) -> Optional[str]:
+        return None
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            error = False
+            try:
+                return _wrap(attr(*[_unwrap(arg) for arg in args], **kwargs))
+            except Exception:
+                error = True
+                raise
+            finally:
+                timing_stats.record_call(f"{self._kind}.{name}", self._domain_name(name, args),
+                                         time.perf_counter() - started, error)
+        return call
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self._target!r}>"
+
+
+class TimedConnection(_TimedProxy):
+    """virConnect с замером вызовов; домены из lookup/list тоже возвращаются с замером"""
+
+    __slots__ = ()
+    _kind = "conn"
+
+    def _domain_name(self, method: str, args) -> Optional[str]:
+        if method == "lookupByName" and args:
+            return args[0]
+        return None
+
+
+class TimedDomain(_TimedProxy):
+    """virDomain с замером вызовов; имя домена попадает в журнал медленных вызовов"""
+
+    __slots__ = ("_name",)
+    _kind = "domain"
+
+    def __init__(self, target):
+        super().__init__(target)
+        object.__setattr__(self, "_name", None)
+
+    def _domain_name(self, method: str, args) -> Optional[str]:
+        if self._name is None:
+            try:
+                # virDomainGetName читается из объекта на клиенте, без обращения к libvirtd
+                object.__setattr__(self, "_name", self._target.name())
+            except Exception:
+                return None
+        return self._name
+
+
+def timed_connection(conn):
+    """Соединение с замером вызовов, если замеры включены (TIMING_ENABLED)"""
+    if conn is None or not settings.TIMING_ENABLED:
+        return conn
+    return TimedConnection(conn)
@@ -0,0 +1,213 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Optional, Set
+
+from app.core.config import settings
+from app.services.kvm_service import kvm_service
+from app.services.job_service import job_manager
+from app.services import qemu_img
+
+
+OPERATIONS = ("compact", "sparsify", "preallocate")
+PREALLOCATION_MODES = ("off", "metadata", "falloc", "full")
+
+
+def allocated_bytes(path: str) -> int:
+    """Реально занятое место на диске (st_blocks), а не виртуальный размер файла"""
+    return os.stat(path).st_blocks * 512
+
+
+class MaintenanceService:
+    """Обслуживание дисков выключенных ВМ: compact, sparsify и смена preallocation"""
+
+    def __init__(self):
+        # Очередь ведется здесь, а не семафором внутри задачи: ожидающая задача
+        # не занимает поток job_manager, который нужен снапшотам и бэкапам
+        self._running: Dict[int, int] = {}  # устройство -> задач обслуживания
+        self._waiting: List = []  # (задача, устройства, аргументы) в порядке постановки
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _devices(disks: List[Dict]) -> Set[int]:
+        """Блочные устройства, где лежат образы дисков"""
+        return {os.stat(Path(disk["source"]).parent).st_dev for disk in disks}
+
+    def _dispatch(self):
+        """Запустить ожидающие задачи, для всех устройств которых есть свободный слот"""
+        ready = []
+        with self._lock:
+            for entry in list(self._waiting):
+                job, devices, args = entry
+                if all(self._running.get(device, 0) < settings.MAINTENANCE_PER_DEVICE for device in devices):
+                    for device in devices:
+                        self._running[device] = self._running.get(device, 0) + 1
+                    self._waiting.remove(entry)
+                    ready.append(entry)
+        for job, devices, args in ready:
+            job_manager.run(job, self._gated_job, devices, *args)
+
+    def _gated_job(self, job: Dict, devices: Set[int], *args):
+        try:
+            return self._maintenance_job(job, *args)
+        finally:
+            with self._lock:
+                for device in devices:
+                    self._running[device] -= 1
+            self._dispatch()
+
+    def _io_prefix(self) -> List[str]:
+        """Команда-обертка с пониженным приоритетом ввода-вывода и CPU"""
+        if not settings.MAINTENANCE_LOW_PRIORITY:
+            return []
+        prefix = []
+        if shutil.which("ionice"):
+            prefix += ["ionice", "-c", "3"]
+        if shutil.which("nice"):
+            prefix += ["nice", "-n", "19"]
+        return prefix
+
+    def start(self, vm_name: str, operation: str, compress: bool = False,
+              preallocation: Optional[str] = None) -> Dict:
+        """Запустить обслуживание дисков выключенной ВМ в фоне"""
+        if operation not in OPERATIONS:
+            return {"success": False, "message": f"Операция должна быть одной из: {', '.join(OPERATIONS)}"}
+        if operation == "preallocate" and preallocation not in PREALLOCATION_MODES:
+            return {"success": False, "message": f"Режим preallocation должен быть одним из: {', '.join(PREALLOCATION_MODES)}"}
+
+        if kvm_service.demo_mode:
+            return kvm_service._demo_vm_action(vm_name, operation)
+
+        try:
+            domain = kvm_service.conn.lookupByName(vm_name)
+        except Exception as e:
+            return {"success": False, "message": f"ВМ не найдена: {e}"}
+
+        if domain.isActive():
+            return {"success": False, "message": f"ВМ {vm_name} запущена, обслуживание дисков возможно только у выключенной ВМ"}
+        if job_manager.is_busy(vm_name):
+            return {"success": False, "message": f"Для ВМ {vm_name} уже выполняется фоновая задача"}
+
+        disks = [d for d in kvm_service.get_domain_disks(domain, inactive=True) if d["source"]]
+        try:
+            devices = self._devices(disks)
+        except OSError as e:
+            return {"success": False, "message": f"Диск ВМ {vm_name} недоступен: {e}"}
+        job = job_manager.create(f"disk-{operation}", vm_name)
+        job["message"] = "Ожидание очереди устройства"
+        with self._lock:
+            self._waiting.append((job, devices, (vm_name, operation, compress, preallocation)))
+        self._dispatch()
+        return {"success": True, "message": f"Обслуживание дисков ВМ {vm_name} ({operation}) запущено", "job_id": job["id"]}
+
+    def schedule(self, operation: str, vm_names: Optional[List[str]] = None, compress: bool = False,
+                 preallocation: Optional[str] = None) -> Dict:
+        """Поставить обслуживание для всех (или перечисленных) выключенных ВМ"""
+        if vm_names is None:
+            vm_names = [vm["name"] for vm in kvm_service.get_all_vms() if vm.get("status") != "running"]
+
+        jobs, skipped = [], {}
+        for vm_name in vm_names:
+            result = self.start(vm_name, operation, compress=compress, preallocation=preallocation)
+            if result.get("job_id"):
+                jobs.append(result["job_id"])
+            elif not result.get("success"):
+                skipped[vm_name] = result["message"]
+
+        return {
+            "success": True,
+            "message": f"Запущено задач обслуживания: {len(jobs)}, пропущено ВМ: {len(skipped)}",
+            "jobs": jobs,
+            "skipped": skipped,
+        }
+
+    def _maintenance_job(self, job: Dict, vm_name: str, operation: str, compress: bool,
+                         preallocation: Optional[str]):
+        domain = kvm_service.conn.lookupByName(vm_name)
+        disks = [d for d in kvm_service.get_domain_disks(domain, inactive=True) if d["source"]]
+        prefix = self._io_prefix()
+
+        results = []
+        for index, disk in enumerate(disks):
+            job["message"] = f"{operation} {disk['target']}"
+            results.append(self._process_disk(job, domain, disk, operation, compress, preallocation, prefix))
+            job["progress"] = int((index + 1) * 100 / max(len(disks), 1))
+
+        return {
+            "operation": operation,
+            "disks": results,
+            "bytes_reclaimed": sum(r["bytes_reclaimed"] for r in results),
+        }
+
+    def _process_disk(self, job: Dict, domain, disk: Dict, operation: str, compress: bool,
+                      preallocation: Optional[str], prefix: List[str]) -> Dict:
+        path = disk["source"]
+        before = allocated_bytes(path)
+        started = time.monotonic()
+
+        if operation == "sparsify" and shutil.which("virt-sparsify"):
+            # Освобождает блоки, удаленные в файловых системах гостя (fstrim внутри образа)
+            result = subprocess.run(prefix + ["virt-sparsify", "--in-place", path], capture_output=True, text=True)
+            if result.returncode != 0:
+                raise qemu_img.QemuImgError(f"virt-sparsify: {result.stderr.strip()}")
+        else:
+            self._rewrite(job, domain, disk, operation, compress, preallocation, prefix)
+
+        after = allocated_bytes(path)
+        return {
+            "target": disk["target"],
+            "path": path,
+            "bytes_before": before,
+            "bytes_after": after,
+            "bytes_reclaimed": before - after,
+            "duration": round(time.monotonic() - started, 2),
+        }
+
+    def _rewrite(self, job: Dict, domain, disk: Dict, operation: str, compress: bool,
+                 preallocation: Optional[str], prefix: List[str]):
+        """Переписать образ через qemu-img convert во временный файл и атомарно подменить"""
+        path = disk["source"]
+        fmt = disk["format"] or "raw"
+        backing = qemu_img.backing_file(path) if fmt == "qcow2" else None
+        backing_format = qemu_img.info(backing).get("format", "qcow2") if backing else "qcow2"
+
+        options = []
+        if operation == "preallocate":
+            options.append(f"preallocation={preallocation}")
+        tmp_path = f"{path}.maint-{job['id']}.tmp"
+        source = os.stat(path)
+
+        try:
+            # -B сохраняет backing chain: в новый верхний слой копируются только его данные.
+            # --bitmaps сохраняет bitmap checkpoint'ов бэкапа: без них следующий инкремент невозможен
+            qemu_img.convert(
+                path, tmp_path, out_format=fmt,
+                compress=compress and fmt == "qcow2",
+                backing=backing, backing_format=backing_format,
+                options=options, rate_limit=settings.MAINTENANCE_RATE_LIMIT,
+                prefix=prefix, bitmaps=fmt == "qcow2"
+            )
+
+            st = os.stat(path)
+            # Образ изменился во время копирования (ВМ успели запустить и остановить) — копия устарела
+            if (st.st_mtime_ns, st.st_size) != (source.st_mtime_ns, source.st_size):
+                raise RuntimeError(f"Образ {path} изменился во время обслуживания, изменения отменены")
+            os.chmod(tmp_path, st.st_mode)
+            try:
+                os.chown(tmp_path, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+
+            # ВМ могли запустить, пока шло копирование: тогда результат отбрасываем
+            if domain.isActive():
+                raise RuntimeError(f"ВМ {domain.name()} запущена во время обслуживания, изменения отменены")
+            os.replace(tmp_path, path)
+        finally:
+            Path(tmp_path).unlink(missing_ok=True)
+
+
+# Глобальный экземпляр сервиса
+maintenance_service = MaintenanceService()
@@ -0,0 +1,99 @@
+import socket
+import struct
+
+
+NBD_MAGIC = b"NBDMAGIC"
+IHAVEOPT = 0x49484156454F5054
+OPT_REPLY_MAGIC = 0x3E889045565A9
+REQUEST_MAGIC = 0x25609513
+SIMPLE_REPLY_MAGIC = 0x67446698
+
+NBD_FLAG_FIXED_NEWSTYLE = 1 << 0
+NBD_FLAG_NO_ZEROES = 1 << 1
+NBD_OPT_GO = 7
+NBD_REP_ACK = 1
+NBD_REP_INFO = 3
+NBD_REP_FLAG_ERROR = 1 << 31
+NBD_INFO_EXPORT = 0
+NBD_CMD_READ = 0
+NBD_CMD_DISC = 2
+
+
+class NBDError(Exception):
+    """Ошибка протокола NBD"""
+
+
+class NBDClient:
+    """Минимальный read-only NBD клиент (fixed newstyle, простые ответы)
+
+    Достаточен для чтения экспортов qemu-nbd и pull-mode бэкапов libvirt
+    без внешних зависимостей.
+    """
+
+    def __init__(self, socket_path: str, export_name: str = ""):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.size = 0
+        self._handle = 0
+        self._handshake(export_name)
+
+    def _recv_exact(self, length: int) -> bytes:
+        buf = bytearray(length)
+        view = memoryview(buf)
+        received = 0
+        while received < length:
+            n = self.sock.recv_into(view[received:])
+            if n == 0:
+                raise NBDError("Соединение NBD закрыто сервером")
+            received += n
+        return bytes(buf)
+
+    def _handshake(self, export_name: str):
+        magic, opt_magic, flags = struct.unpack(">8sQH", self._recv_exact(18))
+        if magic != NBD_MAGIC or opt_magic != IHAVEOPT:
+            raise NBDError("Сервер не поддерживает newstyle NBD")
+        if not flags & NBD_FLAG_FIXED_NEWSTYLE:
+            raise NBDError("Сервер не поддерживает fixed newstyle NBD")
+
+        client_flags = NBD_FLAG_FIXED_NEWSTYLE | (flags & NBD_FLAG_NO_ZEROES)
+        self.sock.sendall(struct.pack(">I", client_flags))
+
+        name = export_name.encode()
+        data = struct.pack(">I", len(name)) + name + struct.pack(">H", 0)
+        self.sock.sendall(struct.pack(">QII", IHAVEOPT, NBD_OPT_GO, len(data)) + data)
+
+        while True:
+            magic, _option, reply, length = struct.unpack(">QIII", self._recv_exact(20))
+            payload = self._recv_exact(length) if length else b""
+            if magic != OPT_REPLY_MAGIC:
+                raise NBDError("Неверный ответ NBD на опцию")
+            if reply & NBD_REP_FLAG_ERROR:
+                raise NBDError(f"Экспорт '{export_name}' недоступен: {payload.decode(errors='replace')}")
+            if reply == NBD_REP_INFO and struct.unpack(">H", payload[:2])[0] == NBD_INFO_EXPORT:
+                self.size = struct.unpack(">QH", payload[2:12])[0]
+            elif reply == NBD_REP_ACK:
+                return
+
+    def pread(self, length: int, offset: int) -> bytes:
+        """Прочитать length байт начиная с offset"""
+        self._handle += 1
+        self.sock.sendall(struct.pack(">IHHQQI", REQUEST_MAGIC, 0, NBD_CMD_READ, self._handle, offset, length))
+        magic, error, handle = struct.unpack(">IIQ", self._recv_exact(16))
+        if magic != SIMPLE_REPLY_MAGIC or handle != self._handle:
+            raise NBDError("Неверный ответ NBD на чтение")
+        if error:
+            raise NBDError(f"Ошибка чтения NBD: errno {error}")
+        return self._recv_exact(length)
+
+    def close(self):
+        try:
+            self.sock.sendall(struct.pack(">IHHQQI", REQUEST_MAGIC, 0, NBD_CMD_DISC, 0, 0, 0))
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
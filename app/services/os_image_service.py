@@ -1,7 +1,6 @@
 import json
 import os
 import hashlib
-import requests
 from pathlib import Path
 from typing import List, Dict, Optional
 from datetime import datetime
@@ -14,9 +13,6 @@ class OSImageService:
         self.data_dir = Path("data")
         self.iso_dir = self.data_dir / "images" / "iso"
         self.catalog_file = self.data_dir / "os_catalog.json"
-        
-        # Создаем директории если их нет
-        self.iso_dir.mkdir(parents=True, exist_ok=True)
     
     def get_os_catalog(self) -> List[Dict]:
         """Получить каталог доступных ОС"""
@@ -65,9 +61,16 @@ class OSImageService:
         if iso_path.exists():
             return {"success": False, "message": "ISO файл уже существует"}
         
+        try:
+            # requests нужен только здесь: импорт на старте стоит десятки миллисекунд
+            import requests
+        except ImportError:
+            return {"success": False, "message": "Для скачивания образов установите requests"}
+
         try:
             # Скачиваем файл
             print(f"🔽 Начинаем скачивание {os_info['name']}...")
+            self.iso_dir.mkdir(parents=True, exist_ok=True)
             response = requests.get(os_info['download_url'], stream=True)
             response.raise_for_status()
             
@@ -183,6 +186,7 @@ class OSImageService:
         
         try:
             import shutil
+            self.iso_dir.mkdir(parents=True, exist_ok=True)
             shutil.copy2(source_path, destination)
             
             return {
@@ -0,0 +1,212 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.kvm_service import kvm_service
+from app.services.job_service import job_manager
+from app.services.libvirt_events import subscribe, unsubscribe
+
+
+# Действие: метод kvm_service и состояние ВМ, которое подтверждает завершение
+ACTIONS = {
+    "start": ("start_vm", "running"),
+    "stop": ("stop_vm", "stopped"),
+    "force_stop": ("force_stop_vm", "stopped"),
+    "restart": ("restart_vm", None),  # reboot не меняет состояние домена — подтверждать нечем
+}
+
+# События жизненного цикла, после которых ВМ находится в состоянии
+TARGET_EVENTS = {
+    "running": {"started", "resumed"},
+    "stopped": {"stopped"},
+}
+
+
+class StateWaiter:
+    """Ожидание целевых состояний ВМ по событиям жизненного цикла libvirt
+
+    Подписка оформляется до отправки команд, поэтому событие, пришедшее
+    раньше, чем начато ожидание, не теряется.
+    """
+
+    def __init__(self, targets: Dict[str, str]):
+        self.targets = targets
+        self._reached = {name: threading.Event() for name in targets}
+        self.reached_at: Dict[str, float] = {}
+        subscribe(self._on_event)
+
+    def _on_event(self, vm_name: str, event: str, detail=None):
+        target = self.targets.get(vm_name)
+        if target is not None and event in TARGET_EVENTS[target]:
+            self.mark(vm_name)
+
+    def mark(self, vm_name: str):
+        """Отметить, что ВМ достигла целевого состояния"""
+        self.reached_at.setdefault(vm_name, time.monotonic())
+        self._reached[vm_name].set()
+
+    def wait(self, vm_name: str, deadline: float) -> bool:
+        return self._reached[vm_name].wait(max(0.0, deadline - time.monotonic()))
+
+    def close(self):
+        unsubscribe(self._on_event)
+
+
+class PowerService:
+    """Массовые операции питания ВМ: выбор по именам/тегам/статусу, параллельный запуск, ожидание состояния"""
+
+    def select(self, names: Optional[List[str]] = None, tags: Optional[List[str]] = None,
+               status: Optional[str] = None, all_vms: bool = False) -> Tuple[List[str], List[str]]:
+        """Имена ВМ под селектором и имена из names, которых нет в инвентаре"""
+        if not (names or tags or status or all_vms):
+            raise ValueError("Укажите names, tags, status или all=true")
+
+        from app.services.inventory_service import vm_inventory
+        snap = vm_inventory.snapshot()
+        missing = [name for name in names or [] if name not in snap.vms]
+        selected = set(names) - set(missing) if names else set(snap.vms)
+        if status:
+            selected &= snap.by_status.get(status, set())
+        for tag in tags or []:
+            selected &= snap.by_tag.get(tag, set())
+        return sorted(selected), missing
+
+    def run(self, action: str, names: Optional[List[str]] = None, tags: Optional[List[str]] = None,
+            status: Optional[str] = None, all_vms: bool = False, concurrency: Optional[int] = None,
+            wait: bool = False, timeout: Optional[float] = None, background: bool = False) -> Dict:
+        """Выполнить действие над выбранными ВМ; с background — фоновой задачей"""
+        if action not in ACTIONS:
+            raise ValueError(f"Действие должно быть одним из: {', '.join(ACTIONS)}")
+        selected, missing = self.select(names, tags, status, all_vms)
+
+        if background:
+            job = job_manager.submit(
+                f"power-{action}", "bulk", self._bulk_job,
+                action, selected, concurrency, wait, timeout, missing
+            )
+            return {
+                "success": True,
+                "message": f"{action} для {len(selected)} ВМ поставлено в очередь",
+                "job_id": job["id"],
+                "selected": len(selected),
+                "missing": missing,
+            }
+        return self.execute(action, selected, concurrency=concurrency, wait=wait, timeout=timeout, missing=missing)
+
+    def _bulk_job(self, job: Dict, action: str, vm_names: List[str], concurrency: Optional[int],
+                  wait: bool, timeout: Optional[float], missing: List[str]):
+        def progress(done: int, total: int, stage: str):
+            job["progress"] = int(done * 100 / max(total, 1))
+            job["message"] = f"{stage}: {done}/{total}"
+        return self.execute(action, vm_names, concurrency=concurrency, wait=wait, timeout=timeout,
+                            missing=missing, progress=progress)
+
+    def _status(self, vm_name: str) -> Optional[str]:
+        try:
+            vm = kvm_service.get_vm_info(vm_name)
+        except Exception:
+            return None
+        return vm.get("status") if vm else None
+
+    def execute(self, action: str, vm_names: Iterable[str], concurrency: Optional[int] = None,
+                wait: bool = False, timeout: Optional[float] = None, missing: Iterable[str] = (),
+                progress=None) -> Dict:
+        """Отправить действие всем ВМ (не более concurrency одновременно) и дождаться подтверждения
+
+        Команды и ожидание разделены: слот параллельности занят только на время
+        вызова libvirt, а ожидание состояния идет для всех ВМ сразу. Срок
+        отсчитывается от выполнения команды: время в очереди допуска запусков
+        в него не входит.
+        """
+        method_name, target = ACTIONS[action]
+        if action == "start":
+            # Запуски идут через очередь допуска, чтобы не устроить boot storm
+            from app.services.boot_scheduler import boot_scheduler
+            method = partial(boot_scheduler.start, timeout=settings.BOOT_WAIT_TIMEOUT)
+        else:
+            method = getattr(kvm_service, method_name)
+        vm_names = list(vm_names)
+        missing = list(missing)
+        concurrency = max(1, min(concurrency or settings.POWER_CONCURRENCY, settings.POWER_MAX_CONCURRENCY))
+        timeout = settings.POWER_WAIT_TIMEOUT if timeout is None else timeout
+        started = time.monotonic()
+        deadlines: Dict[str, float] = {}
+
+        waiter = StateWaiter({name: target for name in vm_names}) if wait and target else None
+        done = [0]
+        done_lock = threading.Lock()
+
+        def send(vm_name: str) -> Dict:
+            sent_at = time.monotonic()
+            try:
+                result = method(vm_name)
+            except Exception as e:
+                result = {"success": False, "message": str(e)}
+            deadlines[vm_name] = time.monotonic() + timeout
+            entry = {
+                "name": vm_name,
+                "success": bool(result.get("success")),
+                "message": result.get("message"),
+                "state": "sent" if result.get("success") else "failed",
+                "sent_after": round(sent_at - started, 3),
+            }
+            # Не дождались допуска: запуск остается в очереди и выполнится позже
+            if result.get("status") in ("queued", "starting"):
+                entry.update(success=True, state="queued")
+            # "ВМ уже остановлена" и т.п.: ошибка команды, но цель уже достигнута
+            if not entry["success"] and target and self._status(vm_name) == target:
+                entry.update(success=True, state="already")
+                if waiter is not None:
+                    waiter.mark(vm_name)
+            with done_lock:
+                done[0] += 1
+                if progress:
+                    progress(done[0], len(vm_names), "отправлено")
+            return entry
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(concurrency, max(len(vm_names), 1)),
+                                    thread_name_prefix="power") as pool:
+                results = list(pool.map(send, vm_names))
+
+            if waiter is not None:
+                confirmed = 0
+                for entry in results:
+                    if entry["state"] not in ("sent", "queued"):
+                        continue
+                    if waiter.wait(entry["name"], deadlines[entry["name"]]) or self._status(entry["name"]) == target:
+                        entry["state"] = "confirmed"
+                        entry["elapsed"] = round(waiter.reached_at.get(entry["name"], time.monotonic()) - started, 3)
+                    else:
+                        entry["state"] = "timeout"
+                        entry["success"] = False
+                        entry["message"] = f"ВМ не перешла в состояние {target} за {timeout} с"
+                    confirmed += 1
+                    if progress:
+                        progress(confirmed, len(results), "подтверждено")
+        finally:
+            if waiter is not None:
+                waiter.close()
+
+        counts = {}
+        for entry in results:
+            counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+        failed = sum(1 for entry in results if not entry["success"])
+        return {
+            "success": failed == 0 and not missing,
+            "action": action,
+            "total": len(results),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "states": counts,
+            "missing": missing,
+            "duration": round(time.monotonic() - started, 3),
+            "results": results,
+        }
+
+
+# Глобальный экземпляр сервиса
+power_service = PowerService()
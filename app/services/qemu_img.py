@@ -0,0 +1,76 @@
+import json
+import subprocess
+from typing import Dict, List, Optional
+
+
+class QemuImgError(Exception):
+    """Ошибка выполнения qemu-img"""
+
+
+def run(args: List[str], prefix: Optional[List[str]] = None) -> str:
+    """Выполнить qemu-img и вернуть stdout"""
+    cmd = (prefix or []) + ["qemu-img"] + args
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise QemuImgError(f"{' '.join(cmd)}: {result.stderr.strip()}")
+    return result.stdout
+
+
+def info(path: str, backing_chain: bool = False) -> Dict:
+    """Информация об образе (с backing_chain — список слоев от верхнего к базовому)"""
+    args = ["info", "--output=json", "-U"]
+    if backing_chain:
+        args.append("--backing-chain")
+    return json.loads(run(args + [path]))
+
+
+def backing_file(path: str) -> Optional[str]:
+    """Полный путь к backing файлу образа"""
+    data = info(path)
+    return data.get("full-backing-filename") or data.get("backing-filename")
+
+
+def create_overlay(path: str, backing: str, backing_format: str = "qcow2"):
+    """Создать qcow2 overlay поверх backing образа — O(1) независимо от размера диска"""
+    run(["create", "-q", "-f", "qcow2", "-F", backing_format, "-b", backing, path])
+
+
+def commit(path: str):
+    """Влить overlay в его backing образ (для выключенной ВМ)"""
+    run(["commit", "-q", "-f", "qcow2", path])
+
+
+def rebase_unsafe(path: str, backing: str, backing_format: str = "qcow2"):
+    """Сменить backing файл без копирования данных"""
+    run(["rebase", "-u", "-f", "qcow2", "-F", backing_format, "-b", backing, path])
+
+
+def allocation_map(spec: str, image_opts: bool = False) -> List[Dict]:
+    """Карта экстентов образа (qemu-img map): start, length, data, zero"""
+    args = ["map", "--output=json"]
+    if image_opts:
+        args.append("--image-opts")
+    return json.loads(run(args + [spec]))
+
+
+def convert(src: str, dst: str, out_format: str = "qcow2", compress: bool = False,
+            backing: Optional[str] = None, backing_format: str = "qcow2",
+            options: Optional[List[str]] = None, rate_limit: int = 0,
+            prefix: Optional[List[str]] = None, bitmaps: bool = False):
+    """Скопировать образ в новый файл, пропуская нулевые и невыделенные области
+
+    С backing в новый образ попадают только данные, отличающиеся от backing.
+    bitmaps переносит persistent dirty bitmaps (qcow2 -> qcow2), без него они теряются.
+    """
+    args = ["convert", "-q", "-O", out_format]
+    if bitmaps:
+        args.append("--bitmaps")
+    if compress:
+        args.append("-c")
+    if backing:
+        args += ["-B", backing, "-F", backing_format]
+    for option in options or []:
+        args += ["-o", option]
+    if rate_limit:
+        args += ["-r", f"{rate_limit}M"]
+    run(args + [src, dst], prefix=prefix)
@@ -0,0 +1,186 @@
+import math
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.kvm_service import kvm_service, LIBVIRT_AVAILABLE
+
+if LIBVIRT_AVAILABLE:
+    import libvirt  # type: ignore
+
+
+_UNITS_KIB = {"b": 1 / 1024, "bytes": 1 / 1024, "KiB": 1, "k": 1, "KB": 1000 / 1024,
+              "MiB": 1024, "M": 1024, "MB": 1000 ** 2 / 1024, "GiB": 1024 ** 2, "G": 1024 ** 2}
+
+
+def _kib(element) -> int:
+    """Размер из элемента XML libvirt (<memory unit='...'>) в KiB"""
+    return int(int(element.text) * _UNITS_KIB.get(element.get("unit", "KiB"), 1))
+
+
+def _dimms(root) -> List:
+    return root.findall("./devices/memory[@model='dimm']")
+
+
+class ResizeService:
+    """Изменение числа vCPU и объема памяти ВМ без остановки
+
+    vCPU добавляются и удаляются на лету в пределах максимума домена. Память
+    уменьшается и возвращается через balloon, а сверх текущего объема
+    добавляется DIMM-модулем (нужны maxMemory и NUMA узел в XML). Если
+    изменение на лету невозможно, оно записывается в конфигурацию домена и
+    вступит в силу после перезапуска ВМ.
+    """
+
+    def resize(self, vm_name: str, vcpus: Optional[int] = None, memory_mb: Optional[int] = None,
+               live: bool = True) -> Dict:
+        """Изменить vCPU и/или память; live=False — только конфигурация"""
+        if vcpus is None and memory_mb is None:
+            raise ValueError("Укажите vcpus и/или memory")
+
+        if kvm_service.demo_mode:
+            result = kvm_service._demo_vm_action(vm_name, "resize")
+            result.update(vcpus=vcpus, memory=memory_mb, restart_required=False)
+            return result
+
+        result = {"success": True, "vm_name": vm_name, "restart_required": False, "warnings": []}
+        with kvm_service.pool.connection() as conn:
+            try:
+                domain = conn.lookupByName(vm_name)
+            except libvirt.libvirtError:
+                raise LookupError(f"ВМ {vm_name} не найдена")
+            live = live and bool(domain.isActive())
+            if vcpus is not None:
+                # Проверка до любых изменений, чтобы не применить память и упасть на vCPU
+                maximum = domain.vcpusFlags(libvirt.VIR_DOMAIN_AFFECT_CONFIG | libvirt.VIR_DOMAIN_VCPU_MAXIMUM)
+                if vcpus > max(maximum, settings.VM_MAX_VCPUS):
+                    raise ValueError(f"vCPU больше допустимого максимума {max(maximum, settings.VM_MAX_VCPUS)}")
+
+            config = {}
+            if vcpus is not None:
+                result["vcpus"] = self._resize_vcpus(domain, vcpus, live, result["warnings"])
+                if not result["vcpus"]["live"]:
+                    config["vcpus"] = vcpus
+            if memory_mb is not None:
+                result["memory"] = self._resize_memory(domain, memory_mb, live, result["warnings"])
+                if not result["memory"]["live"]:
+                    config["memory_mb"] = memory_mb
+
+            if config:
+                self._redefine(conn, domain, **config)
+                result["restart_required"] = bool(domain.isActive())
+
+        try:
+            from app.services.state_store import state_store
+            from app.services.inventory_service import vm_inventory
+            state_store.upsert_vm(vm_name, vcpus=vcpus, memory_mb=memory_mb)
+            vm_inventory.invalidate()
+        except Exception as e:
+            print(f"⚠️  Не удалось обновить метаданные ВМ {vm_name}: {e}")
+
+        if result["restart_required"]:
+            result["message"] = f"Конфигурация ВМ {vm_name} изменена, часть изменений вступит в силу после перезапуска"
+        else:
+            result["message"] = f"Ресурсы ВМ {vm_name} изменены"
+        return result
+
+    def _resize_vcpus(self, domain, vcpus: int, live: bool, warnings: List[str]) -> Dict:
+        if not live:
+            return {"requested": vcpus, "live": False, "method": "config"}
+
+        maximum = domain.vcpusFlags(libvirt.VIR_DOMAIN_AFFECT_LIVE | libvirt.VIR_DOMAIN_VCPU_MAXIMUM)
+        if vcpus > maximum:
+            warnings.append(f"vCPU больше максимума запущенной ВМ ({maximum}): изменение только в конфигурации")
+            return {"requested": vcpus, "live": False, "method": "config", "maximum": maximum}
+
+        try:
+            domain.setVcpusFlags(vcpus, libvirt.VIR_DOMAIN_AFFECT_LIVE | libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+        except libvirt.libvirtError as e:
+            # Например, гость не отдал vCPU при hot-unplug
+            warnings.append(f"vCPU на лету не изменены: {e}")
+            return {"requested": vcpus, "live": False, "method": "config", "maximum": maximum}
+        return {"requested": vcpus, "live": True, "method": "hotplug", "maximum": maximum}
+
+    def _resize_memory(self, domain, memory_mb: int, live: bool, warnings: List[str]) -> Dict:
+        if not live:
+            return {"requested_mb": memory_mb, "live": False, "method": "config"}
+
+        target = memory_mb * 1024
+        flags = libvirt.VIR_DOMAIN_AFFECT_LIVE | libvirt.VIR_DOMAIN_AFFECT_CONFIG
+        total = domain.maxMemory()  # Текущий объем памяти ВМ с учетом DIMM, KiB
+        added_mb = 0
+
+        if target > total:
+            root = ET.fromstring(domain.XMLDesc(0))
+            max_memory = root.find("maxMemory")
+            if max_memory is None:
+                warnings.append("В XML ВМ нет maxMemory: память увеличится после перезапуска")
+                return {"requested_mb": memory_mb, "live": False, "method": "config"}
+            align = settings.VM_DIMM_ALIGN_MB
+            added_mb = math.ceil((target - total) / 1024 / align) * align
+            if total + added_mb * 1024 > _kib(max_memory) or len(_dimms(root)) >= int(max_memory.get("slots", 0)):
+                warnings.append(f"Нет места для DIMM (maxMemory {_kib(max_memory) // 1024} МБ, "
+                                f"слотов {max_memory.get('slots')}): память увеличится после перезапуска")
+                return {"requested_mb": memory_mb, "live": False, "method": "config"}
+
+            dimm = (f"<memory model='dimm'><target><size unit='MiB'>{added_mb}</size>"
+                    f"<node>0</node></target></memory>")
+            try:
+                domain.attachDeviceFlags(dimm, flags)
+            except libvirt.libvirtError as e:
+                warnings.append(f"DIMM не добавлен: {e}")
+                return {"requested_mb": memory_mb, "live": False, "method": "config"}
+
+        # Точный объем (DIMM округлен вверх) и уменьшение — через balloon
+        try:
+            domain.setMemoryFlags(target, flags)
+        except libvirt.libvirtError as e:
+            if not added_mb:
+                warnings.append(f"balloon не изменен: {e}")
+                return {"requested_mb": memory_mb, "live": False, "method": "config"}
+            warnings.append(f"DIMM добавлен, но balloon не выставлен точно: {e}")
+        return {"requested_mb": memory_mb, "live": True, "method": "dimm" if added_mb else "balloon",
+                "dimm_mb": added_mb or None}
+
+    def _redefine(self, conn, domain, vcpus: Optional[int] = None, memory_mb: Optional[int] = None):
+        """Записать vCPU и память в постоянную конфигурацию домена (вступит в силу при следующем запуске)"""
+        root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+
+        if vcpus is not None:
+            vcpu = root.find("vcpu")
+            maximum = int(vcpu.text)
+            if vcpus > maximum:
+                vcpu.text = str(vcpus)
+                maximum = vcpus
+                # Список отдельных vCPU libvirt пересоздаст под новый максимум
+                individual = root.find("vcpus")
+                if individual is not None:
+                    root.remove(individual)
+                cells = root.findall("./cpu/numa/cell")
+                if len(cells) == 1:
+                    cells[0].set("cpus", f"0-{maximum - 1}")
+            vcpu.set("current", str(vcpus))
+
+        if memory_mb is not None:
+            target = memory_mb * 1024
+            dimms = sum(_kib(dimm.find("./target/size")) for dimm in _dimms(root))
+            cells = root.findall("./cpu/numa/cell")
+            max_memory = root.find("maxMemory")
+            if max_memory is not None and target > _kib(max_memory):
+                max_memory.text, max_memory.attrib["unit"] = str(target), "KiB"
+            base = target - dimms
+            if base <= 0:
+                raise ValueError(f"Память меньше суммарного размера DIMM ({dimms // 1024} МБ)")
+            for cell in cells:
+                cell.set("memory", str(base // len(cells)))
+                cell.set("unit", "KiB")
+            for tag in ("memory", "currentMemory"):
+                element = root.find(tag)
+                if element is not None:
+                    element.text, element.attrib["unit"] = str(target), "KiB"
+
+        conn.defineXML(ET.tostring(root, encoding="unicode"))
+
+
+# Глобальный экземпляр сервиса
+resize_service = ResizeService()
@@ -0,0 +1,330 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.lifecycle import on_shutdown
+from app.services.kvm_service import kvm_service, LIBVIRT_AVAILABLE
+from app.services.console_service import ConsoleError, ConsoleSession
+from app.services.libvirt_pool import LibvirtPool
+
+if LIBVIRT_AVAILABLE:
+    import libvirt  # type: ignore
+
+
+RECV_CHUNK = 64 * 1024
+
+# Соединение воркера для потоков консолей (--workers N): virStream не передается коллектору
+_worker_pool: Optional[LibvirtPool] = None
+_worker_pool_lock = threading.Lock()
+
+
+def _console_conn():
+    """Соединение, на котором открываются потоки консолей и работает цикл событий процесса"""
+    global _worker_pool
+    if settings.PROCESS_ROLE != "worker":
+        return kvm_service.conn
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = LibvirtPool(size=1)
+            on_shutdown(_worker_pool.close)
+    return _worker_pool.primary()
+
+
+class ScrollbackBuffer:
+    """Кольцевой буфер последнего вывода консоли"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = bytearray()
+
+    def append(self, data: bytes):
+        self._data += data
+        overflow = len(self._data) - self.capacity
+        if overflow > 0:
+            del self._data[:overflow]
+
+    def snapshot(self) -> bytes:
+        return bytes(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LibvirtConsoleStream:
+    """Неблокирующий поток serial консоли домена через virStream"""
+
+    def __init__(self, vm_name: str, on_data, on_close):
+        self.vm_name = vm_name
+        self.on_data = on_data
+        self.on_close = on_close
+        self.stream = None
+        self._pending = bytearray()
+        self._lock = threading.Lock()
+        self._read_events = (
+            libvirt.VIR_STREAM_EVENT_READABLE
+            | libvirt.VIR_STREAM_EVENT_ERROR
+            | libvirt.VIR_STREAM_EVENT_HANGUP
+        )
+
+    def open(self):
+        conn = _console_conn()
+        try:
+            domain = conn.lookupByName(self.vm_name)
+        except libvirt.libvirtError as e:
+            raise ConsoleError(f"ВМ {self.vm_name} не найдена: {e}")
+        if not domain.isActive():
+            raise ConsoleError(f"ВМ {self.vm_name} не запущена")
+
+        self.stream = conn.newStream(libvirt.VIR_STREAM_NONBLOCK)
+        # FORCE: забираем консоль у зависшей предыдущей сессии
+        domain.openConsole(None, self.stream, libvirt.VIR_DOMAIN_CONSOLE_FORCE)
+        self.stream.eventAddCallback(self._read_events, self._on_event, None)
+
+    def _on_event(self, stream, events, opaque):
+        """Обработчик событий потока (вызывается в потоке цикла событий libvirt)"""
+        if events & libvirt.VIR_STREAM_EVENT_READABLE:
+            while True:
+                try:
+                    data = stream.recv(RECV_CHUNK)
+                except libvirt.libvirtError:
+                    self._hangup()
+                    return
+                if data == -2:
+                    break  # EAGAIN: данных больше нет
+                if not data:
+                    self._hangup()
+                    return
+                self.on_data(data)
+
+        if events & libvirt.VIR_STREAM_EVENT_WRITABLE:
+            with self._lock:
+                self._flush()
+
+        if events & (libvirt.VIR_STREAM_EVENT_ERROR | libvirt.VIR_STREAM_EVENT_HANGUP):
+            self._hangup()
+
+    def _flush(self):
+        """Отправить накопленный ввод без блокировки (под self._lock)"""
+        if self.stream is None:
+            return
+        while self._pending:
+            sent = self.stream.send(bytes(self._pending))
+            if sent == -2:
+                break
+            del self._pending[:sent]
+
+        # Подписываемся на WRITABLE только пока есть неотправленные данные
+        events = self._read_events
+        if self._pending:
+            events |= libvirt.VIR_STREAM_EVENT_WRITABLE
+        self.stream.eventUpdateCallback(events)
+
+    def send(self, data: bytes):
+        with self._lock:
+            if self.stream is None:
+                return
+            self._pending += data
+            self._flush()
+
+    def _hangup(self):
+        self.close()
+        self.on_close()
+
+    def close(self):
+        with self._lock:
+            stream, self.stream = self.stream, None
+        if stream is None:
+            return
+        try:
+            stream.eventRemoveCallback()
+            stream.abort()
+        except libvirt.libvirtError:
+            pass
+
+
+class DemoConsoleStream:
+    """Эмуляция serial консоли для демо-режима: баннер и эхо ввода"""
+
+    def __init__(self, vm_name: str, on_data, on_close):
+        self.vm_name = vm_name
+        self.on_data = on_data
+        self.on_close = on_close
+
+    def open(self):
+        self.on_data(f"\r\nUbuntu 22.04.3 LTS {self.vm_name} ttyS0 (демо)\r\n\r\n{self.vm_name} login: ".encode())
+
+    def send(self, data: bytes):
+        self.on_data(data.replace(b"\r", b"\r\n"))
+
+    def close(self):
+        pass
+
+
+class SerialSubscription:
+    """Подключение одного WebSocket клиента к консоли ВМ"""
+
+    def __init__(self, vm_name: str, loop: asyncio.AbstractEventLoop, client: Optional[str] = None):
+        self.vm_name = vm_name
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=settings.SERIAL_CLIENT_QUEUE)
+        self.session = ConsoleSession(vm_name, "serial", client)
+        self.backlog = b""
+        self.dropped = 0
+
+    def deliver(self, data: Optional[bytes]):
+        """Передать данные клиенту (вызывается в цикле asyncio клиента)"""
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # Медленный клиент: теряем вывод, но не расходуем память без предела
+            self.dropped += 1
+
+
+class SerialConsole:
+    """Поток консоли одной ВМ и ее scrollback"""
+
+    def __init__(self, vm_name: str):
+        self.vm_name = vm_name
+        self.scrollback = ScrollbackBuffer(settings.SERIAL_SCROLLBACK_SIZE)
+        self.stream = None
+        self.subscribers: List[SerialSubscription] = []
+        self.idle_since = time.time()
+
+
+class SerialConsoleHub:
+    """Общие потоки serial консолей: один virStream на ВМ для всех клиентов"""
+
+    def __init__(self, max_streams: Optional[int] = None):
+        self.max_streams = max_streams or settings.SERIAL_MAX_STREAMS
+        self.consoles: Dict[str, SerialConsole] = {}
+        self._lock = threading.Lock()
+
+    def _open_streams(self) -> int:
+        return sum(1 for c in self.consoles.values() if c.stream is not None)
+
+    def _reap_idle(self, force: bool = False):
+        """Закрыть потоки без клиентов: просроченные, а при force — самый старый"""
+        now = time.time()
+        idle = sorted(
+            (c for c in self.consoles.values() if c.stream is not None and not c.subscribers),
+            key=lambda c: c.idle_since
+        )
+        for console in idle:
+            if now - console.idle_since > settings.SERIAL_IDLE_TIMEOUT:
+                self._close_console(console)
+            elif force:
+                self._close_console(console)
+                return
+
+    def _close_console(self, console: SerialConsole):
+        stream, console.stream = console.stream, None
+        if stream is not None:
+            stream.close()
+        if not console.subscribers:
+            self.consoles.pop(console.vm_name, None)
+
+    def _make_stream(self, console: SerialConsole):
+        stream_class = DemoConsoleStream if kvm_service.demo_mode else LibvirtConsoleStream
+        return stream_class(
+            console.vm_name,
+            on_data=lambda data: self._on_data(console, data),
+            on_close=lambda: self._on_close(console)
+        )
+
+    def _on_data(self, console: SerialConsole, data: bytes):
+        with self._lock:
+            console.scrollback.append(data)
+            subscribers = list(console.subscribers)
+        for sub in subscribers:
+            sub.loop.call_soon_threadsafe(sub.deliver, data)
+
+    def _on_close(self, console: SerialConsole):
+        with self._lock:
+            console.stream = None
+            subscribers = list(console.subscribers)
+        for sub in subscribers:
+            sub.loop.call_soon_threadsafe(sub.deliver, None)
+
+    def subscribe(self, vm_name: str, loop: asyncio.AbstractEventLoop,
+                  client: Optional[str] = None) -> SerialSubscription:
+        """Подключить клиента к консоли ВМ, открыв поток при необходимости"""
+        with self._lock:
+            self._reap_idle()
+            console = self.consoles.get(vm_name)
+            new_stream = console is None or console.stream is None
+            if new_stream:
+                if self._open_streams() >= self.max_streams:
+                    self._reap_idle(force=True)
+                if self._open_streams() >= self.max_streams:
+                    raise ConsoleError("Превышено максимальное число serial консолей")
+
+                console = console or SerialConsole(vm_name)
+                console.stream = self._make_stream(console)
+                self.consoles[vm_name] = console
+
+            subscription = SerialSubscription(vm_name, loop, client)
+            # Scrollback и подписка под одной блокировкой: вывод не теряется и не дублируется
+            subscription.backlog = console.scrollback.snapshot()
+            console.subscribers.append(subscription)
+
+        if new_stream:
+            # open() вызывается вне блокировки: вывод потока сам идет через _on_data
+            try:
+                console.stream.open()
+            except Exception as e:
+                self.unsubscribe(subscription)
+                with self._lock:
+                    self._close_console(console)
+                if isinstance(e, ConsoleError):
+                    raise
+                raise ConsoleError(f"Не удалось открыть serial консоль ВМ {vm_name}: {e}")
+
+        return subscription
+
+    def unsubscribe(self, subscription: SerialSubscription):
+        """Отключить клиента; поток остается открытым до SERIAL_IDLE_TIMEOUT"""
+        with self._lock:
+            console = self.consoles.get(subscription.vm_name)
+            if console is None:
+                return
+            if subscription in console.subscribers:
+                console.subscribers.remove(subscription)
+            if not console.subscribers:
+                console.idle_since = time.time()
+                if console.stream is None:
+                    # Поток уже закрыт (ВМ выключена) — scrollback больше не нужен
+                    self.consoles.pop(console.vm_name, None)
+
+    def write(self, subscription: SerialSubscription, data: bytes):
+        """Передать ввод клиента в консоль"""
+        console = self.consoles.get(subscription.vm_name)
+        if console is None or console.stream is None:
+            raise ConsoleError("Консоль закрыта")
+        subscription.session.bytes_from_client += len(data)
+        console.stream.send(data)
+
+    def get_sessions(self, vm_name: Optional[str] = None) -> List[Dict]:
+        """Клиенты serial консолей с учетом трафика"""
+        with self._lock:
+            return [
+                dict(sub.session.to_dict(), dropped=sub.dropped)
+                for console in self.consoles.values()
+                for sub in console.subscribers
+                if vm_name is None or console.vm_name == vm_name
+            ]
+
+    def get_stats(self) -> Dict:
+        """Сводная статистика serial консолей"""
+        with self._lock:
+            return {
+                "open_streams": self._open_streams(),
+                "max_streams": self.max_streams,
+                "clients": sum(len(c.subscribers) for c in self.consoles.values()),
+                "scrollback_bytes": sum(len(c.scrollback) for c in self.consoles.values()),
+            }
+
+
+# Глобальный экземпляр хаба консолей
+serial_hub = SerialConsoleHub()
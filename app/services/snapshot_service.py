@@ -0,0 +1,312 @@
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from app.core.config import settings
+from app.services.kvm_service import kvm_service, LIBVIRT_AVAILABLE
+from app.services.job_service import job_manager
+from app.services.state_store import state_store
+from app.services import qemu_img
+
+if LIBVIRT_AVAILABLE:
+    import libvirt  # type: ignore
+    import xml.etree.ElementTree as ET
+
+
+SNAPSHOT_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+
+
+class SnapshotService:
+    """Внешние (external) qcow2 снапшоты: создание за O(1), удаление через block-commit"""
+
+    def __init__(self):
+        self._cache: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._demo_snapshots: Dict[str, List[Dict]] = {}
+
+    def _invalidate(self, vm_name: str):
+        with self._lock:
+            self._cache.pop(vm_name, None)
+
+    def list_snapshots(self, vm_name: str) -> List[Dict]:
+        """Список снапшотов ВМ (кэшируется на домен)"""
+        if kvm_service.demo_mode:
+            return list(self._demo_snapshots.get(vm_name, []))
+
+        with self._lock:
+            cached = self._cache.get(vm_name)
+            if cached and time.time() - cached["time"] < settings.SNAPSHOT_CACHE_TTL:
+                return cached["snapshots"]
+
+        domain = kvm_service.conn.lookupByName(vm_name)
+        snapshots = [self._snapshot_to_dict(snap) for snap in domain.listAllSnapshots()]
+        snapshots.sort(key=lambda s: s["created"])
+
+        with self._lock:
+            self._cache[vm_name] = {"time": time.time(), "snapshots": snapshots}
+        return snapshots
+
+    def _snapshot_to_dict(self, snap) -> Dict:
+        root = ET.fromstring(snap.getXMLDesc(0))
+        memory = root.find("memory")
+        parent = root.find("parent/name")
+
+        disks = []
+        for disk in root.findall("disks/disk"):
+            source = disk.find("source")
+            disks.append({
+                "target": disk.get("name"),
+                "snapshot": disk.get("snapshot"),
+                "file": source.get("file") if source is not None else None,
+            })
+
+        return {
+            "name": root.findtext("name"),
+            "description": root.findtext("description"),
+            "created": datetime.fromtimestamp(int(root.findtext("creationTime", "0"))).isoformat(),
+            "state": root.findtext("state"),
+            "parent": parent.text if parent is not None else None,
+            "current": bool(snap.isCurrent()),
+            "memory": memory is not None and memory.get("snapshot") == "external",
+            "memory_file": memory.get("file") if memory is not None else None,
+            "disks": disks,
+        }
+
+    def create_snapshot(self, vm_name: str, name: str, description: Optional[str] = None,
+                        include_memory: bool = False, quiesce: bool = False) -> Dict:
+        """Создать внешний снапшот: новые overlay поверх текущих дисков"""
+        if not SNAPSHOT_NAME_RE.match(name):
+            return {"success": False, "message": "Недопустимое имя снапшота"}
+
+        if kvm_service.demo_mode:
+            snapshots = self._demo_snapshots.setdefault(vm_name, [])
+            if any(s["name"] == name for s in snapshots):
+                return {"success": False, "message": f"Снапшот '{name}' уже существует"}
+            snapshots.append({
+                "name": name,
+                "description": description,
+                "created": datetime.now().isoformat(),
+                "state": "running",
+                "memory": include_memory,
+                "demo_mode": True,
+            })
+            return {"success": True, "message": f"Демо: снапшот '{name}' создан", "demo_mode": True}
+
+        try:
+            domain = kvm_service.conn.lookupByName(vm_name)
+            active = domain.isActive()
+
+            root = ET.Element("domainsnapshot")
+            ET.SubElement(root, "name").text = name
+            if description:
+                ET.SubElement(root, "description").text = description
+
+            # Память сохраняется только у запущенной ВМ
+            with_memory = include_memory and active
+            if with_memory:
+                memory_file = Path(settings.SNAPSHOT_STORAGE_PATH) / f"{vm_name}-{name}.mem"
+                memory_file.parent.mkdir(parents=True, exist_ok=True)
+                ET.SubElement(root, "memory", snapshot="external", file=str(memory_file))
+
+            disks_el = ET.SubElement(root, "disks")
+            for disk in kvm_service.get_domain_disks(domain):
+                overlay = Path(disk["source"]).parent / f"{vm_name}-{name}-{disk['target']}.qcow2"
+                disk_el = ET.SubElement(disks_el, "disk", name=disk["target"], snapshot="external")
+                ET.SubElement(disk_el, "driver", type="qcow2")
+                ET.SubElement(disk_el, "source", file=str(overlay))
+
+            flags = libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_ATOMIC
+            if not with_memory:
+                flags |= libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY
+            if quiesce and active:
+                flags |= libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_QUIESCE
+            if with_memory:
+                # Гость продолжает работу во время сохранения памяти
+                flags |= libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_LIVE
+
+            domain.snapshotCreateXML(ET.tostring(root, encoding="unicode"), flags)
+            return {"success": True, "message": f"Снапшот '{name}' ВМ {vm_name} создан"}
+        except Exception as e:
+            return {"success": False, "message": f"Ошибка создания снапшота: {e}"}
+        finally:
+            self._invalidate(vm_name)
+
+    def revert_snapshot(self, vm_name: str, name: str) -> Dict:
+        """Откатить ВМ к снапшоту"""
+        if kvm_service.demo_mode:
+            if not any(s["name"] == name for s in self._demo_snapshots.get(vm_name, [])):
+                return {"success": False, "message": f"Снапшот '{name}' не найден"}
+            return {"success": True, "message": f"Демо: ВМ {vm_name} откачена к '{name}'", "demo_mode": True}
+
+        try:
+            domain = kvm_service.conn.lookupByName(vm_name)
+            snap = domain.snapshotLookupByName(name)
+            try:
+                # libvirt >= 9.9 умеет откатывать внешние снапшоты сам
+                domain.revertToSnapshot(snap, 0)
+            except libvirt.libvirtError as e:
+                if e.get_error_code() != libvirt.VIR_ERR_CONFIG_UNSUPPORTED:
+                    raise
+                self._revert_external(domain, snap)
+            return {"success": True, "message": f"ВМ {vm_name} откачена к снапшоту '{name}'"}
+        except Exception as e:
+            return {"success": False, "message": f"Ошибка отката к снапшоту: {e}"}
+        finally:
+            self._invalidate(vm_name)
+
+    def _revert_external(self, domain, snap):
+        """Ручной откат: новые overlay поверх замороженных на момент снапшота образов"""
+        info = self._snapshot_to_dict(snap)
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+
+        if domain.isActive():
+            domain.destroy()
+
+        # Состояние на момент снапшота — backing файлы его overlay
+        new_sources = {}
+        for disk in info["disks"]:
+            if disk["snapshot"] != "external" or not disk["file"]:
+                continue
+            base = qemu_img.backing_file(disk["file"])
+            overlay = str(Path(disk["file"]).parent / f"{domain.name()}-{info['name']}-revert-{stamp}-{disk['target']}.qcow2")
+            qemu_img.create_overlay(overlay, base)
+            new_sources[disk["target"]] = overlay
+
+        root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+        for disk in root.findall(".//devices/disk"):
+            target = disk.find("target")
+            if target is not None and target.get("dev") in new_sources:
+                disk.find("source").set("file", new_sources[target.get("dev")])
+        xml = ET.tostring(root, encoding="unicode")
+        kvm_service.conn.defineXML(xml)
+
+        if info["memory"] and info["memory_file"] and Path(info["memory_file"]).exists():
+            kvm_service.conn.restoreFlags(info["memory_file"], xml, 0)
+
+    def delete_snapshot(self, vm_name: str, name: str) -> Dict:
+        """Удалить снапшот: block-commit его overlay выполняется в фоне"""
+        if kvm_service.demo_mode:
+            snapshots = self._demo_snapshots.get(vm_name, [])
+            if not any(s["name"] == name for s in snapshots):
+                return {"success": False, "message": f"Снапшот '{name}' не найден"}
+            self._demo_snapshots[vm_name] = [s for s in snapshots if s["name"] != name]
+            return {"success": True, "message": f"Демо: снапшот '{name}' удален", "demo_mode": True}
+
+        try:
+            domain = kvm_service.conn.lookupByName(vm_name)
+            snap = domain.snapshotLookupByName(name)
+        except Exception as e:
+            return {"success": False, "message": f"Снапшот не найден: {e}"}
+
+        conflict = self._clone_conflict(self._snapshot_to_dict(snap))
+        if conflict:
+            return {"success": False, "message": conflict}
+
+        if job_manager.is_busy(vm_name):
+            return {"success": False, "message": f"Для ВМ {vm_name} уже выполняется фоновая задача"}
+
+        job = job_manager.submit("snapshot-delete", vm_name, self._delete_job, vm_name, name)
+        return {"success": True, "message": f"Удаление снапшота '{name}' запущено", "job_id": job["id"]}
+
+    def _delete_job(self, job: Dict, vm_name: str, name: str):
+        try:
+            domain = kvm_service.conn.lookupByName(vm_name)
+            snap = domain.snapshotLookupByName(name)
+            info = self._snapshot_to_dict(snap)
+            # Повторная проверка: клон могли создать, пока задача ждала очереди
+            conflict = self._clone_conflict(info)
+            if conflict:
+                raise RuntimeError(conflict)
+            try:
+                # libvirt >= 9.0 сам выполняет block-commit при удалении внешнего снапшота
+                snap.delete(0)
+                return {"method": "libvirt"}
+            except libvirt.libvirtError as e:
+                if e.get_error_code() != libvirt.VIR_ERR_CONFIG_UNSUPPORTED:
+                    raise
+
+            disks = [d for d in info["disks"] if d["snapshot"] == "external" and d["file"]]
+            for index, disk in enumerate(disks):
+                job["message"] = f"block-commit {disk['target']}"
+                self._commit_overlay(domain, disk["target"], disk["file"])
+                job["progress"] = int((index + 1) * 100 / max(len(disks), 1))
+
+            snap.delete(libvirt.VIR_DOMAIN_SNAPSHOT_DELETE_METADATA_ONLY)
+            for disk in disks:
+                Path(disk["file"]).unlink(missing_ok=True)
+            if info["memory_file"]:
+                Path(info["memory_file"]).unlink(missing_ok=True)
+            return {"method": "block-commit", "disks": [d["target"] for d in disks]}
+        finally:
+            self._invalidate(vm_name)
+
+    def _clone_conflict(self, info: Dict) -> Optional[str]:
+        """Причина отказа, если удаление снапшота изменит или удалит образ, на котором держатся связанные клоны
+
+        Удаление вливает overlay снапшота в его backing образ и удаляет overlay:
+        затрагиваются оба файла.
+        """
+        files = []
+        for disk in info["disks"]:
+            if disk["snapshot"] != "external" or not disk["file"]:
+                continue
+            files.append(disk["file"])
+            try:
+                backing = qemu_img.backing_file(disk["file"])
+            except qemu_img.QemuImgError:
+                backing = None
+            if backing:
+                files.append(backing)
+
+        users = state_store.clone_backing_users(files)
+        if not users:
+            return None
+        details = "; ".join(f"{path}: {', '.join(sorted(clones))}" for path, clones in users.items())
+        return f"Снапшот '{info['name']}' нельзя удалить: его образы используют связанные клоны ({details}). Сначала выполните flatten клонов"
+
+    def _commit_overlay(self, domain, target: str, overlay: str):
+        """Влить overlay снапшота в его backing образ и убрать его из цепочки"""
+        active_source = next(
+            (d["source"] for d in kvm_service.get_domain_disks(domain) if d["target"] == target),
+            None
+        )
+        chain = qemu_img.info(active_source, backing_chain=True) if active_source else []
+        files = [layer["filename"] for layer in chain]
+        if overlay not in files:
+            return  # overlay уже не в цепочке (например, после отката)
+
+        index = files.index(overlay)
+        base = files[index + 1] if index + 1 < len(files) else None
+        bandwidth = settings.SNAPSHOT_COMMIT_BANDWIDTH
+
+        if domain.isActive():
+            flags = libvirt.VIR_DOMAIN_BLOCK_COMMIT_SHALLOW
+            if index == 0:
+                # Overlay — активный слой: active commit с последующим pivot
+                flags |= libvirt.VIR_DOMAIN_BLOCK_COMMIT_ACTIVE
+                domain.blockCommit(target, None, None, bandwidth, flags)
+                kvm_service.wait_block_job(domain, target, ready=True)
+                domain.blockJobAbort(target, libvirt.VIR_DOMAIN_BLOCK_JOB_ABORT_PIVOT)
+            else:
+                domain.blockCommit(target, None, overlay, bandwidth, flags)
+                kvm_service.wait_block_job(domain, target)
+            return
+
+        # Выключенная ВМ: qemu-img commit и перенастройка цепочки
+        qemu_img.commit(overlay)
+        if index == 0:
+            root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+            for disk in root.findall(".//devices/disk"):
+                target_el = disk.find("target")
+                if target_el is not None and target_el.get("dev") == target:
+                    disk.find("source").set("file", base)
+            kvm_service.conn.defineXML(ET.tostring(root, encoding="unicode"))
+        else:
+            qemu_img.rebase_unsafe(files[index - 1], base)
+
+
+# Глобальный экземпляр сервиса
+snapshot_service = SnapshotService()
@@ -0,0 +1,394 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from app.core.config import settings
+from app.core.lifecycle import on_shutdown
+from app.services.libvirt_events import subscribe
+
+
+# Миграции схемы: индекс в списке + 1 = PRAGMA user_version после применения
+MIGRATIONS = [
+    """
+    CREATE TABLE vms (
+        name TEXT PRIMARY KEY,
+        uuid TEXT,
+        os TEXT,
+        iso_path TEXT,
+        owner TEXT,
+        tags TEXT NOT NULL DEFAULT '[]',
+        memory_mb INTEGER,
+        vcpus INTEGER,
+        disk_size_gb INTEGER,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX idx_vms_uuid ON vms(uuid);
+    CREATE INDEX idx_vms_owner ON vms(owner);
+
+    CREATE TABLE images (
+        path TEXT PRIMARY KEY,
+        vm_name TEXT,
+        kind TEXT NOT NULL,
+        format TEXT,
+        size_bytes INTEGER,
+        created_at TEXT NOT NULL
+    );
+    CREATE INDEX idx_images_vm ON images(vm_name);
+
+    CREATE TABLE jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        target TEXT,
+        status TEXT NOT NULL,
+        progress INTEGER NOT NULL DEFAULT 0,
+        message TEXT,
+        result TEXT,
+        error TEXT,
+        created TEXT NOT NULL,
+        started TEXT,
+        finished TEXT
+    );
+    CREATE INDEX idx_jobs_target ON jobs(target, created);
+    CREATE INDEX idx_jobs_status ON jobs(status);
+
+    CREATE TABLE events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vm_name TEXT NOT NULL,
+        event TEXT NOT NULL,
+        detail INTEGER,
+        ts REAL NOT NULL
+    );
+    CREATE INDEX idx_events_vm_ts ON events(vm_name, ts);
+    CREATE INDEX idx_events_ts ON events(ts);
+    """,
+    """
+    ALTER TABLE vms ADD COLUMN priority INTEGER NOT NULL DEFAULT 0;
+
+    CREATE TABLE host_drains (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        vms TEXT NOT NULL,
+        report TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX idx_host_drains_created ON host_drains(created_at);
+    """,
+    """
+    CREATE TABLE clone_backings (
+        path TEXT NOT NULL,
+        clone_name TEXT NOT NULL,
+        parent TEXT,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (path, clone_name)
+    );
+    CREATE INDEX idx_clone_backings_clone ON clone_backings(clone_name);
+    """,
+]
+
+VM_FIELDS = ("uuid", "os", "iso_path", "owner", "tags", "memory_mb", "vcpus", "disk_size_gb", "priority")
+JOB_FIELDS = ("id", "kind", "target", "status", "progress", "message", "result", "error", "created", "started", "finished")
+
+
+def database_path(url: str) -> Path:
+    """Путь к файлу SQLite из DATABASE_URL (sqlite:///path)"""
+    if not url.startswith("sqlite:///"):
+        raise ValueError(f"Поддерживается только SQLite: {url}")
+    path = Path(url[len("sqlite:///"):])
+    return path if path.is_absolute() else settings.BASE_DIR / path
+
+
+class StateStore:
+    """Постоянное хранилище метаданных ВМ, образов, задач и событий (SQLite в режиме WAL)
+
+    Чтение идет через соединения потоков, запись — через один поток-писатель,
+    который объединяет накопившиеся операции в одну транзакцию.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else database_path(settings.DATABASE_URL)
+        self._local = threading.local()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self.stats = {"writes": 0, "batches": 0, "errors": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _ensure(self):
+        """Открыть базу и применить миграции при первом обращении"""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = self._connect()
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for index, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                    conn.executescript(f"BEGIN; {script}; PRAGMA user_version = {index}; COMMIT;")
+
+                # Задачи прошлого процесса уже не выполняются (воркер не владеет задачами — задачи коллектора не трогаем)
+                if settings.PROCESS_ROLE != "worker":
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'Прервана перезапуском сервиса' "
+                        "WHERE status IN ('pending', 'running')"
+                    )
+                    conn.execute(
+                        "DELETE FROM events WHERE ts < ?",
+                        (time.time() - settings.STATE_EVENTS_RETENTION_DAYS * 86400,)
+                    )
+                conn.commit()
+            finally:
+                conn.close()
+
+            self._writer = threading.Thread(target=self._write_loop, name="state-writer", daemon=True)
+            self._writer.start()
+            self._initialized = True
+
+    def _reader(self) -> sqlite3.Connection:
+        self._ensure()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # Запись
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < settings.STATE_WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            errors = {}
+            try:
+                with conn:
+                    for sql, params, _ in batch:
+                        if sql is not None:
+                            conn.execute(sql, params)
+            except sqlite3.Error:
+                # Повторяем по одной, чтобы ошибочная запись не потянула за собой остальные
+                for index, (sql, params, _) in enumerate(batch):
+                    if sql is None:
+                        continue
+                    try:
+                        with conn:
+                            conn.execute(sql, params)
+                    except sqlite3.Error as e:
+                        errors[index] = e
+                        self.stats["errors"] += 1
+                        print(f"⚠️  Ошибка записи в хранилище состояния: {e}")
+
+            self.stats["writes"] += len(batch)
+            self.stats["batches"] += 1
+            for index, (_, _, waiter) in enumerate(batch):
+                if waiter is not None:
+                    waiter["error"] = errors.get(index)
+                    waiter["done"].set()
+
+    def _write(self, sql: Optional[str], params=(), wait: bool = False):
+        """Поставить запись в очередь писателя; с wait — дождаться фиксации транзакции"""
+        self._ensure()
+        waiter = {"done": threading.Event(), "error": None} if wait else None
+        self._queue.put((sql, params, waiter))
+        if waiter is not None:
+            waiter["done"].wait()
+            if waiter["error"] is not None:
+                raise waiter["error"]
+
+    def flush(self):
+        """Дождаться записи всего, что уже стоит в очереди"""
+        self._write(None, wait=True)
+
+    def close(self):
+        """Дописать очередь при остановке (если база вообще открывалась)"""
+        if self._initialized:
+            self.flush()
+
+    # ВМ
+
+    def upsert_vm(self, name: str, **fields):
+        """Создать или обновить метаданные ВМ (неуказанные поля не меняются)"""
+        fields = {k: v for k, v in fields.items() if k in VM_FIELDS and v is not None}
+        if "tags" in fields:
+            fields["tags"] = json.dumps(sorted(set(fields["tags"])))
+        now = datetime.now().isoformat()
+
+        columns = ["name", "created_at", "updated_at"] + list(fields)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in ["updated_at"] + list(fields))
+        self._write(
+            f"INSERT INTO vms ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(name) DO UPDATE SET {updates}",
+            (name, now, now, *fields.values()),
+            wait=True
+        )
+
+    def delete_vm(self, name: str):
+        """Удалить метаданные ВМ и записи о ее образах"""
+        self._write("DELETE FROM vms WHERE name = ?", (name,))
+        self._write("DELETE FROM clone_backings WHERE clone_name = ?", (name,))
+        self._write("DELETE FROM images WHERE vm_name = ?", (name,), wait=True)
+
+    def _vm_row(self, row: sqlite3.Row) -> Dict:
+        vm = dict(row)
+        vm["tags"] = json.loads(vm["tags"])
+        return vm
+
+    def get_vm_meta(self, name: str) -> Optional[Dict]:
+        """Метаданные одной ВМ"""
+        row = self._reader().execute("SELECT * FROM vms WHERE name = ?", (name,)).fetchone()
+        return self._vm_row(row) if row else None
+
+    def get_vms_meta(self) -> Dict[str, Dict]:
+        """Метаданные всех ВМ одним запросом: имя -> метаданные"""
+        rows = self._reader().execute("SELECT * FROM vms").fetchall()
+        return {row["name"]: self._vm_row(row) for row in rows}
+
+    # Образы
+
+    def add_image(self, path: str, vm_name: Optional[str], kind: str = "disk",
+                  fmt: Optional[str] = None, size_bytes: Optional[int] = None):
+        """Зарегистрировать образ (диск ВМ, ISO, бэкап)"""
+        self._write(
+            "INSERT OR REPLACE INTO images (path, vm_name, kind, format, size_bytes, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (path, vm_name, kind, fmt, size_bytes, datetime.now().isoformat())
+        )
+
+    def list_images(self, vm_name: Optional[str] = None) -> List[Dict]:
+        """Образы (все или одной ВМ)"""
+        if vm_name is None:
+            rows = self._reader().execute("SELECT * FROM images ORDER BY created_at").fetchall()
+        else:
+            rows = self._reader().execute(
+                "SELECT * FROM images WHERE vm_name = ? ORDER BY created_at", (vm_name,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    # Образы, на которых держатся связанные клоны
+
+    def add_clone_backings(self, clone_name: str, parent: str, paths: List[str]):
+        """Запомнить образы backing chain связанного клона (замороженные образы родителя и ниже)"""
+        now = datetime.now().isoformat()
+        for path in paths:
+            self._write(
+                "INSERT OR REPLACE INTO clone_backings (path, clone_name, parent, created_at) VALUES (?, ?, ?, ?)",
+                (os.path.realpath(path), clone_name, parent, now)
+            )
+        self.flush()
+
+    def delete_clone_backings(self, clone_name: str):
+        """Клон больше не зависит от образов родителя (flatten)"""
+        self._write("DELETE FROM clone_backings WHERE clone_name = ?", (clone_name,), wait=True)
+
+    def clone_backing_users(self, paths: List[str]) -> Dict[str, List[str]]:
+        """Образ -> клоны, backing chain которых его содержит (только образы, у которых есть клоны)"""
+        resolved = {os.path.realpath(path): path for path in paths}
+        if not resolved:
+            return {}
+        rows = self._reader().execute(
+            f"SELECT path, clone_name FROM clone_backings WHERE path IN ({', '.join('?' * len(resolved))})",
+            tuple(resolved)
+        ).fetchall()
+        users: Dict[str, List[str]] = {}
+        for row in rows:
+            users.setdefault(resolved[row["path"]], []).append(row["clone_name"])
+        return users
+
+    # Задачи
+
+    def record_job(self, job: Dict):
+        """Сохранить снимок состояния фоновой задачи"""
+        values = dict(job)
+        values["result"] = json.dumps(values.get("result"), default=str)
+        self._write(
+            f"INSERT OR REPLACE INTO jobs ({', '.join(JOB_FIELDS)}) VALUES ({', '.join('?' * len(JOB_FIELDS))})",
+            tuple(values.get(field) for field in JOB_FIELDS)
+        )
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Задача из истории"""
+        row = self._reader().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    # Обслуживание хоста
+
+    def save_drain(self, drain: Dict):
+        """Сохранить запись об остановке хоста (список ВМ фиксируется до первой остановки)"""
+        self._write(
+            "INSERT OR REPLACE INTO host_drains (id, status, vms, report, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (drain["id"], drain["status"], json.dumps(drain["vms"]), json.dumps(drain.get("report"), default=str),
+             drain["created_at"], datetime.now().isoformat()),
+            wait=True
+        )
+
+    def _drain_row(self, row: sqlite3.Row) -> Dict:
+        drain = dict(row)
+        drain["vms"] = json.loads(drain["vms"])
+        drain["report"] = json.loads(drain["report"]) if drain["report"] else None
+        return drain
+
+    def get_drain(self, drain_id: str) -> Optional[Dict]:
+        row = self._reader().execute("SELECT * FROM host_drains WHERE id = ?", (drain_id,)).fetchone()
+        return self._drain_row(row) if row else None
+
+    def list_drains(self, limit: int = 20) -> List[Dict]:
+        """Записи об остановках хоста, новые первыми"""
+        rows = self._reader().execute(
+            "SELECT * FROM host_drains ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [self._drain_row(row) for row in rows]
+
+    # События
+
+    def record_event(self, vm_name: str, event: str, detail: Optional[int] = None):
+        """Записать событие жизненного цикла ВМ (вызывается из потока событий libvirt)"""
+        self._write(
+            "INSERT INTO events (vm_name, event, detail, ts) VALUES (?, ?, ?, ?)",
+            (vm_name, event, detail, time.time())
+        )
+
+    def list_events(self, vm_name: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Последние события, новые первыми"""
+        if vm_name is None:
+            rows = self._reader().execute(
+                "SELECT * FROM events ORDER BY ts DESC LIMIT ?", (limit,)
+            ).fetchall()
+        else:
+            rows = self._reader().execute(
+                "SELECT * FROM events WHERE vm_name = ? ORDER BY ts DESC LIMIT ?", (vm_name, limit)
+            ).fetchall()
+        return [
+            dict(row, time=datetime.fromtimestamp(row["ts"]).isoformat())
+            for row in rows
+        ]
+
+
+# Глобальный экземпляр хранилища
+state_store = StateStore()
+subscribe(state_store.record_event)
+on_shutdown(state_store.close)
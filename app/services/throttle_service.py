@@ -0,0 +1,409 @@
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.lifecycle import LazyService, is_initialized, on_shutdown
+from app.services.kvm_service import kvm_service, LIBVIRT_AVAILABLE
+
+if LIBVIRT_AVAILABLE:
+    import libvirt  # type: ignore
+
+# Условный импорт numpy: без него доли считаются обычными списками
+try:
+    import numpy as np  # type: ignore
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    np = None  # type: ignore
+
+
+# Счетчики ВМ в порядке столбцов матрицы: время CPU (нс), запросы и байты блочного ввода-вывода
+COUNTERS = ("cpu_time", "io_reqs", "io_bytes")
+RESOURCES = ("cpu", "io")
+
+
+def usage_shares(previous: List[List[float]], current: List[List[float]], elapsed: float) -> Tuple[List, List]:
+    """Скорости счетчиков (в секунду) и доля каждой ВМ в сумме по хосту
+
+    Строки — ВМ, столбцы — COUNTERS. Отрицательная разница (ВМ перезапущена,
+    счетчики обнулились) считается нулем.
+    """
+    if NUMPY_AVAILABLE:
+        rates = np.maximum(np.asarray(current, dtype=float) - np.asarray(previous, dtype=float), 0) / elapsed
+        totals = rates.sum(axis=0)
+        shares = np.divide(rates, totals, out=np.zeros_like(rates), where=totals > 0)
+        return rates.tolist(), shares.tolist()
+
+    rates = [[max(c - p, 0) / elapsed for p, c in zip(prev_row, cur_row)] for prev_row, cur_row in zip(previous, current)]
+    totals = [sum(column) for column in zip(*rates)] if rates else []
+    shares = [[value / total if total > 0 else 0.0 for value, total in zip(row, totals)] for row in rates]
+    return rates, shares
+
+
+class LibvirtThrottleBackend:
+    """Статистика доменов из libvirt, ограничения — через tuning_service
+
+    Ограничения применяются только к работающей ВМ (live_only) и в
+    конфигурацию домена не попадают: после выключения ВМ стартует с
+    собственными значениями.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        from app.services.boot_scheduler import HostLoad
+        self.load = HostLoad()
+
+    def collect(self) -> Tuple[float, Dict, List[Dict]]:
+        """Момент замера, загрузка хоста и накопленные счетчики запущенных ВМ одним запросом"""
+        with self.service.pool.connection() as conn:
+            records = conn.getAllDomainStats(
+                libvirt.VIR_DOMAIN_STATS_CPU_TOTAL | libvirt.VIR_DOMAIN_STATS_BLOCK,
+                libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE
+            )
+            guests = []
+            for domain, stats in records:
+                disks = range(stats.get("block.count", 0))
+                guests.append({
+                    "name": domain.name(),
+                    "cpu_time": stats.get("cpu.time", 0),
+                    "io_reqs": sum(stats.get(f"block.{i}.rd.reqs", 0) + stats.get(f"block.{i}.wr.reqs", 0) for i in disks),
+                    "io_bytes": sum(stats.get(f"block.{i}.rd.bytes", 0) + stats.get(f"block.{i}.wr.bytes", 0) for i in disks),
+                })
+        self.load.sample()
+        host = {
+            "cpu": (self.load.cpu_percent or 0.0) / 100,
+            "io": (self.load.iowait_percent or 0.0) / 100,
+        }
+        return time.monotonic(), host, guests
+
+    def get_tuning(self, vm_name: str) -> Dict:
+        from app.services.tuning_service import tuning_service
+        return tuning_service.get(vm_name)
+
+    def apply_tuning(self, vm_name: str, tuning: Dict):
+        from app.services.tuning_service import tuning_service
+        result = tuning_service.apply(vm_name, tuning, live_only=True)
+        if not result["success"]:
+            raise RuntimeError("; ".join(error["message"] for error in result["errors"]))
+
+
+class SimulatedThrottleBackend:
+    """Симулятор хоста с шумными соседями для отладки политик без гипервизора
+
+    Каждый вызов collect() продвигает виртуальные часы на секунду. Спрос ВМ на
+    CPU делится пропорционально весам (cpu_shares), ввод-вывод ограничивается
+    total_iops_sec; iowait растет, когда диски загружены больше чем на 60%.
+    """
+
+    def __init__(self, cores: int = 8, iops_capacity: int = 20000,
+                 guests: Optional[List[Dict]] = None, seed: Optional[int] = None):
+        self.cores = cores
+        self.iops_capacity = iops_capacity
+        self.random = random.Random(seed)
+        self.clock = 0.0
+        if guests is None:
+            guests = [{"name": f"sim-vm-{i}", "cpu": 0.5, "iops": 800} for i in range(5)]
+            guests.append({"name": "sim-noisy-cpu", "cpu": 7.0, "iops": 300})
+            guests.append({"name": "sim-noisy-io", "cpu": 0.5, "iops": 18000})
+        self.guests = {
+            guest["name"]: {
+                "demand_cpu": guest["cpu"], "demand_iops": guest["iops"],
+                "shares": 1024, "iops_limit": 0,
+                "cpu_time": 0.0, "io_reqs": 0.0, "io_bytes": 0.0,
+            }
+            for guest in guests
+        }
+
+    def collect(self) -> Tuple[float, Dict, List[Dict]]:
+        self.clock += 1.0
+        demand = {
+            name: max(0.0, guest["demand_cpu"] * self.random.uniform(0.8, 1.2))
+            for name, guest in self.guests.items()
+        }
+        weighted = sum(demand[name] * guest["shares"] for name, guest in self.guests.items())
+        busy = total_iops = 0.0
+        for name, guest in self.guests.items():
+            if sum(demand.values()) > self.cores and weighted > 0:
+                cpu = min(demand[name], self.cores * demand[name] * guest["shares"] / weighted)
+            else:
+                cpu = demand[name]
+            iops = guest["demand_iops"] * self.random.uniform(0.8, 1.2)
+            if guest["iops_limit"]:
+                iops = min(iops, guest["iops_limit"])
+            guest["cpu_time"] += cpu * 1e9
+            guest["io_reqs"] += iops
+            guest["io_bytes"] += iops * 4096
+            busy += cpu
+            total_iops += iops
+
+        host = {
+            "cpu": min(busy / self.cores, 1.0),
+            "io": min(max(total_iops / self.iops_capacity - 0.6, 0.0), 1.0),
+        }
+        guests = [
+            {"name": name, **{counter: guest[counter] for counter in COUNTERS}}
+            for name, guest in self.guests.items()
+        ]
+        return self.clock, host, guests
+
+    def get_tuning(self, vm_name: str) -> Dict:
+        guest = self.guests[vm_name]
+        return {"cpu": {"shares": guest["shares"]}, "disks": {"vda": {"total_iops_sec": guest["iops_limit"]}}}
+
+    def apply_tuning(self, vm_name: str, tuning: Dict):
+        guest = self.guests[vm_name]
+        if "cpu" in tuning:
+            guest["shares"] = tuning["cpu"].get("shares", guest["shares"])
+        for limits in (tuning.get("disks") or {}).values():
+            guest["iops_limit"] = limits.get("total_iops_sec", guest["iops_limit"])
+
+
+class ThrottleService:
+    """Контроллер шумных соседей: находит ВМ, создающие конкуренцию за CPU и диск, и ограничивает их
+
+    Каждый интервал по счетчикам всех запущенных ВМ считается доля каждой ВМ
+    в нагрузке хоста. ВМ ограничивается, если давление на ресурс хоста выше
+    engage_pressure и ее доля не меньше min_share в trigger интервалах подряд;
+    ограничение снимается (прежние значения восстанавливаются), когда давление
+    держится ниже release_pressure release интервалов подряд.
+    """
+
+    def __init__(self, backend=None):
+        if backend is None:
+            if settings.THROTTLE_SIMULATOR or kvm_service.demo_mode:
+                backend = SimulatedThrottleBackend()
+            else:
+                backend = LibvirtThrottleBackend(kvm_service)
+
+        self.backend = backend
+        self.dry_run = settings.THROTTLE_DRY_RUN
+        self.policies: Dict[str, Dict] = {resource: dict(policy) for resource, policy in settings.THROTTLE_POLICIES.items()}
+        self.decisions = deque(maxlen=settings.THROTTLE_DECISION_LOG_SIZE)
+        self.throttled: Dict[Tuple[str, str], Dict] = {}  # (ВМ, ресурс) -> прежние и примененные значения
+        self.scores: List[Dict] = []
+        self.host: Dict = {}
+        self.last_run: Optional[str] = None
+
+        self._previous: Optional[Tuple[float, Dict[str, List[float]]]] = None
+        self._streaks: Dict[Tuple[str, str], int] = {}  # Интервалов подряд выполнено условие ограничения/снятия
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def simulated(self) -> bool:
+        return isinstance(self.backend, SimulatedThrottleBackend)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def set_policy(self, resource: str, **changes) -> Dict:
+        """Изменить пороги политики ресурса (cpu или io)"""
+        if resource not in self.policies:
+            return {"success": False, "message": f"Ресурс должен быть одним из: {', '.join(RESOURCES)}"}
+        unknown = set(changes) - set(self.policies[resource])
+        if unknown:
+            return {"success": False, "message": f"Неизвестные параметры политики: {', '.join(sorted(unknown))}"}
+        with self._lock:
+            self.policies[resource].update(changes)
+        return {"success": True, "message": f"Политика {resource} обновлена", "policy": self.policies[resource]}
+
+    def _limit(self, resource: str, rates: Dict) -> Dict:
+        """Параметры tuning для ограничения ВМ"""
+        policy = self.policies[resource]
+        if resource == "cpu":
+            return {"cpu": {"shares": policy["shares"]}}
+        iops = max(policy["min_iops"], int(rates["io_reqs"] * policy["iops_factor"]))
+        return {"disks": {"*": {"total_iops_sec": iops}}}
+
+    def _previous_limits(self, vm_name: str, resource: str) -> Dict:
+        """Текущие значения, которые восстановятся при снятии ограничения"""
+        tuning = self.backend.get_tuning(vm_name)
+        if resource == "cpu":
+            return {"cpu": {"shares": tuning["cpu"]["shares"]}} if tuning["cpu"].get("shares") else {}
+        return {"disks": {
+            target: {"total_iops_sec": limits.get("total_iops_sec", 0)}
+            for target, limits in tuning["disks"].items()
+        }}
+
+    def _evaluate(self, vm_name: str, resource: str, share: float, pressure: float, rates: Dict) -> Optional[Dict]:
+        """Решение по одной паре (ВМ, ресурс) с учетом гистерезиса"""
+        policy = self.policies[resource]
+        key = (vm_name, resource)
+        if key in self.throttled:
+            condition = pressure <= policy["release_pressure"]
+            needed, action = policy["release"], "release"
+            reason = f"давление {resource} хоста {pressure:.0%} ниже {policy['release_pressure']:.0%}"
+        else:
+            condition = pressure >= policy["engage_pressure"] and share >= policy["min_share"]
+            needed, action = policy["trigger"], "throttle"
+            reason = (f"доля ВМ {share:.0%} при давлении {resource} хоста {pressure:.0%} "
+                      f"(порог {policy['engage_pressure']:.0%})")
+
+        self._streaks[key] = self._streaks.get(key, 0) + 1 if condition else 0
+        if self._streaks[key] < needed:
+            return None
+        self._streaks[key] = 0
+        return {"vm_name": vm_name, "resource": resource, "action": action, "reason": reason}
+
+    def _apply(self, decision: Dict, rates: Dict):
+        key = (decision["vm_name"], decision["resource"])
+        if decision["action"] == "throttle":
+            limit = self._limit(decision["resource"], rates)
+            previous = {} if self.dry_run else self._previous_limits(*key)
+            decision.update(limit=limit, previous=previous)
+            if not self.dry_run:
+                self.backend.apply_tuning(decision["vm_name"], limit)
+                decision["applied"] = True
+            self.throttled[key] = {
+                "limit": limit, "previous": previous, "since": decision["timestamp"], "dry_run": self.dry_run,
+            }
+        else:
+            state = self.throttled.pop(key)
+            decision.update(limit=state["previous"], previous=state["limit"])
+            # Ограничение, записанное в режиме dry-run, к ВМ не применялось — восстанавливать нечего
+            if not self.dry_run and not state["dry_run"] and state["previous"]:
+                self.backend.apply_tuning(decision["vm_name"], state["previous"])
+                decision["applied"] = True
+
+    def run_once(self) -> List[Dict]:
+        """Один цикл: собрать счетчики, посчитать доли, принять и применить решения"""
+        now, host, guests = self.backend.collect()
+        counters = {guest["name"]: [float(guest[counter]) for counter in COUNTERS] for guest in guests}
+
+        with self._lock:
+            previous, self._previous = self._previous, (now, counters)
+            # Ограничения живые (live_only): с остановкой ВМ они исчезают, восстанавливать нечего
+            for key in [key for key in self.throttled if key[0] not in counters]:
+                del self.throttled[key]
+            if previous is None or now <= previous[0]:
+                self.host, self.last_run = host, datetime.now().isoformat()
+                return []
+
+            names = [name for name in counters if name in previous[1]]
+            rates, shares = usage_shares([previous[1][n] for n in names], [counters[n] for n in names], now - previous[0])
+
+            decisions, scores = [], []
+            for index, name in enumerate(names):
+                rate = dict(zip(COUNTERS, rates[index]))
+                share = {"cpu": shares[index][0], "io": max(shares[index][1], shares[index][2])}
+                scores.append({
+                    "vm_name": name,
+                    "cpu_cores": round(rate["cpu_time"] / 1e9, 3),
+                    "iops": round(rate["io_reqs"], 1),
+                    "io_bytes_per_sec": round(rate["io_bytes"]),
+                    "cpu_share": round(share["cpu"], 4),
+                    "io_share": round(share["io"], 4),
+                    # Вклад ВМ в конкуренцию: доля, взвешенная давлением на ресурс хоста
+                    "cpu_contention": round(share["cpu"] * host["cpu"], 4),
+                    "io_contention": round(share["io"] * host["io"], 4),
+                    "throttled": [resource for resource in RESOURCES if (name, resource) in self.throttled],
+                })
+                for resource in RESOURCES:
+                    decision = self._evaluate(name, resource, share[resource], host[resource], rate)
+                    if decision is None:
+                        continue
+                    decision.update({
+                        "timestamp": datetime.now().isoformat(),
+                        "share": round(share[resource], 4),
+                        "host_pressure": round(host[resource], 4),
+                        "dry_run": self.dry_run,
+                        "simulated": self.simulated,
+                        "applied": False,
+                    })
+                    try:
+                        self._apply(decision, rate)
+                    except Exception as e:
+                        decision["error"] = str(e)
+                    decisions.append(decision)
+
+            self.decisions.extend(decisions)
+            self.scores = sorted(scores, key=lambda s: s["cpu_contention"] + s["io_contention"], reverse=True)
+            self.host = host
+            self.last_run = datetime.now().isoformat()
+        return decisions
+
+    def _loop(self, interval: float):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️  Throttle: ошибка цикла контроллера: {e}")
+            self._stop_event.wait(interval)
+
+    def start(self, interval: Optional[float] = None, dry_run: Optional[bool] = None) -> Dict:
+        """Запустить фоновый контроллер (dry_run — только записывать решения)"""
+        if self.running:
+            return {"success": False, "message": "Контроллер уже запущен"}
+
+        if dry_run is not None and dry_run != self.dry_run:
+            with self._lock:
+                self.dry_run = dry_run
+                # Ограничения из dry-run не применялись: в новом режиме решения принимаются заново
+                self.throttled = {key: state for key, state in self.throttled.items() if not state["dry_run"]}
+                self._streaks.clear()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._loop,
+            args=(interval or settings.THROTTLE_INTERVAL,),
+            name="throttle-controller",
+            daemon=True
+        )
+        self._thread.start()
+        mode = " (dry-run)" if self.dry_run else ""
+        return {"success": True, "message": f"Контроллер шумных соседей запущен{mode}"}
+
+    def stop(self) -> Dict:
+        """Остановить фоновый контроллер (наложенные ограничения действуют до выключения ВМ)"""
+        if not self.running:
+            return {"success": False, "message": "Контроллер не запущен"}
+
+        self._stop_event.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        return {"success": True, "message": "Контроллер шумных соседей остановлен"}
+
+    def get_status(self) -> Dict:
+        """Состояние контроллера, политики, нагрузка хоста и доли ВМ за последний интервал"""
+        with self._lock:
+            return {
+                "running": self.running,
+                "simulated": self.simulated,
+                "dry_run": self.dry_run,
+                "vectorized": NUMPY_AVAILABLE,
+                "last_run": self.last_run,
+                "host_pressure": self.host,
+                "policies": self.policies,
+                "throttled": [
+                    {"vm_name": vm_name, "resource": resource, **state}
+                    for (vm_name, resource), state in self.throttled.items()
+                ],
+                "scores": list(self.scores),
+            }
+
+    def get_decisions(self, limit: int = 100, vm_name: Optional[str] = None,
+                      resource: Optional[str] = None) -> List[Dict]:
+        """Журнал последних решений, новые первыми"""
+        with self._lock:
+            decisions = list(self.decisions)
+        if vm_name:
+            decisions = [d for d in decisions if d["vm_name"] == vm_name]
+        if resource:
+            decisions = [d for d in decisions if d["resource"] == resource]
+        return decisions[::-1][:limit]
+
+
+# Глобальный экземпляр сервиса (выбор бэкенда требует подключения к libvirt — создается лениво)
+throttle_service = LazyService(ThrottleService)
+
+
+@on_shutdown
+def _stop_controller():
+    if is_initialized(throttle_service) and throttle_service.running:
+        throttle_service.stop()
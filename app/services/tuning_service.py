@@ -0,0 +1,213 @@
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.kvm_service import kvm_service, LIBVIRT_AVAILABLE
+
+if LIBVIRT_AVAILABLE:
+    import libvirt  # type: ignore
+
+
+# Поля API -> имена типизированных параметров libvirt
+CPU_PARAMS = {"shares": "cpu_shares", "period": "vcpu_period", "quota": "vcpu_quota"}
+DISK_PARAMS = (
+    "total_iops_sec", "read_iops_sec", "write_iops_sec",
+    "total_bytes_sec", "read_bytes_sec", "write_bytes_sec",
+)
+INTERFACE_PARAMS = {
+    f"{direction}_{name}": f"{direction}.{name}"
+    for direction in ("inbound", "outbound") for name in ("average", "peak", "burst")
+}
+
+
+def _interfaces(domain) -> List[str]:
+    """MAC интерфейсов: по нему libvirt находит интерфейс и в живой, и в сохраненной конфигурации
+
+    target dev (vnetN) создается при запуске и в сохраненной конфигурации его нет,
+    поэтому с VIR_DOMAIN_AFFECT_CONFIG вызов по имени устройства завершается ошибкой.
+    """
+    root = ET.fromstring(domain.XMLDesc(0))
+    return [mac.get("address") for mac in root.findall(".//devices/interface/mac") if mac.get("address")]
+
+
+def _interface_macs_by_dev(domain) -> Dict[str, str]:
+    """target dev запущенной ВМ -> MAC интерфейса"""
+    root = ET.fromstring(domain.XMLDesc(0))
+    result = {}
+    for interface in root.findall(".//devices/interface"):
+        target = interface.find("target")
+        mac = interface.find("mac")
+        if target is not None and target.get("dev") and mac is not None:
+            result[target.get("dev")] = mac.get("address")
+    return result
+
+
+class TuningService:
+    """Ограничения ресурсов ВМ: CPU shares и quota, blkio weight, IOPS/пропускная способность дисков и сети
+
+    Изменения применяются к запущенной ВМ сразу и сохраняются в конфигурацию
+    домена (VIR_DOMAIN_AFFECT_LIVE | VIR_DOMAIN_AFFECT_CONFIG).
+    """
+
+    def __init__(self):
+        self._demo: Dict[str, Dict] = {}
+
+    def get(self, vm_name: str) -> Dict:
+        """Текущие параметры ВМ"""
+        if kvm_service.demo_mode:
+            if not any(vm["name"] == vm_name for vm in kvm_service._get_demo_vms()):
+                raise LookupError(f"ВМ {vm_name} не найдена")
+            return {"vm_name": vm_name, "demo_mode": True, "cpu": {}, "blkio": {}, "disks": {}, "interfaces": {},
+                    **self._demo.get(vm_name, {})}
+
+        with kvm_service.pool.connection() as conn:
+            domain = self._lookup(conn, vm_name)
+            flags = libvirt.VIR_DOMAIN_AFFECT_LIVE if domain.isActive() else libvirt.VIR_DOMAIN_AFFECT_CONFIG
+            scheduler = domain.schedulerParametersFlags(flags)
+            return {
+                "vm_name": vm_name,
+                "live": bool(domain.isActive()),
+                "cpu": {field: scheduler.get(param) for field, param in CPU_PARAMS.items() if param in scheduler},
+                "blkio": domain.blkioParameters(flags),
+                "disks": {
+                    disk["target"]: domain.blockIoTune(disk["target"], flags)
+                    for disk in kvm_service.get_domain_disks(domain) if disk["target"]
+                },
+                "interfaces": {
+                    interface: self._interface_limits(domain.interfaceParameters(interface, flags))
+                    for interface in _interfaces(domain)
+                },
+            }
+
+    def _interface_limits(self, params: Dict) -> Dict:
+        return {field: params[param] for field, param in INTERFACE_PARAMS.items() if param in params}
+
+    def _lookup(self, conn, vm_name: str):
+        try:
+            return conn.lookupByName(vm_name)
+        except libvirt.libvirtError:
+            raise LookupError(f"ВМ {vm_name} не найдена")
+
+    def apply(self, vm_name: str, tuning: Dict, live_only: bool = False) -> Dict:
+        """Применить параметры к ВМ
+
+        tuning: {"cpu": {shares, period, quota}, "blkio_weight": N,
+        "disks": {target или "*": {...}}, "interfaces": {MAC, dev или "*": {...}}}.
+        Ошибка одного раздела не отменяет остальные — она попадает в errors.
+        live_only — только к запущенной ВМ, без записи в конфигурацию: значения
+        действуют до выключения ВМ (временные ограничения контроллера шумных соседей).
+        """
+        if not any(tuning.get(section) for section in ("cpu", "blkio_weight", "disks", "interfaces")):
+            raise ValueError("Не указано ни одного параметра")
+
+        if kvm_service.demo_mode:
+            self.get(vm_name)  # LookupError для неизвестной ВМ
+            current = self._demo.setdefault(vm_name, {"cpu": {}, "blkio": {}, "disks": {}, "interfaces": {}})
+            current["cpu"].update(tuning.get("cpu") or {})
+            if tuning.get("blkio_weight") is not None:
+                current["blkio"]["weight"] = tuning["blkio_weight"]
+            for section in ("disks", "interfaces"):
+                for target, limits in (tuning.get(section) or {}).items():
+                    current[section].setdefault(target, {}).update(limits)
+            result = kvm_service._demo_vm_action(vm_name, "tune")
+            result["tuning"] = self.get(vm_name)
+            return result
+
+        applied, errors = [], []
+        with kvm_service.pool.connection() as conn:
+            domain = self._lookup(conn, vm_name)
+            live = bool(domain.isActive())
+            if live_only and not live:
+                return {"success": False, "message": f"ВМ {vm_name} не запущена", "vm_name": vm_name,
+                        "live": False, "applied": [], "errors": [{"target": vm_name, "message": "ВМ не запущена"}]}
+            if live_only:
+                flags = libvirt.VIR_DOMAIN_AFFECT_LIVE
+            else:
+                flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG | (libvirt.VIR_DOMAIN_AFFECT_LIVE if live else 0)
+
+            def attempt(label: str, func, *args):
+                try:
+                    func(*args)
+                    applied.append(label)
+                except libvirt.libvirtError as e:
+                    errors.append({"target": label, "message": str(e)})
+
+            if tuning.get("cpu"):
+                params = {CPU_PARAMS[field]: value for field, value in tuning["cpu"].items() if field in CPU_PARAMS}
+                attempt("cpu", domain.setSchedulerParametersFlags, params, flags)
+            if tuning.get("blkio_weight") is not None:
+                attempt("blkio", domain.setBlkioParameters, {"weight": tuning["blkio_weight"]}, flags)
+
+            for target, limits in self._expand(tuning.get("disks"),
+                                               lambda: [d["target"] for d in kvm_service.get_domain_disks(domain)]):
+                params = {name: value for name, value in limits.items() if name in DISK_PARAMS}
+                attempt(f"disk {target}", domain.setBlockIoTune, target, params, flags)
+
+            macs_by_dev = None
+            for target, limits in self._expand(tuning.get("interfaces"), lambda: _interfaces(domain)):
+                if ":" not in target:
+                    # Имя устройства (vnetN) переводится в MAC: в сохраненной конфигурации имени нет
+                    if macs_by_dev is None:
+                        macs_by_dev = _interface_macs_by_dev(domain)
+                    target = macs_by_dev.get(target, target)
+                params = {INTERFACE_PARAMS[name]: value for name, value in limits.items() if name in INTERFACE_PARAMS}
+                attempt(f"interface {target}", domain.setInterfaceParameters, target, params, flags)
+
+        if errors:
+            message = f"Часть параметров ВМ {vm_name} не применена"
+        else:
+            message = f"Параметры ВМ {vm_name} применены" + ("" if live else " (только к конфигурации, ВМ выключена)")
+        return {
+            "success": not errors,
+            "message": message,
+            "vm_name": vm_name,
+            "live": live,
+            "applied": applied,
+            "errors": errors,
+        }
+
+    def _expand(self, limits_by_target: Optional[Dict], all_targets) -> List:
+        """Раскрыть "*" во все диски/интерфейсы; явно заданный target имеет приоритет над "*" """
+        if not limits_by_target:
+            return []
+        expanded = {}
+        if "*" in limits_by_target:
+            expanded = {target: limits_by_target["*"] for target in all_targets() if target}
+        expanded.update({target: limits for target, limits in limits_by_target.items() if target != "*"})
+        return list(expanded.items())
+
+    def apply_bulk(self, tuning: Dict, names: Optional[List[str]] = None, tags: Optional[List[str]] = None,
+                   status: Optional[str] = None, all_vms: bool = False, concurrency: Optional[int] = None) -> Dict:
+        """Применить одни и те же параметры к ВМ под селектором (как у массовых операций питания)"""
+        from app.services.power_service import power_service
+        selected, missing = power_service.select(names, tags, status, all_vms)
+        if not any(tuning.get(section) for section in ("cpu", "blkio_weight", "disks", "interfaces")):
+            raise ValueError("Не указано ни одного параметра")
+
+        def apply_one(vm_name: str) -> Dict:
+            try:
+                return self.apply(vm_name, tuning)
+            except Exception as e:
+                return {"success": False, "message": str(e), "vm_name": vm_name}
+
+        started = time.monotonic()
+        concurrency = max(1, min(concurrency or settings.POWER_CONCURRENCY, settings.POWER_MAX_CONCURRENCY))
+        with ThreadPoolExecutor(max_workers=min(concurrency, max(len(selected), 1)), thread_name_prefix="tune") as pool:
+            results = list(pool.map(apply_one, selected))
+
+        failed = sum(1 for result in results if not result["success"])
+        return {
+            "success": failed == 0 and not missing,
+            "total": len(results),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "missing": missing,
+            "duration": round(time.monotonic() - started, 3),
+            "results": results,
+        }
+
+
+# Глобальный экземпляр сервиса
+tuning_service = TuningService()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест API: смесь запросов, перцентили задержек и сравнение прогонов
+
+Поднимает simple_server (--production или прежний однопоточный) и/или
+FastAPI приложение в этом же процессе поверх симулятора гипервизора или
+тестового драйвера libvirt (test:///default) и нагружает их смесью
+запросов: список ВМ, карточка ВМ, действия питания, статистика хоста,
+каталог ISO. Для каждого сервера и каждой операции печатает число
+запросов, ошибки, RPS и p50/p95/p99. Результат сохраняется в JSON
+(--output); с --baseline прогон сравнивается с сохраненным, и код выхода
+1 означает регрессию сверх --max-regression.
+
+Пример:
+    python benchmarks/api_bench.py --vms 10000 --clients 32 --output bench.json
+    python benchmarks/api_bench.py --vms 10000 --baseline bench.json --max-regression 0.2
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+
+ROOT = Path(__file__).parent.parent
+
+# Добавляем корневую директорию в Python path
+sys.path.insert(0, str(ROOT))
+
+# Операция -> (метод, шаблон пути); {vm} — случайная ВМ, {running} — случайная запущенная ВМ
+OPERATIONS = {
+    "list": ("GET", "/api/vms?limit=50"),
+    "list_filtered": ("GET", "/api/vms?status=running&fields=name,status&limit=100"),
+    "get": ("GET", "/api/vms/{vm}"),
+    "action": ("POST", "/api/vms/{running}/restart"),
+    "stats": ("GET", "/api/host/stats"),
+    "iso": ("GET", "/api/iso"),
+}
+
+DEFAULT_MIX = "list=40,list_filtered=10,get=30,action=5,stats=10,iso=5"
+
+
+def parse_pairs(value: str, cast=float) -> dict:
+    """'a=1,b=2' -> {"a": 1.0, "b": 2.0}"""
+    pairs = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, number = item.partition("=")
+        pairs[name.strip()] = cast(number)
+    return pairs
+
+
+def percentile(latencies, p: float):
+    """Перцентиль по ближайшему рангу, мс (latencies отсортированы)"""
+    if not latencies:
+        return None
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def configure_backend(args):
+    """Выбрать бэкенд до импорта приложения: настройки читаются из окружения при импорте"""
+    if args.backend == "simulator":
+        os.environ["KVM_SIMULATOR"] = "1"
+        os.environ["SIMULATOR_DOMAINS"] = str(args.vms)
+    else:
+        os.environ["LIBVIRT_URI"] = "test:///default"
+
+    from app.core.config import settings
+    # Отдельная база, чтобы прогон не трогал данные разработчика
+    settings.DATABASE_URL = f"sqlite:///{args.workdir / 'api_bench.db'}"
+
+    if args.backend == "simulator":
+        from app.services.hypervisor_simulator import hypervisor_simulator
+        hypervisor_simulator.configure(latency=parse_pairs(args.latency) if args.latency else None,
+                                       failure_rate=parse_pairs(args.failure_rate) if args.failure_rate else None)
+
+
+def fetch_names(port: int):
+    """Имена всех ВМ и запущенных ВМ для подстановки в пути"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("GET", "/api/vms?fields=name,status")
+    vms = json.loads(conn.getresponse().read())
+    conn.close()
+    names = [vm["name"] for vm in vms]
+    running = [vm["name"] for vm in vms if vm.get("status") == "running"]
+    return names, running or names
+
+
+def client_loop(port: int, plan, names, running, deadline: float, warmup_until: float, seed: int, samples, lock):
+    rng = random.Random(seed)
+    operations, weights = zip(*plan)
+    local = {operation: ([], 0) for operation in operations}
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    while time.monotonic() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        method, template = OPERATIONS[operation]
+        path = template.format(vm=quote(rng.choice(names)), running=quote(rng.choice(running)))
+        started = time.perf_counter()
+        failed = False
+        try:
+            conn.request(method, path, headers={"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            body = response.read()
+            if response.status >= 400:
+                failed = True
+            elif method == "POST" and not json.loads(body).get("success", True):
+                failed = True
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+        except (OSError, http.client.HTTPException, ValueError):
+            failed = True
+            conn.close()
+        elapsed = time.perf_counter() - started
+        if time.monotonic() < warmup_until:
+            continue
+        latencies, errors = local[operation]
+        if failed:
+            local[operation] = (latencies, errors + 1)
+        else:
+            latencies.append(elapsed)
+    conn.close()
+
+    with lock:
+        for operation, (latencies, errors) in local.items():
+            samples[operation][0].extend(latencies)
+            samples[operation][1] += errors
+
+
+def run_load(port: int, plan, clients: int, duration: float, warmup: float, seed: int) -> dict:
+    names, running = fetch_names(port)
+    samples = {operation: [[], 0] for operation, _ in plan}
+    lock = threading.Lock()
+    now = time.monotonic()
+    warmup_until, deadline = now + warmup, now + warmup + duration
+    threads = [
+        threading.Thread(target=client_loop,
+                         args=(port, plan, names, running, deadline, warmup_until, seed + i, samples, lock))
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    operations = {operation: summarize(latencies, errors, duration) for operation, (latencies, errors) in samples.items()}
+    all_latencies = [latency for latencies, _ in samples.values() for latency in latencies]
+    total_errors = sum(errors for _, errors in samples.values())
+    return {"total": summarize(all_latencies, total_errors, duration), "operations": operations, "vms": len(names)}
+
+
+def start_server(name: str, port: int, workers: int):
+    # http_bench импортирует simple_server, поэтому импорт — только после выбора бэкенда
+    import http_bench
+    if name == "legacy":
+        return http_bench.start_legacy(port)
+    if name == "production":
+        return http_bench.start_production(port, workers)
+    return http_bench.start_fastapi(port)
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Регрессии относительно baseline: рост p95 или падение RPS больше threshold"""
+    regressions = []
+    for server, current in results.items():
+        previous = baseline.get("results", {}).get(server)
+        if "total" not in current or not previous or "total" not in previous:
+            continue
+        pairs = [("total", current["total"], previous["total"])]
+        pairs += [(operation, stats, previous["operations"].get(operation))
+                  for operation, stats in current["operations"].items()]
+        for operation, now, before in pairs:
+            if not before or not before.get("requests") or not now.get("requests"):
+                continue
+            if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + threshold):
+                regressions.append({"server": server, "operation": operation, "metric": "p95_ms",
+                                    "baseline": before["p95_ms"], "current": now["p95_ms"]})
+            if before["rps"] and now["rps"] < before["rps"] * (1 - threshold):
+                regressions.append({"server": server, "operation": operation, "metric": "rps",
+                                    "baseline": before["rps"], "current": now["rps"]})
+    return regressions
+
+
+def git_revision():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API с перцентилями задержек")
+    parser.add_argument("--servers", nargs="+", default=["production", "fastapi"],
+                        choices=["legacy", "production", "fastapi"])
+    parser.add_argument("--backend", choices=["simulator", "test-driver"], default="simulator",
+                        help="Симулятор гипервизора или тестовый драйвер libvirt test:///default")
+    parser.add_argument("--vms", type=int, default=1000, help="Синтетических доменов симулятора")
+    parser.add_argument("--clients", type=int, default=32, help="Параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность замера на сервер, сек")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Прогрев без учета в статистике, сек")
+    parser.add_argument("--workers", type=int, default=32, help="Потоков simple_server --production")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Веса операций ({', '.join(OPERATIONS)})")
+    parser.add_argument("--latency", default="", help="Задержки симулятора, например start=0.05,list=0.001")
+    parser.add_argument("--failure-rate", default="", help="Вероятности сбоев симулятора, например reboot=0.01")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=None, help="Сохранить результат в JSON")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.15,
+                        help="Допустимый рост p95 и падение RPS относительно baseline, доля")
+    args = parser.parse_args()
+
+    mix = parse_pairs(args.mix)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        parser.error(f"Неизвестные операции в --mix: {', '.join(sorted(unknown))}")
+    plan = [(operation, weight) for operation, weight in mix.items() if weight > 0]
+
+    args.workdir = Path(os.environ.get("TMPDIR", "/tmp")) / f"api_bench_{os.getpid()}"
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    configure_backend(args)
+
+    from app.core.lifecycle import shutdown, startup
+    import http_bench
+    startup()
+
+    results = {}
+    try:
+        for name in args.servers:
+            port = http_bench.free_port()
+            stop = start_server(name, port, args.workers)
+            if stop is None:
+                results[name] = {"skipped": "fastapi/uvicorn не установлены"}
+                continue
+            http_bench.wait_ready(port)
+            try:
+                results[name] = run_load(port, plan, args.clients, args.duration, args.warmup, args.seed)
+            finally:
+                stop()
+    finally:
+        shutdown()
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "backend": args.backend, "vms": args.vms, "clients": args.clients, "duration": args.duration,
+            "warmup": args.warmup, "workers": args.workers, "mix": dict(plan),
+            "latency": args.latency, "failure_rate": args.failure_rate, "seed": args.seed,
+        },
+        "results": results,
+    }
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config", {}).get("backend") != args.backend:
+            print("⚠️  Baseline снят на другом бэкенде, сравнение может быть некорректным", file=sys.stderr)
+        report["regressions"] = compare(results, baseline, args.max_regression)
+        report["baseline_revision"] = baseline.get("revision")
+        failed = bool(report["regressions"])
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк конвейера бэкапов на синтетических дисках
+
+Создает разреженный диск с заданной долей занятых блоков, делает полный бэкап
+выделенных экстентов, затем меняет часть блоков и делает инкрементальный бэкап
+только измененных. Проверяет восстановление цепочки и печатает пропускную
+способность и отношение размера инкремента к полному.
+
+С --nbd диск конвертируется в qcow2 и бэкапы идут по рабочему пути сервиса:
+экспорт qemu-nbd выключенной ВМ, карта экстентов qemu-img map (для
+инкремента — по persistent dirty bitmap) и чтение NBDClient. Нужны
+qemu-img, qemu-nbd и qemu-io.
+
+Пример: python benchmarks/backup_bench.py --size-mib 2048 --allocated 0.4 --dirty 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию в Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services import qemu_img
+from app.services.backup_service import BackupService, BackupWriter, Codec, restore_disk
+
+
+BLOCK = 64 * 1024  # Гранулярность dirty bitmap qcow2 по умолчанию
+
+
+def make_block(rng: random.Random, compressible: float) -> bytes:
+    """Блок с заданной долей сжимаемых данных (текст) и случайных байт"""
+    text_len = int(BLOCK * compressible)
+    text = (b"log line %d: guest filesystem data\n" % rng.randint(0, 1 << 30)) * (text_len // 40 + 1)
+    return text[:text_len] + rng.randbytes(BLOCK - text_len)
+
+
+def write_blocks(path: Path, blocks, rng, compressible):
+    with open(path, "r+b") as f:
+        for index in blocks:
+            f.seek(index * BLOCK)
+            f.write(make_block(rng, compressible))
+
+
+def to_extents(blocks):
+    """Номера блоков -> слитые экстенты (offset, length, 'data')"""
+    extents = []
+    for index in sorted(blocks):
+        offset = index * BLOCK
+        if extents and extents[-1][0] + extents[-1][1] == offset:
+            extents[-1][1] += BLOCK
+        else:
+            extents.append([offset, BLOCK])
+    return [(offset, length, "data") for offset, length in extents]
+
+
+def run_backup(disk: Path, out_dir: Path, extents, codec, workers):
+    out_dir.mkdir(parents=True)
+    fd = os.open(disk, os.O_RDONLY)
+    try:
+        writer = BackupWriter(out_dir / "vda.pack", codec, workers=workers)
+        started = time.perf_counter()
+        result = writer.write(lambda length, offset: os.pread(fd, length, offset), extents)
+        result["duration"] = time.perf_counter() - started
+    finally:
+        os.close(fd)
+    return result
+
+
+class BenchDomain:
+    """Выключенная ВМ для экспорта qemu-nbd: сервису нужно только имя"""
+
+    def name(self):
+        return "backup-bench"
+
+
+def run_nbd_backup(service: BackupService, image: Path, out_dir: Path, codec, parent_checkpoint=None):
+    """Бэкап qcow2 образа через qemu-nbd, qemu-img map и NBDClient, как у выключенной ВМ"""
+    out_dir.mkdir(parents=True)
+    disks = [{"target": "vda", "source": str(image)}]
+    started = time.perf_counter()
+    with service._offline_export(BenchDomain(), disks, parent_checkpoint, "bench") as exports:
+        result = service._backup_disk(*exports["vda"], out_dir / "vda.pack", codec)
+    result["duration"] = time.perf_counter() - started
+    return result
+
+
+def write_blocks_qemu_io(image: Path, blocks, rng):
+    """Записать блоки через qemu-io: запись идет через слой блоков qemu и отмечается в dirty bitmap"""
+    commands = []
+    for index in sorted(blocks):
+        commands += ["-c", f"write -q -P {rng.randint(1, 255)} {index * BLOCK} {BLOCK}"]
+    for start in range(0, len(commands), 2000):
+        subprocess.run(["qemu-io", "-f", "qcow2", *commands[start:start + 2000], str(image)],
+                       check=True, capture_output=True)
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкапов на синтетических дисках")
+    parser.add_argument("--size-mib", type=int, default=1024, help="Виртуальный размер диска")
+    parser.add_argument("--allocated", type=float, default=0.4, help="Доля занятых блоков")
+    parser.add_argument("--dirty", type=float, default=0.05, help="Доля блоков, измененных после полного бэкапа")
+    parser.add_argument("--compressible", type=float, default=0.5, help="Доля сжимаемых данных в блоке")
+    parser.add_argument("--codec", default="zstd", choices=["zstd", "zlib", "none"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--nbd", action="store_true",
+                        help="Бэкап qcow2 через qemu-nbd, qemu-img map и NBDClient вместо чтения файла")
+    args = parser.parse_args()
+
+    if args.nbd:
+        missing = [tool for tool in ("qemu-img", "qemu-nbd", "qemu-io") if shutil.which(tool) is None]
+        if missing:
+            parser.error(f"Для --nbd нужны {', '.join(missing)}")
+
+    rng = random.Random(args.seed)
+    codec = Codec(args.codec, 3)
+    total_blocks = args.size_mib * 1024 * 1024 // BLOCK
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        disk = tmp / "disk.raw"
+        with open(disk, "wb") as f:
+            f.truncate(total_blocks * BLOCK)
+
+        allocated = set(rng.sample(range(total_blocks), int(total_blocks * args.allocated)))
+        write_blocks(disk, allocated, rng, args.compressible)
+        full_digest = file_digest(disk)
+        dirty = set(rng.sample(range(total_blocks), int(total_blocks * args.dirty)))
+
+        if args.nbd:
+            service = BackupService()
+            service.storage = tmp
+            image = tmp / "disk.qcow2"
+            qemu_img.convert(str(disk), str(image))
+            full = run_nbd_backup(service, image, tmp / "full", codec)
+            # Checkpoint полного бэкапа: дальнейшие записи отмечаются в bitmap
+            qemu_img.run(["bitmap", "--add", str(image), "bench"])
+            write_blocks_qemu_io(image, dirty, rng)
+            incremental = run_nbd_backup(service, image, tmp / "inc", codec, parent_checkpoint="bench")
+            # Ожидаемое состояние диска после записей гостя
+            qemu_img.convert(str(image), str(disk), out_format="raw")
+        else:
+            full = run_backup(disk, tmp / "full", to_extents(allocated), codec, args.workers)
+            # Гость переписывает часть блоков (и в занятой, и в свободной области)
+            write_blocks(disk, dirty, rng, args.compressible)
+            incremental = run_backup(disk, tmp / "inc", to_extents(dirty), codec, args.workers)
+
+        # Проверка восстановления цепочки full + incremental
+        manifests = [
+            ({"id": "full", "type": "full", "compression": codec.name, "disks": {"vda": full}}, tmp / "full"),
+            ({"id": "inc", "type": "incremental", "compression": codec.name, "disks": {"vda": incremental}}, tmp / "inc"),
+        ]
+        restored = tmp / "restored.raw"
+        started = time.perf_counter()
+        with open(restored, "wb") as f:
+            f.truncate(total_blocks * BLOCK)
+            restore_disk(manifests, "vda", f, workers=args.workers)
+        restore_duration = time.perf_counter() - started
+        restore_ok = file_digest(restored) == file_digest(disk)
+
+        # Полный бэкап соответствует состоянию диска на момент первого снимка
+        with open(restored, "wb") as f:
+            f.truncate(total_blocks * BLOCK)
+            restore_disk(manifests[:1], "vda", f, workers=args.workers)
+        full_restore_ok = file_digest(restored) == full_digest
+
+    mib = 1024 * 1024
+    result = {
+        "virtual_size_mib": args.size_mib,
+        "codec": codec.name,
+        "workers": args.workers,
+        "path": "nbd" if args.nbd else "file",
+        "full": {
+            "read_mib": round(full["bytes_read"] / mib, 1),
+            "stored_mib": round(full["bytes_stored"] / mib, 1),
+            "throughput_mib_s": round(full["bytes_read"] / mib / full["duration"], 1),
+        },
+        "incremental": {
+            "read_mib": round(incremental["bytes_read"] / mib, 1),
+            "stored_mib": round(incremental["bytes_stored"] / mib, 1),
+            "throughput_mib_s": round(incremental["bytes_read"] / mib / incremental["duration"], 1),
+        },
+        "incremental_to_full_ratio": round(incremental["bytes_stored"] / max(full["bytes_stored"], 1), 4),
+        "restore_throughput_mib_s": round((full["bytes_read"] + incremental["bytes_read"]) / mib / restore_duration, 1),
+        "restore_ok": restore_ok and full_restore_ok,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not result["restore_ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
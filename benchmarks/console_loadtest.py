@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест встроенного VNC прокси против локального фейкового VNC сервера
+
+Пример: python benchmarks/console_loadtest.py --sessions 300 --stream-kb 512
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию в Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.console_service import VNCProxy
+
+
+RFB_BANNER = b"RFB 003.008\n"
+
+
+async def fake_vnc_server(stream_bytes: int):
+    """VNC-подобный сервер: баннер, поток "кадров" и эхо ввода клиента"""
+    chunk = os.urandom(16 * 1024)
+
+    async def handle(reader, writer):
+        writer.write(RFB_BANNER)
+        sent = 0
+        while sent < stream_bytes:
+            part = chunk[:min(len(chunk), stream_bytes - sent)]
+            writer.write(part)
+            sent += len(part)
+            await writer.drain()
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0, backlog=4096)
+
+
+class FakeWebSocket:
+    """Клиентская сторона WebSocket в памяти"""
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, data: bytes):
+        await self.outgoing.put(data)
+
+
+async def run_client(proxy: VNCProxy, index: int, expected_stream: int, echoes: int, latencies: list):
+    ws = FakeWebSocket()
+    relay = asyncio.ensure_future(proxy.relay(f"vm-{index}", ws.receive, ws.send, client=f"bench-{index}"))
+
+    async def recv():
+        getter = asyncio.ensure_future(ws.outgoing.get())
+        await asyncio.wait({getter, relay}, return_when=asyncio.FIRST_COMPLETED)
+        if not getter.done():
+            getter.cancel()
+            # Прокси завершился раньше времени — пробрасываем его ошибку
+            relay.result()
+            raise RuntimeError(f"Сессия {index} закрыта прокси")
+        return getter.result()
+
+    # Ждем баннер и весь поток кадров
+    received = 0
+    target = len(RFB_BANNER) + expected_stream
+    while received < target:
+        received += len(await recv())
+
+    # Эхо: измеряем задержку пересылки ввода
+    for i in range(echoes):
+        payload = f"key-{index}-{i}".encode()
+        started = time.perf_counter()
+        await ws.incoming.put(payload)
+        got = b""
+        while len(got) < len(payload):
+            got += await recv()
+        latencies.append(time.perf_counter() - started)
+
+    await ws.incoming.put(None)
+    return await relay
+
+
+async def main_async(args):
+    server = await fake_vnc_server(args.stream_kb * 1024)
+    port = server.sockets[0].getsockname()[1]
+    proxy = VNCProxy(resolver=lambda name: ("127.0.0.1", port), max_sessions=args.sessions)
+
+    latencies = []
+    started = time.perf_counter()
+    sessions = await asyncio.gather(*[
+        run_client(proxy, i, args.stream_kb * 1024, args.echoes, latencies)
+        for i in range(args.sessions)
+    ])
+    elapsed = time.perf_counter() - started
+    server.close()
+
+    total_bytes = sum(s["bytes_to_client"] + s["bytes_from_client"] for s in sessions)
+    expected_down = len(RFB_BANNER) + args.stream_kb * 1024
+    accounting_ok = all(s["bytes_to_client"] >= expected_down for s in sessions)
+    latencies.sort()
+
+    return {
+        "sessions": args.sessions,
+        "peak_concurrent_sessions": proxy.totals["peak_sessions"],
+        "elapsed_sec": round(elapsed, 3),
+        "total_mib": round(total_bytes / 1024 / 1024, 2),
+        "throughput_mib_sec": round(total_bytes / 1024 / 1024 / elapsed, 2),
+        "echo_p50_ms": round(statistics.median(latencies) * 1000, 3) if latencies else None,
+        "echo_p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3) if latencies else None,
+        "accounting_ok": accounting_ok,
+        "proxy_stats": proxy.get_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест VNC прокси")
+    parser.add_argument("--sessions", type=int, default=200, help="Число одновременных сессий")
+    parser.add_argument("--stream-kb", type=int, default=256, help="Объем кадров от сервера на сессию, КБ")
+    parser.add_argument("--echoes", type=int, default=20, help="Число эхо-запросов на сессию")
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not result["accounting_ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
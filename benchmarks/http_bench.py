@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пропускной способности HTTP серверов
+
+Сравнивает прежний однопоточный HTTPServer из simple_server.py, режим
+--production (пул потоков, HTTP/1.1 keep-alive) и FastAPI приложение под
+uvicorn (если установлены fastapi и uvicorn). Клиенты — потоки с
+постоянными соединениями http.client; медленный клиент, занявший
+однопоточный сервер, блокирует всех остальных, что и видно по p99.
+
+Пример: python benchmarks/http_bench.py --clients 32 --duration 5
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import HTTPServer
+from pathlib import Path
+
+# Добавляем корневую директорию в Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import simple_server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_legacy(port: int):
+    server = HTTPServer(("127.0.0.1", port), simple_server.KVMWebHandler)
+    # Прежний режим печатает каждую строку запроса, в замер это не входит
+    simple_server.KVMWebHandler.log_request_line = lambda self, method, path: None
+    simple_server.KVMWebHandler.log_message = lambda self, format, *args: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def start_production(port: int, workers: int):
+    server = simple_server.PooledHTTPServer(("127.0.0.1", port), simple_server.ProductionHandler, workers=workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+        server.drain(1)
+    return stop
+
+
+def start_fastapi(port: int):
+    try:
+        import uvicorn
+        import main
+    except (ImportError, SystemExit):
+        return None
+
+    config = uvicorn.Config(main.create_app(), host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+    return stop
+
+
+def wait_ready(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Сервер на порту {port} не запустился")
+
+
+def client_loop(port: int, paths, deadline: float, latencies, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    index = 0
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            errors.append("connection")
+            conn.close()
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def run_load(port: int, clients: int, duration: float, paths) -> dict:
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=client_loop, args=(port, paths, deadline, latencies, errors))
+        for _ in range(clients)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность simple_server и FastAPI")
+    parser.add_argument("--clients", type=int, default=32, help="Параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=5.0, help="Длительность каждого прогона, сек")
+    parser.add_argument("--workers", type=int, default=32, help="Потоков в режиме --production")
+    parser.add_argument("--servers", nargs="+", default=["legacy", "production", "fastapi"],
+                        choices=["legacy", "production", "fastapi"])
+    args = parser.parse_args()
+
+    paths = ["/api/vms?limit=50", "/api/vms/Ubuntu-Demo", "/api/", "/api/vms?status=running&fields=name,status"]
+    results = {}
+    for name in args.servers:
+        port = free_port()
+        if name == "legacy":
+            stop = start_legacy(port)
+        elif name == "production":
+            stop = start_production(port, args.workers)
+        else:
+            stop = start_fastapi(port)
+            if stop is None:
+                results[name] = {"skipped": "fastapi/uvicorn не установлены"}
+                continue
+
+        wait_ready(port)
+        results[name] = run_load(port, args.clients, args.duration, paths)
+        stop()
+
+    print(json.dumps({"clients": args.clients, "duration": args.duration, "results": results}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
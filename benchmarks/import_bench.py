@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта: время импорта модулей платформы
+
+Каждый модуль импортируется в новом процессе интерпретатора под
+python -X importtime. Отчет содержит медиану времени импорта, самые
+дорогие зависимости (по собственному времени) и признак того, что импорт
+не создал сервисы заранее (подключение к libvirt, каталоги данных).
+
+Пример: python benchmarks/import_bench.py --runs 5 --max-ms 300
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+DEFAULT_MODULES = [
+    "app.core.config",
+    "app.services.kvm_service",
+    "app.services.inventory_service",
+    "app.services.os_image_service",
+    "app.api.routes",
+    "simple_server",
+]
+
+# Выполняется после импорта в том же процессе: были ли созданы ленивые сервисы
+PROBE = """
+import json, sys
+from app.core.lifecycle import is_initialized
+kvm = sys.modules.get("app.services.kvm_service")
+print(json.dumps({"kvm_service_created": bool(kvm and is_initialized(kvm.kvm_service))}))
+"""
+
+
+def parse_importtime(stderr: str):
+    """Строки 'import time: self | cumulative | name' -> список (self_us, cumulative_us, name)"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((int(self_us), int(cumulative_us), name.strip()))
+    return entries
+
+
+def measure(module: str):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}\n{PROBE}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None, [], {"error": result.stderr.strip().splitlines()[-1]}
+    entries = parse_importtime(result.stderr)
+    total = next((cumulative for _, cumulative, name in entries if name == module), 0)
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return total / 1000, entries, probe
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта модулей платформы")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5, help="Запусков на модуль, берется медиана")
+    parser.add_argument("--top", type=int, default=5, help="Самых дорогих зависимостей в отчете")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Код выхода 1, если медиана импорта любого модуля больше порога")
+    args = parser.parse_args()
+
+    report = {}
+    failed = False
+    for module in args.modules:
+        timings, entries, probe = [], [], {}
+        for _ in range(args.runs):
+            elapsed, entries, probe = measure(module)
+            if elapsed is None:
+                break
+            timings.append(elapsed)
+
+        if not timings:
+            report[module] = probe
+            continue
+
+        median = statistics.median(timings)
+        heaviest = sorted(entries, reverse=True)[:args.top]
+        report[module] = {
+            "median_ms": round(median, 1),
+            "min_ms": round(min(timings), 1),
+            "modules_imported": len(entries),
+            "heaviest_self_ms": {name: round(self_us / 1000, 1) for self_us, _, name in heaviest},
+            **probe,
+        }
+        if args.max_ms is not None and median > args.max_ms:
+            failed = True
+
+    print(json.dumps({"python": sys.version.split()[0], "runs": args.runs, "modules": report},
+                     indent=2, ensure_ascii=False))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк GET /api/vms на синтетическом инвентаре
+
+Строит инвентарь из N ВМ, проверяет постраничную выдачу против полного
+перебора и печатает среднее время запроса страницы для типовых фильтров.
+
+Пример: python benchmarks/inventory_bench.py --vms 10000 --limit 50
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию в Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.inventory_service import VMInventory, SORT_FIELDS, vm_tags
+
+
+TAGS = ["web", "db", "prod", "dev", "gpu"]
+
+QUERIES = [
+    {},
+    {"status": "running"},
+    {"prefix": "vm-a"},
+    {"tags": ["gpu"]},
+    {"tags": ["web", "prod"], "sort": "-memory"},
+    {"status": "stopped", "prefix": "vm-c", "sort": "vcpus"},
+    {"sort": "-created"},
+]
+
+
+def make_vms(count: int, rng: random.Random):
+    vms = []
+    for i in range(count):
+        tags = rng.sample(TAGS[:4], rng.randint(0, 2))
+        if i % 100 == 0:
+            tags.append("gpu")  # Редкий тег
+        vms.append({
+            "name": f"vm-{rng.choice('abcde')}{i:06d}",
+            "status": rng.choice(["running", "running", "stopped", "paused"]),
+            "memory": rng.choice([512, 1024, 2048, 4096]) * 1024,
+            "vcpus": rng.randint(1, 16),
+            "metadata": {"tags": tags, "created_at": f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}"},
+        })
+    return vms
+
+
+def brute_force(vms, status=None, prefix=None, tags=None, sort="name"):
+    extract = SORT_FIELDS[sort.lstrip("-")]
+    result = [
+        vm for vm in vms
+        if (not status or vm["status"] == status)
+        and (not prefix or vm["name"].startswith(prefix))
+        and all(tag in vm_tags(vm) for tag in tags or [])
+    ]
+    result.sort(key=lambda vm: (extract(vm), vm["name"]), reverse=sort.startswith("-"))
+    return [vm["name"] for vm in result]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк фильтрации и пагинации инвентаря ВМ")
+    parser.add_argument("--vms", type=int, default=10000, help="Число ВМ в инвентаре")
+    parser.add_argument("--limit", type=int, default=50, help="Размер страницы")
+    parser.add_argument("--iterations", type=int, default=1000, help="Запросов на сценарий")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    vms = make_vms(args.vms, random.Random(args.seed))
+    inventory = VMInventory(source=lambda: vms, ttl=float("inf"))
+
+    started = time.perf_counter()
+    inventory.snapshot()
+    build_ms = (time.perf_counter() - started) * 1000
+
+    results = []
+    for query in QUERIES:
+        # Полный обход курсором должен совпасть с перебором
+        expected = brute_force(vms, **query)
+        names, cursor = [], None
+        while True:
+            page = inventory.query(limit=args.limit * 10, cursor=cursor, **query)
+            names += [vm["name"] for vm in page["items"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            page = inventory.query(limit=args.limit, fields=["name", "status"], **query)
+        elapsed = (time.perf_counter() - started) / args.iterations
+
+        results.append({
+            "query": query,
+            "matched": page["total"],
+            "page_us": round(elapsed * 1e6, 1),
+            "ok": names == expected and page["total"] == len(expected),
+        })
+
+    report = {
+        "vms": args.vms,
+        "limit": args.limit,
+        "index_build_ms": round(build_ms, 1),
+        "queries": results,
+        "all_ok": all(r["ok"] for r in results),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if not report["all_ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сериализации и сжатия списка ВМ
+
+Сравнивает прежний json.dumps(indent=2), компактный json и orjson, а также
+размер ответа без сжатия, с gzip и brotli (если установлен) для 1k и 10k ВМ.
+
+Пример: python benchmarks/serialization_bench.py --sizes 1000 10000
+"""
+
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию в Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core import serialization
+from app.core.config import settings
+
+
+def make_vms(count: int, rng: random.Random):
+    return [
+        {
+            "id": i if i % 3 else None,
+            "name": f"vm-{i:06d}",
+            "status": rng.choice(["running", "stopped"]),
+            "memory": rng.choice([1, 2, 4, 8]) * 1024 * 1024,
+            "vcpus": rng.randint(1, 16),
+            "cpu_time": rng.randint(0, 10 ** 13),
+            "state": rng.randint(1, 5),
+            "metadata": {
+                "name": f"vm-{i:06d}",
+                "uuid": "%032x" % rng.getrandbits(128),
+                "os": rng.choice(["Ubuntu 22.04", "Debian 12", "CentOS Stream 9", "Windows Server 2022"]),
+                "iso_path": None,
+                "owner": rng.choice(["ops", "dev", "ml", None]),
+                "tags": rng.sample(["web", "db", "prod", "dev"], 2),
+                "created_at": f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}T12:00:00",
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def timed(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return (time.perf_counter() - started) / iterations * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк JSON кодировщика и сжатия ответов")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Число ВМ в списке")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    report = {
+        "orjson": serialization.ORJSON_AVAILABLE,
+        "brotli": serialization.BROTLI_AVAILABLE,
+        "gzip_level": settings.GZIP_LEVEL,
+        "results": [],
+    }
+
+    for size in args.sizes:
+        vms = make_vms(size, random.Random(args.seed))
+        encoders = {
+            "json_indent": lambda: json.dumps(vms, ensure_ascii=False, indent=2).encode("utf-8"),
+            "json_compact": lambda: json.dumps(vms, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+            "api_encoder": lambda: serialization.dumps(vms),
+        }
+
+        encode = {}
+        for name, func in encoders.items():
+            ms, body = timed(func, args.iterations)
+            encode[name] = {"ms": round(ms, 2), "bytes": len(body)}
+
+        body = serialization.dumps(vms)
+        compression = {"identity": {"bytes": len(body), "ms": 0.0}}
+        for encoding in ["gzip"] + (["br"] if serialization.BROTLI_AVAILABLE else []):
+            ms, compressed = timed(lambda: serialization.compress(body, encoding), max(1, args.iterations // 4))
+            compression[encoding] = {"bytes": len(compressed), "ms": round(ms, 2), "ratio": round(len(body) / len(compressed), 1)}
+        assert json.loads(gzip.decompress(serialization.compress(body, "gzip"))) == json.loads(body)
+
+        # Повторная отдача закэшированного ответа: сериализация и сжатие уже сделаны
+        payload = serialization.PreEncoded(vms)
+        serialization.encode_response(payload, "gzip, br")
+        cached_ms, _ = timed(lambda: serialization.encode_response(payload, "gzip, br"), args.iterations * 50)
+
+        report["results"].append({
+            "vms": size,
+            "encode": encode,
+            "compression": compression,
+            "cached_response_ms": round(cached_ms, 4),
+            "speedup_vs_indent": round(encode["json_indent"]["ms"] / encode["api_encoder"]["ms"], 1),
+            "size_reduction_vs_indent": round(
+                encode["json_indent"]["bytes"] / min(c["bytes"] for c in compression.values()), 1
+            ),
+        })
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
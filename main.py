@@ -5,6 +5,8 @@ KVM Web Platform - Главный файл запуска
 
 import sys
 import os
+import time
+import argparse
 from pathlib import Path
 
 # Добавляем корневую директорию в Python path
@@ -15,7 +17,7 @@ try:
     from fastapi import FastAPI
     from fastapi.middleware.cors import CORSMiddleware
     from fastapi.staticfiles import StaticFiles
-    from fastapi.responses import HTMLResponse, FileResponse
+    from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
     FASTAPI_AVAILABLE = True
 except ImportError:
     print("❌ FastAPI не установлен. Запустите: pip install fastapi uvicorn")
@@ -23,16 +25,32 @@ except ImportError:
     sys.exit(1)
 
 from app.core.config import settings
+from app.core.lifecycle import shutdown, startup
+from app.core.serialization import CompressionMiddleware, FastJSONResponse
+from app.core.timing import TimingMiddleware
 
 
 def create_app() -> FastAPI:
     """Создание FastAPI приложения"""
+    if settings.PROCESS_ROLE == "worker":
+        # До импорта маршрутов: они должны получить заместители сервисов коллектора
+        from app.services.collector import install_worker_proxies
+        install_worker_proxies()
+
     app = FastAPI(
         title="KVM Web Platform",
         description="Веб-платформа для управления KVM виртуальными машинами",
-        version="1.0.0"
+        version="1.0.0",
+        default_response_class=FastJSONResponse
     )
 
+    # Каталоги данных, подключение к libvirt и т.п. — при запуске, а не при импорте модулей
+    app.add_event_handler("startup", startup)
+    app.add_event_handler("shutdown", shutdown)
+
+    # Сжатие gzip/brotli ответов крупнее COMPRESSION_MIN_SIZE
+    app.add_middleware(CompressionMiddleware)
+
     # CORS configuration
     app.add_middleware(
         CORSMiddleware,
@@ -40,10 +58,18 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag", "X-Next-Cursor", "X-Total-Count", "Server-Timing"],
     )
 
+    # Время запросов по маршрутам и Server-Timing: внешний слой, чтобы учесть сериализацию и сжатие
+    app.add_middleware(TimingMiddleware)
+
     # Static files (для фронтенда)
     app.mount("/static", StaticFiles(directory="static"), name="static")
+
+    # noVNC клиент для браузерных консолей
+    if Path(settings.NOVNC_PATH).is_dir():
+        app.mount(settings.NOVNC_URL, StaticFiles(directory=settings.NOVNC_PATH), name="novnc")
     
     # Подключение API роутов
     try:
@@ -52,6 +78,13 @@ def create_app() -> FastAPI:
     except ImportError as e:
         print(f"⚠️  API роуты не загружены: {e}")
 
+    # WebSocket роуты консолей
+    try:
+        from app.api.console import router as console_router
+        app.include_router(console_router)
+    except ImportError as e:
+        print(f"⚠️  Роуты консолей не загружены: {e}")
+
     @app.get("/")
     async def root():
         """Главная страница"""
@@ -62,16 +95,78 @@ def create_app() -> FastAPI:
         except FileNotFoundError:
             return {"message": "KVM Web Platform API", "version": "1.0.0"}
 
+    # libvirt недоступен (автомат разомкнут): 503 с подсказкой, когда повторить
+    from app.services.libvirt_pool import LibvirtUnavailable
+
+    @app.exception_handler(LibvirtUnavailable)
+    async def libvirt_unavailable(request, exc):
+        return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
     @app.get("/health")
     async def health():
-        """Проверка здоровья сервиса"""
-        return {"status": "ok", "platform": "KVM Web Platform"}
+        """Проверка здоровья сервиса (degraded — libvirt недоступен, данные могут быть устаревшими)"""
+        from app.services.kvm_service import kvm_service
+        libvirt_status = kvm_service.get_status()
+        return {
+            "status": "degraded" if libvirt_status["state"] == "degraded" else "ok",
+            "platform": "KVM Web Platform",
+            "libvirt": libvirt_status
+        }
 
     return app
 
 
+def run_workers(workers: int):
+    """Коллектор в отдельном процессе и несколько воркеров uvicorn без собственного подключения к libvirt"""
+    import multiprocessing
+    import secrets
+    from app.services.collector import run_collector
+
+    authkey = secrets.token_hex(16)
+    collector = multiprocessing.Process(
+        target=run_collector,
+        args=(settings.COLLECTOR_SOCKET, authkey.encode()),
+        name="kvm-collector",
+        daemon=True
+    )
+    collector.start()
+
+    # Воркеры uvicorn запускаются через spawn и читают роль и адрес коллектора из окружения
+    os.environ.update(
+        KVM_PLATFORM_ROLE="worker",
+        COLLECTOR_SOCKET=settings.COLLECTOR_SOCKET,
+        COLLECTOR_AUTHKEY=authkey,
+    )
+
+    deadline = time.monotonic() + 30
+    while not os.path.exists(settings.COLLECTOR_SOCKET):
+        if not collector.is_alive() or time.monotonic() > deadline:
+            print("❌ Коллектор не запустился")
+            sys.exit(1)
+        time.sleep(0.1)
+
+    print(f"👷 Воркеров API: {workers}, коллектор: PID {collector.pid}")
+    try:
+        # reload несовместим с несколькими воркерами
+        uvicorn.run(
+            "main:create_app",
+            host=settings.HOST,
+            port=settings.PORT,
+            workers=workers,
+            factory=True
+        )
+    finally:
+        collector.terminate()
+        collector.join(timeout=5)
+
+
 def main():
     """Главная функция запуска"""
+    parser = argparse.ArgumentParser(description="KVM Web Platform")
+    parser.add_argument("--workers", type=int, default=settings.WORKERS,
+                        help="Процессов API; при N > 1 libvirt опрашивает один процесс-коллектор")
+    args = parser.parse_args()
+
     print("🚀 Запуск KVM Web Platform...")
     print(f"🖥️  Платформа: {os.uname().sysname} {os.uname().machine}")
     
@@ -79,8 +174,10 @@ def main():
     print("📁 Статические файлы:", Path("static").absolute())
     print("💾 Данные:", settings.DATA_DIR)
     
+    if args.workers > 1:
+        run_workers(args.workers)
     # Запуск сервера с import string для поддержки reload
-    if settings.DEBUG:
+    elif settings.DEBUG:
         uvicorn.run(
             "main:create_app",  # Import string instead of app object
             host=settings.HOST,
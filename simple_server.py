@@ -5,19 +5,74 @@
 """
 
 import sys
-import json
 import os
+import re
+import signal
+import socket
+import logging
+import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, SimpleHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, unquote
 import threading
+import time
 import webbrowser
 
 # Добавляем путь к приложению
 sys.path.insert(0, str(Path(__file__).parent))
 
 from app.services.kvm_service import kvm_service
+from app.services.libvirt_pool import LibvirtUnavailable
+from app.services.console_service import render_vnc_viewer
 from app.core.config import settings
+from app.core.lifecycle import shutdown, startup
+from app.core.serialization import encode_response
+from app.core.timing import begin_request, current_request, end_request, timing_stats
+
+
+logger = logging.getLogger("simple_server")
+
+
+class Router:
+    """Таблица маршрутов: точные пути — словарь, пути с параметрами — заранее скомпилированные regex"""
+
+    def __init__(self):
+        self.exact = {}
+        self.patterns = {}
+
+    def add(self, method, pattern, handler):
+        if "{" not in pattern:
+            self.exact[(method, pattern)] = handler
+            return
+        # /api/vms/{vm_name}/start -> ^/api/vms/(?P<vm_name>[^/]+)/start$
+        regex = re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", pattern)
+        self.patterns.setdefault(method, []).append((re.compile(f"^{regex}$"), handler))
+
+    def match(self, method, path):
+        """Обработчик и параметры пути или (None, None)"""
+        handler = self.exact.get((method, path))
+        if handler is not None:
+            return handler, {}
+        for regex, handler in self.patterns.get(method, ()):
+            found = regex.match(path)
+            if found:
+                return handler, {name: unquote(value) for name, value in found.groupdict().items()}
+        return None, None
+
+
+router = Router()
+
+# Тело запроса больше этого не вычитывается: соединение закрывается после ответа
+MAX_DISCARD_BODY = 1024 * 1024
+
+
+def route(method, pattern):
+    """Декоратор регистрации метода обработчика в таблице маршрутов"""
+    def decorator(func):
+        router.add(method, pattern, func)
+        return func
+    return decorator
 
 
 class KVMWebHandler(SimpleHTTPRequestHandler):
@@ -26,148 +81,221 @@ class KVMWebHandler(SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory="static", **kwargs)
     
-    def do_GET(self):
-        """Обработка GET запросов"""
+    def log_request_line(self, method, path):
+        print(f"📨 {method} {path}")
+
+    def discard_body(self):
+        """Вычитать тело запроса: обработчики его не читают, а на keep-alive соединении
+        непрочитанные байты разбирались бы как начало следующего запроса"""
+        length = self.headers.get('Content-Length')
+        if self.headers.get('Transfer-Encoding') or (length is not None and not length.strip().isdigit()):
+            # chunked или некорректная длина: границу тела не знаем — закрываем соединение после ответа
+            self.close_connection = True
+            return
+        remaining = int(length or 0)
+        if remaining > MAX_DISCARD_BODY:
+            self.close_connection = True
+            return
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 64 * 1024))
+            if not chunk:
+                self.close_connection = True
+                return
+            remaining -= len(chunk)
+
+    def dispatch(self, method):
+        """Найти обработчик в таблице маршрутов и вызвать его"""
         parsed_url = urlparse(self.path)
         path = parsed_url.path
-        
-        print(f"📨 GET {path}")
-        
-        # API endpoints
-        if path.startswith('/api/'):
-            self.handle_api_get(path)
-        elif path == '/':
-            # Главная страница
-            self.serve_index()
-        else:
-            # Статические файлы
-            super().do_GET()
-    
+        self.log_request_line(method, path)
+        self.discard_body()
+
+        handler, params = router.match(method, path)
+        if handler is None:
+            if method == 'GET' and not path.startswith('/api/'):
+                # Статические файлы
+                super().do_GET()
+            else:
+                self.send_error(404, "API endpoint not found")
+            return
+
+        token = begin_request() if settings.TIMING_ENABLED else None
+        self.response_status = 200
+        try:
+            handler(self, parse_qs(parsed_url.query), **params)
+        except LibvirtUnavailable as e:
+            self.send_error(503, "libvirt unavailable", str(e))
+        except Exception as e:
+            self.log_error("%s %s: %s", method, path, e)
+            self.send_error(500, "Internal error", str(e))
+        finally:
+            if token is not None:
+                timings = current_request()
+                end_request(token)
+                # Имя обработчика вместо пути: иначе отдельный маршрут на каждую ВМ
+                timing_stats.record_route(f"{method} {handler.__name__}", time.perf_counter() - timings.started,
+                                          self.response_status)
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+
+    def do_GET(self):
+        """Обработка GET запросов"""
+        self.dispatch('GET')
+
     def do_POST(self):
         """Обработка POST запросов"""
-        parsed_url = urlparse(self.path)
-        path = parsed_url.path
-        
-        print(f"📨 POST {path}")
-        
-        if path.startswith('/api/'):
-            self.handle_api_post(path)
-        else:
-            self.send_error(404, "Endpoint not found")
-    
+        self.dispatch('POST')
+
     def do_DELETE(self):
         """Обработка DELETE запросов"""
-        parsed_url = urlparse(self.path)
-        path = parsed_url.path
-        
-        print(f"📨 DELETE {path}")
-        
-        if path.startswith('/api/'):
-            self.handle_api_delete(path)
+        self.dispatch('DELETE')
+
+    @route('GET', '/')
+    def api_index(self, query):
+        """Главная страница"""
+        self.serve_index()
+
+    @route('GET', '/api/vms/{vm_name}/console/viewer')
+    def api_console_viewer(self, query, vm_name):
+        """VNC консоль"""
+        self.send_html_response(self.get_console_html(vm_name))
+
+    @route('GET', '/api/vms/{vm_name}')
+    def api_get_vm(self, query, vm_name):
+        """Информация о конкретной ВМ"""
+        vm = kvm_service.get_vm_info(vm_name)
+        if vm:
+            self.send_json_response(vm)
         else:
-            self.send_error(404, "Endpoint not found")
-    
-    def handle_api_get(self, path):
-        """Обработка GET API запросов"""
+            self.send_error(404, "VM not found")
+
+    @route('GET', '/api/host/stats')
+    def api_host_stats(self, query):
+        """Статистика хоста"""
+        self.send_json_response(self.get_host_stats())
+
+    @route('GET', '/api/iso')
+    def api_list_iso(self, query):
+        """Каталог ОС и локальные ISO образы (как GET /api/iso в FastAPI)"""
+        from app.services.os_image_service import get_available_os_images, get_local_iso_files
+        os_catalog = get_available_os_images()
+        local_isos = get_local_iso_files()
+        self.send_json_response({
+            "os_catalog": os_catalog,
+            "local_files": local_isos,
+            "total": len(os_catalog) + len(local_isos)
+        })
+
+    @route('GET', '/api/')
+    def api_info(self, query):
+        """API информация"""
+        self.send_json_response({
+            "name": "KVM Web Platform API",
+            "version": "1.0.0",
+            "demo_mode": kvm_service.demo_mode,
+            "libvirt": kvm_service.get_status(),
+            "endpoints": {
+                "vms": "/api/vms",
+                "host_stats": "/api/host/stats"
+            }
+        })
+
+    @route('POST', '/api/vms/{vm_name}/start')
+    def api_start_vm(self, query, vm_name):
+        from app.services.boot_scheduler import boot_scheduler
         try:
-            if path == '/api/vms':
-                # Список ВМ
-                vms = kvm_service.get_all_vms()
-                self.send_json_response(vms)
-            
-            elif path.startswith('/api/vms/') and path.endswith('/console/viewer'):
-                # VNC консоль
-                vm_name = path.split('/')[3]
-                html_content = self.get_console_html(vm_name)
-                self.send_html_response(html_content)
-            
-            elif path.startswith('/api/vms/') and not '/' in path[10:]:
-                # Информация о конкретной ВМ
-                vm_name = path.split('/')[3]
-                vm = kvm_service.get_vm_info(vm_name)
-                if vm:
-                    self.send_json_response(vm)
-                else:
-                    self.send_error(404, "VM not found")
-            
-            elif path == '/api/host/stats':
-                # Статистика хоста
-                stats = self.get_host_stats()
-                self.send_json_response(stats)
-            
-            elif path == '/api/':
-                # API информация
-                info = {
-                    "name": "KVM Web Platform API",
-                    "version": "1.0.0",
-                    "demo_mode": kvm_service.demo_mode,
-                    "endpoints": {
-                        "vms": "/api/vms",
-                        "host_stats": "/api/host/stats"
-                    }
-                }
-                self.send_json_response(info)
-            
-            else:
-                self.send_error(404, "API endpoint not found")
-                
-        except Exception as e:
-            self.send_error(500, str(e))
-    
-    def handle_api_post(self, path):
-        """Обработка POST API запросов"""
+            result = boot_scheduler.start(vm_name, query.get('priority', ['normal'])[0],
+                                           timeout=settings.BOOT_WAIT_TIMEOUT)
+        except ValueError as e:
+            result = {"success": False, "message": str(e)}
+        self.send_json_response(result)
+
+    @route('POST', '/api/vms/{vm_name}/stop')
+    def api_stop_vm(self, query, vm_name):
+        self.send_json_response(kvm_service.stop_vm(vm_name))
+
+    @route('POST', '/api/vms/{vm_name}/restart')
+    def api_restart_vm(self, query, vm_name):
+        self.send_json_response(kvm_service.restart_vm(vm_name))
+
+    @route('DELETE', '/api/vms/{vm_name}')
+    def api_delete_vm(self, query, vm_name):
+        self.send_json_response(kvm_service.delete_vm(vm_name))
+
+    @route('GET', '/api/vms')
+    def send_vm_page(self, query):
+        """Страница списка ВМ; X-Next-Cursor и X-Total-Count в заголовках, 304 по ETag"""
+        from app.services.inventory_service import vm_inventory, make_etag, etag_matches
+
+        etag = make_etag(vm_inventory.snapshot().generation)
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        def param(name):
+            values = query.get(name)
+            return values[0] if values else None
+
         try:
-            if '/start' in path:
-                vm_name = path.split('/')[3]
-                result = kvm_service.start_vm(vm_name)
-                self.send_json_response(result)
-            
-            elif '/stop' in path:
-                vm_name = path.split('/')[3]
-                result = kvm_service.stop_vm(vm_name)
-                self.send_json_response(result)
-            
-            elif '/restart' in path:
-                vm_name = path.split('/')[3]
-                result = kvm_service.restart_vm(vm_name)
-                self.send_json_response(result)
-            
-            else:
-                self.send_error(404, "API endpoint not found")
-                
-        except Exception as e:
-            self.send_error(500, str(e))
-    
-    def handle_api_delete(self, path):
-        """Обработка DELETE API запросов"""
+            payload = vm_inventory.encoded_page(
+                limit=int(param('limit')) if param('limit') else None,
+                cursor=param('cursor'),
+                status=param('status'),
+                prefix=param('prefix'),
+                tags=param('tags').split(',') if param('tags') else None,
+                sort=param('sort') or 'name',
+                fields=param('fields').split(',') if param('fields') else None
+            )
+        except ValueError as e:
+            # Текст ошибки в теле: строка статуса допускает только latin-1
+            self.send_error(400, "Invalid query", str(e))
+            return
+
+        self.send_json_response(payload)
+
+    @route('GET', '/api/vms/changes')
+    def send_vm_changes(self, query):
+        """Изменения инвентаря после поколения since"""
+        from app.services.inventory_service import vm_inventory
+
         try:
-            if path.startswith('/api/vms/'):
-                vm_name = path.split('/')[3]
-                result = kvm_service.delete_vm(vm_name)
-                self.send_json_response(result)
-            else:
-                self.send_error(404, "API endpoint not found")
-                
-        except Exception as e:
-            self.send_error(500, str(e))
-    
-    def send_json_response(self, data):
-        """Отправка JSON ответа"""
-        json_data = json.dumps(data, ensure_ascii=False, indent=2)
+            since = int(query.get('since', ['0'])[0])
+        except ValueError:
+            self.send_error(400, "Invalid query", "since должен быть целым числом")
+            return
+        fields = query.get('fields', [''])[0]
+        self.send_json_response(vm_inventory.changes(since, fields=fields.split(',') if fields else None))
+
+    def send_json_response(self, data, headers=None):
+        """Отправка JSON ответа (orjson при наличии, gzip/brotli для крупных ответов)"""
+        body, json_headers = encode_response(data, self.headers.get('Accept-Encoding'))
+        json_headers.update(headers or {})
+        timings = current_request()
+        if timings is not None:
+            json_headers['Server-Timing'] = timings.header()
         self.send_response(200)
-        self.send_header('Content-type', 'application/json; charset=utf-8')
+        for name, value in json_headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, X-Next-Cursor, X-Total-Count, Server-Timing')
         self.end_headers()
-        self.wfile.write(json_data.encode('utf-8'))
+        self.wfile.write(body)
     
     def send_html_response(self, html):
         """Отправка HTML ответа"""
+        body = html.encode('utf-8')
         self.send_response(200)
         self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
+        self.wfile.write(body)
     
     def serve_index(self):
         """Отправка главной страницы"""
@@ -189,61 +317,21 @@ class KVMWebHandler(SimpleHTTPRequestHandler):
             self.send_html_response(error_html)
     
     def get_console_html(self, vm_name):
-        """Генерация HTML для консоли ВМ"""
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Console - {vm_name}</title>
-            <meta charset="utf-8">
-            <style>
-                body {{ 
-                    margin: 0; 
-                    padding: 20px; 
-                    background: #2c3e50; 
-                    color: white;
-                    font-family: 'Courier New', monospace;
-                }}
-                .console {{ 
-                    background: black; 
-                    padding: 20px; 
-                    border-radius: 5px;
-                    border: 2px solid #34495e;
-                    min-height: 400px;
-                }}
-                .status {{
-                    background: #34495e;
-                    padding: 10px;
-                    border-radius: 5px;
-                    margin-bottom: 20px;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="status">
-                <h2>🖥️ Консоль ВМ: {vm_name}</h2>
-                <p>📺 Демо-консоль для виртуальной машины</p>
-            </div>
-            
-            <div class="console">
-                <p style="color: #2ecc71;">KVM Web Platform - Демо консоль</p>
-                <p style="color: #3498db;">Подключение к виртуальной машине: {vm_name}</p>
-                <p style="color: #e74c3c;">⚠️  В реальном режиме здесь будет VNC подключение</p>
-                <br>
-                <p style="color: #f39c12;">Ubuntu 22.04.3 LTS {vm_name} tty1</p>
-                <br>
-                <p style="color: #2ecc71;">{vm_name} login: <span style="animation: blink 1s infinite;">_</span></p>
-            </div>
-            
-            <style>
-                @keyframes blink {{
-                    0%, 50% {{ opacity: 1; }}
-                    51%, 100% {{ opacity: 0; }}
-                }}
-            </style>
-        </body>
-        </html>
-        """
+        """Генерация HTML для консоли ВМ (noVNC)"""
+        # WebSocket прокси работает во встроенном asyncio сервере основного приложения
+        host = (self.headers.get('Host') or 'localhost').rsplit(':', 1)[0]
+        ws_base = settings.CONSOLE_WS_BASE or f"ws://{host}:{settings.PORT}"
+        return render_vnc_viewer(vm_name, ws_base=ws_base)
+
+    def translate_path(self, path):
+        """Отдача файлов noVNC из системного каталога"""
+        novnc_prefix = settings.NOVNC_URL + '/'
+        if path.startswith(novnc_prefix):
+            relative = urlparse(path).path[len(novnc_prefix):]
+            target = (Path(settings.NOVNC_PATH) / relative).resolve()
+            if target.is_relative_to(Path(settings.NOVNC_PATH).resolve()):
+                return str(target)
+        return super().translate_path(path)
     
     def get_host_stats(self):
         """Получение статистики хоста"""
@@ -252,7 +340,8 @@ class KVMWebHandler(SimpleHTTPRequestHandler):
             from datetime import datetime
             
             return {
-                "cpu_percent": psutil.cpu_percent(interval=1),
+                # Без interval: загрузка с прошлого вызова, не блокируя поток на секунду
+                "cpu_percent": psutil.cpu_percent(interval=None),
                 "memory": dict(psutil.virtual_memory()._asdict()),
                 "disk": dict(psutil.disk_usage('/')._asdict()),
                 "network": dict(psutil.net_io_counters()._asdict()),
@@ -278,26 +367,201 @@ class KVMWebHandler(SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
 
+class ProductionHandler(KVMWebHandler):
+    """Обработчик для пула потоков: HTTP/1.1 keep-alive, таймауты, журнал через logging"""
+
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят отдельными write(): без TCP_NODELAY keep-alive упирается в delayed ACK (~40 мс)
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.track(self.connection, busy=False)
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            self.server.untrack(self.connection)
+
+    def handle_one_request(self):
+        # Между запросами соединение ждет не дольше keep-alive таймаута
+        self.connection.settimeout(settings.SERVER_KEEPALIVE_TIMEOUT)
+        super().handle_one_request()
+        self.server.track(self.connection, busy=False)
+
+    def parse_request(self):
+        self.server.track(self.connection, busy=True)
+        self.connection.settimeout(settings.SERVER_REQUEST_TIMEOUT)
+        return super().parse_request()
+
+    def end_headers(self):
+        # Освобождаем поток, если новые соединения ждут в очереди или идет остановка
+        if not self.close_connection and (self.server.draining or self.server.pending > 0):
+            self.send_header('Connection', 'close')
+        super().end_headers()
+
+    def log_request_line(self, method, path):
+        pass
+
+    def log_message(self, format, *args):
+        if settings.SERVER_ACCESS_LOG:
+            logger.info("%s %s", self.address_string(), format % args)
+
+    def log_error(self, format, *args):
+        logger.warning("%s %s", self.address_string(), format % args)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP сервер с ограниченным пулом потоков и плавной остановкой
+
+    Соединения сверх workers + queue_size сразу получают 503, а не копятся
+    в памяти. При остановке новые соединения не принимаются, простаивающие
+    keep-alive закрываются, активные запросы дорабатывают до drain_timeout.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, handler, workers=None, queue_size=None):
+        super().__init__(address, handler)
+        self.workers = workers or settings.SERVER_WORKERS
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="http")
+        self.slots = threading.BoundedSemaphore(self.workers + (queue_size or settings.SERVER_QUEUE_SIZE))
+        self.draining = False
+        self.pending = 0
+        self.stats = {"accepted": 0, "rejected": 0}
+        self._connections = {}
+        self._lock = threading.Condition()
+
+    def process_request(self, request, client_address):
+        if self.draining or not self.slots.acquire(blocking=False):
+            self.stats["rejected"] += 1
+            self._reject(request)
+            return
+        self.stats["accepted"] += 1
+        with self._lock:
+            self.pending += 1
+        self.executor.submit(self._process, request, client_address)
+
+    def _reject(self, request):
+        try:
+            request.sendall(
+                b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n"
+                b"Retry-After: 1\r\nConnection: close\r\n\r\n"
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _process(self, request, client_address):
+        with self._lock:
+            self.pending -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def track(self, connection, busy):
+        with self._lock:
+            self._connections[connection] = busy
+
+    def untrack(self, connection):
+        with self._lock:
+            self._connections.pop(connection, None)
+            self._lock.notify_all()
+
+    def handle_error(self, request, client_address):
+        logger.exception("Ошибка обработки соединения %s", client_address)
+
+    def drain(self, timeout=None):
+        """Дождаться завершения активных запросов (вызывать после shutdown())"""
+        timeout = settings.SERVER_DRAIN_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self.draining = True
+            # Простаивающие keep-alive соединения: закрываем чтение, поток обработчика выйдет сам
+            for connection, busy in list(self._connections.items()):
+                if not busy:
+                    try:
+                        connection.shutdown(socket.SHUT_RD)
+                    except OSError:
+                        pass
+            while self._connections and time.monotonic() < deadline:
+                self._lock.wait(deadline - time.monotonic())
+            remaining = len(self._connections)
+        self.executor.shutdown(wait=False)
+        return remaining
+
+
+def run_production(host, port, workers=None):
+    """Производственный режим: пул потоков, keep-alive, журнал в logging, SIGTERM с плавной остановкой"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = PooledHTTPServer((host, port), ProductionHandler, workers=workers)
+
+    # Первый вызов cpu_percent(None) задает точку отсчета для последующих
+    try:
+        import psutil
+        psutil.cpu_percent(interval=None)
+    except ImportError:
+        pass
+
+    def stop(signum, frame):
+        # shutdown() ждет выхода из serve_forever, поэтому из отдельного потока
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Сервер запущен на http://%s:%s (потоков: %s)", host, port, server.workers)
+    server.serve_forever()
+
+    logger.info("Остановка: ожидание активных запросов до %s с", settings.SERVER_DRAIN_TIMEOUT)
+    server.server_close()
+    remaining = server.drain()
+    if remaining:
+        logger.warning("Прервано незавершенных соединений: %s", remaining)
+    shutdown()
+    logger.info("Сервер остановлен")
+
+
 def main():
     """Главная функция запуска"""
+    parser = argparse.ArgumentParser(description="KVM Web Platform без внешних зависимостей")
+    parser.add_argument("--production", action="store_true",
+                        help="Пул потоков, HTTP/1.1 keep-alive и плавная остановка вместо однопоточного режима")
+    parser.add_argument("--host", default=None, help="Адрес (по умолчанию localhost, в production — HOST из настроек)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="Потоков обработки (production)")
+    args = parser.parse_args()
+
+    startup()
+    if args.production:
+        run_production(args.host or settings.HOST, args.port, workers=args.workers)
+        return
+
     print("🚀 Запуск KVM Web Platform (простой HTTP сервер)")
     print(f"🖥️  Платформа: {os.uname().sysname} {os.uname().machine}")
     print(f"🎭 Демо-режим: {kvm_service.demo_mode}")
     print(f"📁 Данные: {settings.DATA_DIR}")
     
     # Порт и хост
-    host = "localhost"
-    port = 8000
+    host = args.host or "localhost"
+    port = args.port
     
     # Создаем сервер
     server = HTTPServer((host, port), KVMWebHandler)
     
     print(f"\n🌐 Сервер запущен на http://{host}:{port}")
-    print("📖 API доступно по адресу: http://localhost:8000/api/")
-    print("🔧 Управление ВМ: http://localhost:8000/")
+    print(f"📖 API доступно по адресу: http://{host}:{port}/api/")
+    print(f"🔧 Управление ВМ: http://{host}:{port}/")
     
     # Открываем браузер через 2 секунды
     def open_browser():
@@ -317,6 +581,7 @@ def main():
     except KeyboardInterrupt:
         print("\n🛑 Остановка сервера...")
         server.shutdown()
+        shutdown()
         print("✅ Сервер остановлен")
 
 